@@ -20,6 +20,7 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
 )
+from helpers.rest_client import RestClient
 from helpers.stomp_client import StompClient
 from helpers.utilities import make_api_call
 from iotics.lib.identity.api.high_level_api import (
@@ -27,7 +28,6 @@ from iotics.lib.identity.api.high_level_api import (
     RegisteredIdentity,
     get_rest_high_level_identity_api,
 )
-from requests import request
 
 HOST_URL: str = ""
 
@@ -49,6 +49,7 @@ class TwinSynthesiserRestExample:
             "Content-Type": "application/json",
         }
         self._token: str = None
+        self._rest_client: RestClient = None
         self._stomp_client: StompClient = None
 
         # The following variables are merely used to compute the average of the data received
@@ -75,6 +76,10 @@ class TwinSynthesiserRestExample:
         )
 
         self._headers.update({"Authorization": f"Bearer {self._token}"})
+        # The REST Client sends the headers with every call and keeps
+        # the connection to the Host open, so that each Share Feed Data operation
+        # doesn't need to open a new one
+        self._rest_client = RestClient(headers=self._headers)
 
     def setup_stomp(self, stomp_url: str):
         self._stomp_client = StompClient(
@@ -106,8 +111,8 @@ class TwinSynthesiserRestExample:
         make_api_call(
             method="POST",
             endpoint=f"{HOST_URL}/qapi/twins/{twin_synthesiser_did}/feeds/{synth_feed_id}/shares",
-            headers=self._headers,
             payload=data_to_share_payload,
+            rest_client=self._rest_client,
         )
 
         print(
@@ -154,23 +159,20 @@ class TwinSynthesiserRestExample:
     def search_twins(self, search_payload: dict) -> List[dict]:
         twins_found_list: List[dict] = []
 
-        search_headers: dict = self._headers.copy()
-        search_headers.update(
-            {
-                "Iotics-RequestTimeout": (
-                    datetime.now(tz=timezone.utc) + timedelta(seconds=float(3))
-                ).isoformat()
-            }
-        )
+        # The Search headers are sent in addition to the REST Client's ones
+        search_headers: dict = {
+            "Iotics-RequestTimeout": (
+                datetime.now(tz=timezone.utc) + timedelta(seconds=float(3))
+            ).isoformat()
+        }
 
-        with request(
+        with self._rest_client.request(
             method="POST",
-            url=f"{HOST_URL}/qapi/searches",
+            endpoint=f"{HOST_URL}/qapi/searches",
             headers=search_headers,
             stream=True,
-            verify=True,
             params={"scope": "LOCAL"},
-            json=search_payload,
+            payload=search_payload,
         ) as resp:
             resp.raise_for_status()
             for chunk in resp.iter_lines():
@@ -212,8 +214,8 @@ class TwinSynthesiserRestExample:
         make_api_call(
             method="PUT",
             endpoint=f"{HOST_URL}/qapi/twins",
-            headers=self._headers,
             payload=upsert_twin_payload,
+            rest_client=self._rest_client,
         )
 
 
@@ -10,8 +10,9 @@ which will remain invisible).
 """
 
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Thread
-from time import sleep
+from time import perf_counter, sleep
 from typing import List
 
 import grpc
@@ -27,6 +28,7 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
 )
+from helpers.feed_description_cache import FeedDescriptionCache
 from helpers.identity_interface import IdentityInterface
 from helpers.utilities import make_api_call
 from iotics.lib.grpc.helpers import create_feed_with_meta, create_property
@@ -45,6 +47,10 @@ AGENT_SEED: str = ""
 FEED_IDS_TO_HIDE = ["speed"]
 PROPERTY_KEYS_TO_HIDE = [CREATED_BY]
 
+# Create the Shadow Twins concurrently (True) or one at a time (False)
+CONCURRENT_PROVISIONING: bool = True
+PROVISIONING_WORKERS: int = 8
+
 
 def main():
     iotics_index: dict = make_api_call(
@@ -130,8 +136,18 @@ def main():
     print(f"Found {len(twins_found_list)} Twin(s) based on the search criteria")
     print("---")
 
-    # For any Car Twin found we want to create a Twin Shadow of it
-    for count, car_twin in enumerate(twins_found_list):
+    # Twins of the same type generally have the same Feeds:
+    # each Feed structure only needs to be described once
+    feed_description_cache: FeedDescriptionCache = FeedDescriptionCache()
+
+    def create_shadow_twin(count: int, car_twin):
+        """Create the Shadow Twin of a Car Twin and subscribe to its Feeds.
+
+        Args:
+            count (int): the number of the Car Twin, used for the Shadow Twin's key name.
+            car_twin: the Car Twin as returned by the Search operation.
+        """
+
         # Let's start by created a new Twin Registered Identity
         twin_shadow_identity: RegisteredIdentity = (
             identity_api.create_twin_with_control_delegation(
@@ -143,6 +159,14 @@ def main():
 
         car_twin_id: str = car_twin.twinId.id
         car_twin_properties: List[dict] = car_twin.properties
+        car_twin_type: str = next(
+            (
+                car_twin_property.uriValue.value
+                for car_twin_property in car_twin_properties
+                if car_twin_property.key == TYPE
+            ),
+            None,
+        )
         # Let's create a list of Properties for the Shadow Twins
         # that will be different from the Car Twins'.
         # Compared to the Car Twins, we want the Shadow Twins' data and metadata to be
@@ -169,7 +193,7 @@ def main():
 
         car_twin_feeds: List[dict] = car_twin.feeds
         shadow_twin_feeds: List[dict] = []
-        threads_list: List[Thread] = []
+        feed_ids_to_follow: List[str] = []
         # Let's scan all the Car Twins' Feeds so the Shadow Twins can subscribe to
         # and forward the data through them.
         for car_twin_feed in car_twin_feeds:
@@ -179,8 +203,22 @@ def main():
             if feed_id in FEED_IDS_TO_HIDE:
                 continue
 
-            feed_description = iotics_api.describe_feed(
-                twin_did=car_twin_id, feed_id=feed_id
+            # We need to describe the Car Twin's Feed in order to get its structure,
+            # unless a Feed with the same ID and metadata (as returned by the Search)
+            # of a Car Twin of the same type has already been described
+            feed_description = feed_description_cache.get(
+                twin_type=car_twin_type,
+                feed_id=feed_id,
+                fingerprint=(
+                    car_twin_feed.storeLast,
+                    tuple(
+                        feed_property.SerializeToString(deterministic=True)
+                        for feed_property in car_twin_feed.properties
+                    ),
+                ),
+                describe_feed=lambda: iotics_api.describe_feed(
+                    twin_did=car_twin_id, feed_id=feed_id
+                ),
             )
 
             shadow_twin_feeds.append(
@@ -192,19 +230,9 @@ def main():
                 )
             )
 
-            # We need to describe the Car Twin's Feed in order to get its structure
-            feed_listener = iotics_api.fetch_interests(
-                follower_twin_did=twin_shadow_identity.did,
-                followed_twin_did=car_twin_id,
-                followed_feed_id=feed_id,
-            )
-
             # We now need the Shadow Twin to subscribe to this Feed,
             # but only after the Shadow Twin is created.
-            th = Thread(
-                target=receive_and_forward_feed_data, args=[feed_listener], daemon=True
-            )
-            threads_list.append(th)
+            feed_ids_to_follow.append(feed_id)
 
         # Use the Upsert Twin operation to create the Shadow Twin with the list of Properties
         # and Feeds defined above
@@ -216,10 +244,44 @@ def main():
 
         print(f"Shadow Twin {twin_shadow_identity.did} created")
 
-        # We can now start the Threads in order to subscribe to the Car Twins' Feeds
-        # and forward the data received
-        for th in threads_list:
-            th.start()
+        # We can now subscribe to the Car Twin's Feeds straight away
+        # (without waiting for the other Shadow Twins to be created)
+        # and start the Threads in order to forward the data received
+        for feed_id in feed_ids_to_follow:
+            feed_listener = iotics_api.fetch_interests(
+                follower_twin_did=twin_shadow_identity.did,
+                followed_twin_did=car_twin_id,
+                followed_feed_id=feed_id,
+            )
+            Thread(
+                target=receive_and_forward_feed_data, args=[feed_listener], daemon=True
+            ).start()
+
+    # For any Car Twin found we want to create a Twin Shadow of it.
+    # With many Car Twins, the Shadow Twins can be created concurrently by a bounded
+    # pool of workers: while a Shadow Twin is being upserted, the next ones' identities
+    # are created and their Car Twins' Feeds described.
+    start_time = perf_counter()
+    if CONCURRENT_PROVISIONING:
+        with ThreadPoolExecutor(max_workers=PROVISIONING_WORKERS) as executor:
+            futures = [
+                executor.submit(create_shadow_twin, count, car_twin)
+                for count, car_twin in enumerate(twins_found_list)
+            ]
+            for future in as_completed(futures):
+                # Raise the exception of the Shadow Twins that couldn't be created, if any
+                future.result()
+    else:
+        for count, car_twin in enumerate(twins_found_list):
+            create_shadow_twin(count, car_twin)
+
+    print(
+        f"Created {len(twins_found_list)} Shadow Twin(s) in {perf_counter() - start_time:.1f}s"
+    )
+    print(
+        f"Described {feed_description_cache.misses} Feed(s), "
+        f"{feed_description_cache.hits} description(s) reused"
+    )
 
     while True:
         try:
@@ -10,9 +10,9 @@ which will remain invisible).
 """
 
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from threading import Thread
-from time import sleep
+from time import perf_counter, sleep
 from typing import List
 
 from helpers.constants import (
@@ -27,6 +27,8 @@ from helpers.constants import (
     USER_KEY_NAME,
     USER_SEED,
 )
+from helpers.feed_description_cache import FeedDescriptionCache
+from helpers.rest_client import RestClient
 from helpers.stomp_client import StompClient
 from helpers.utilities import make_api_call
 from iotics.lib.identity.api.high_level_api import (
@@ -34,7 +36,6 @@ from iotics.lib.identity.api.high_level_api import (
     RegisteredIdentity,
     get_rest_high_level_identity_api,
 )
-from requests import request
 
 HOST_URL: str = ""
 
@@ -44,6 +45,10 @@ AGENT_SEED: str = ""
 FEED_IDS_TO_HIDE = ["speed"]
 PROPERTY_KEYS_TO_HIDE = [CREATED_BY]
 
+# Create the Shadow Twins concurrently (True) or one at a time (False)
+CONCURRENT_PROVISIONING: bool = True
+PROVISIONING_WORKERS: int = 8
+
 
 def main():
     iotics_index: dict = make_api_call(
@@ -76,6 +81,12 @@ def main():
         "Content-Type": "application/json",
         "Authorization": f"Bearer {token}",
     }
+    # The REST Client sends the headers with every call and keeps the connections
+    # to the Host open, so that forwarding each data sample doesn't need to open a new one
+    # (one connection per provisioning worker, plus the ones used to forward the data)
+    rest_client: RestClient = RestClient(
+        headers=headers, pool_size=PROVISIONING_WORKERS + 2
+    )
 
     def feed_data_callback(stomp_headers, body):
         """The Callback we want to define for this exercise will simply
@@ -107,8 +118,8 @@ def main():
             make_api_call(
                 method="POST",
                 endpoint=f"{HOST_URL}/qapi/twins/{follower_twin_id}/feeds/{followed_feed_id}/shares",
-                headers=headers,
                 payload=data_to_share_payload,
+                rest_client=rest_client,
             )
             print(f"Forwarded data sample received from Twin {followed_twin_id}")
 
@@ -134,14 +145,12 @@ def main():
         print(f"Subscribed to Feed {feed_id} from Twin {twin_follower_id}")
 
     # We now want to search for the Car Twins created in exercise 10
-    search_headers: dict = headers.copy()
-    search_headers.update(
-        {
-            "Iotics-RequestTimeout": (
-                datetime.now(tz=timezone.utc) + timedelta(seconds=float(3))
-            ).isoformat()
-        }
-    )
+    # The Search headers are sent in addition to the REST Client's ones
+    search_headers: dict = {
+        "Iotics-RequestTimeout": (
+            datetime.now(tz=timezone.utc) + timedelta(seconds=float(3))
+        ).isoformat()
+    }
 
     # We can search for the Car Twins by taking into consideration their Twin Properties.
     # In particular we can use their TYPE property alongside an additional Property, the Created At.
@@ -160,14 +169,13 @@ def main():
 
     twins_found_list: List[dict] = []
 
-    with request(
+    with rest_client.request(
         method="POST",
-        url=f"{HOST_URL}/qapi/searches",
+        endpoint=f"{HOST_URL}/qapi/searches",
         headers=search_headers,
         stream=True,
-        verify=True,
         params={"scope": "LOCAL"},
-        json=payload,
+        payload=payload,
     ) as resp:
         resp.raise_for_status()
         for chunk in resp.iter_lines():
@@ -184,8 +192,18 @@ def main():
     print(f"Found {len(twins_found_list)} twin(s) based on the search criteria")
     print("---")
 
-    # For any Car Twin found we want to create a Twin Shadow of it
-    for count, car_twin in enumerate(twins_found_list):
+    # Twins of the same type generally have the same Feeds:
+    # each Feed structure only needs to be described once
+    feed_description_cache: FeedDescriptionCache = FeedDescriptionCache()
+
+    def create_shadow_twin(count: int, car_twin: dict):
+        """Create the Shadow Twin of a Car Twin and subscribe to its Feeds.
+
+        Args:
+            count (int): the number of the Car Twin, used for the Shadow Twin's key name.
+            car_twin (dict): the Car Twin as returned by the Search operation.
+        """
+
         # Let's start by created a new Twin Registered Identity
         twin_shadow_identity: RegisteredIdentity = (
             identity_api.create_twin_with_control_delegation(
@@ -197,6 +215,14 @@ def main():
 
         car_twin_id: str = car_twin["twinId"]["id"]
         car_twin_properties: List[dict] = car_twin.get("properties")
+        car_twin_type: str = next(
+            (
+                car_twin_property["uriValue"]["value"]
+                for car_twin_property in car_twin_properties
+                if car_twin_property["key"] == TYPE
+            ),
+            None,
+        )
         # Let's create a list of Properties for the Shadow Twins
         # that will be different from the Car Twins'.
         # Compared to the Car Twins, we want the Shadow Twins' data and metadata to be
@@ -223,7 +249,7 @@ def main():
 
         car_twin_feeds: List[dict] = car_twin.get("feeds")
         shadow_twin_feeds: List[dict] = []
-        threads_list: List[Thread] = []
+        feed_ids_to_follow: List[str] = []
         # Let's scan all the Car Twins' Feeds so the Shadow Twins can subscribe to
         # and forward the data through them.
         for car_twin_feed in car_twin_feeds:
@@ -233,11 +259,24 @@ def main():
             if feed_id in FEED_IDS_TO_HIDE:
                 continue
 
-            # We need to describe the Car Twin's Feed in order to get its structure
-            feed_description: dict = make_api_call(
-                method="GET",
-                endpoint=f"{HOST_URL}/qapi/twins/{car_twin_id}/feeds/{feed_id}",
-                headers=headers,
+            # We need to describe the Car Twin's Feed in order to get its structure,
+            # unless a Feed with the same ID and metadata (as returned by the Search)
+            # of a Car Twin of the same type has already been described
+            feed_description: dict = feed_description_cache.get(
+                twin_type=car_twin_type,
+                feed_id=feed_id,
+                fingerprint=json.dumps(
+                    {
+                        "storeLast": car_twin_feed.get("storeLast"),
+                        "properties": car_twin_feed.get("properties"),
+                    },
+                    sort_keys=True,
+                ),
+                describe_feed=lambda: make_api_call(
+                    method="GET",
+                    endpoint=f"{HOST_URL}/qapi/twins/{car_twin_id}/feeds/{feed_id}",
+                    rest_client=rest_client,
+                ),
             )
 
             shadow_twin_feeds.append(
@@ -251,12 +290,7 @@ def main():
 
             # We now need the STOMP Client to subscribe to this Feed,
             # but only after the Shadow Twin is created.
-            th = Thread(
-                target=subscribe_to_feed,
-                args=[twin_shadow_identity.did, car_twin_id, feed_id],
-                daemon=True,
-            )
-            threads_list.append(th)
+            feed_ids_to_follow.append(feed_id)
 
         upsert_twin_payload: dict = {
             "twinId": {"id": twin_shadow_identity.did},
@@ -269,16 +303,43 @@ def main():
         make_api_call(
             method="PUT",
             endpoint=f"{HOST_URL}/qapi/twins",
-            headers=headers,
             payload=upsert_twin_payload,
+            rest_client=rest_client,
         )
 
         print(f"Shadow Twin {twin_shadow_identity.did} created")
 
-        # We can now start the Threads in order to subscribe to the Car Twins' Feeds
+        # We can now subscribe to the Car Twin's Feeds straight away
+        # (without waiting for the other Shadow Twins to be created)
         # and forward the data received
-        for th in threads_list:
-            th.start()
+        for feed_id in feed_ids_to_follow:
+            subscribe_to_feed(twin_shadow_identity.did, car_twin_id, feed_id)
+
+    # For any Car Twin found we want to create a Twin Shadow of it.
+    # With many Car Twins, the Shadow Twins can be created concurrently by a bounded
+    # pool of workers: while a Shadow Twin is being upserted, the next ones' identities
+    # are created and their Car Twins' Feeds described.
+    start_time = perf_counter()
+    if CONCURRENT_PROVISIONING:
+        with ThreadPoolExecutor(max_workers=PROVISIONING_WORKERS) as executor:
+            futures = [
+                executor.submit(create_shadow_twin, count, car_twin)
+                for count, car_twin in enumerate(twins_found_list)
+            ]
+            for future in as_completed(futures):
+                # Raise the exception of the Shadow Twins that couldn't be created, if any
+                future.result()
+    else:
+        for count, car_twin in enumerate(twins_found_list):
+            create_shadow_twin(count, car_twin)
+
+    print(
+        f"Created {len(twins_found_list)} Shadow Twin(s) in {perf_counter() - start_time:.1f}s"
+    )
+    print(
+        f"Described {feed_description_cache.misses} Feed(s), "
+        f"{feed_description_cache.hits} description(s) reused"
+    )
 
     while True:
         try:
@@ -0,0 +1,127 @@
+"""This script compares the number of REST calls per second made:
+-   with a new connection per call ('requests.request', as 'make_api_call' used to do);
+-   with the REST Client, reusing the same connection;
+-   with the asyncio REST Client, making the calls concurrently.
+The calls are made to a local stub server (no IOTICS Host needed) which simulates
+the Host's response time, so the numbers only show the cost of opening the
+connections and of waiting for the responses one at a time.
+Against a real Host the gain is larger, as each new connection also needs a TLS handshake.
+"""
+
+import asyncio
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+
+from helpers.rest_client import AsyncRestClient, RestClient
+from requests import request
+
+CALLS_N: int = 500
+CONCURRENCY: int = 10
+# Time the stub server takes to answer each call
+RESPONSE_TIME_SEC: float = 0.005
+
+
+class StubHostHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 allows the connections to be kept alive
+    protocol_version = "HTTP/1.1"
+    # Otherwise the body, written after the headers, is delayed on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def _reply(self):
+        content_length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(content_length)
+        sleep(RESPONSE_TIME_SEC)
+
+        body: bytes = json.dumps({"result": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+    do_POST = _reply
+    do_PUT = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    stub_server = ThreadingHTTPServer(("127.0.0.1", 0), StubHostHandler)
+    stub_server.daemon_threads = True
+    Thread(target=stub_server.serve_forever, daemon=True).start()
+
+    return stub_server
+
+
+def share_payload(sample_n: int) -> dict:
+    return {"sample": {"data": str(sample_n), "mime": "application/json"}}
+
+
+def benchmark_new_connections(endpoint: str) -> float:
+    start_time = perf_counter()
+    for sample_n in range(CALLS_N):
+        response = request(method="POST", url=endpoint, json=share_payload(sample_n))
+        response.raise_for_status()
+        response.json()
+
+    return CALLS_N / (perf_counter() - start_time)
+
+
+def benchmark_rest_client(endpoint: str) -> float:
+    rest_client = RestClient()
+
+    start_time = perf_counter()
+    for sample_n in range(CALLS_N):
+        rest_client.call(
+            method="POST", endpoint=endpoint, payload=share_payload(sample_n)
+        )
+    calls_per_sec = CALLS_N / (perf_counter() - start_time)
+
+    rest_client.close()
+
+    return calls_per_sec
+
+
+async def benchmark_async_rest_client(endpoint: str) -> float:
+    async_rest_client = AsyncRestClient(pool_size=CONCURRENCY)
+
+    start_time = perf_counter()
+    await asyncio.gather(
+        *[
+            async_rest_client.call(
+                method="POST", endpoint=endpoint, payload=share_payload(sample_n)
+            )
+            for sample_n in range(CALLS_N)
+        ]
+    )
+    calls_per_sec = CALLS_N / (perf_counter() - start_time)
+
+    async_rest_client.close()
+
+    return calls_per_sec
+
+
+def main():
+    stub_server = start_stub_server()
+    host, port = stub_server.server_address
+    endpoint: str = f"http://{host}:{port}/qapi/twins/twin_did/feeds/feed_id/shares"
+
+    print(f"Making {CALLS_N} calls, each answered in {RESPONSE_TIME_SEC * 1000}ms...")
+    print(
+        f"New connection per call: {benchmark_new_connections(endpoint):8.1f} calls/s"
+    )
+    print(f"REST Client:             {benchmark_rest_client(endpoint):8.1f} calls/s")
+    print(
+        f"Async REST Client ({CONCURRENCY}):  "
+        f"{asyncio.run(benchmark_async_rest_client(endpoint)):8.1f} calls/s"
+    )
+
+    stub_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""The following cache avoids describing the same Feed structure over and over,
+e.g.: when creating the Shadow Twins of many Twins of the same type.
+"""
+
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class FeedDescriptionCache:
+    def __init__(self):
+        """A cache of Feed descriptions keyed by Twin type and Feed ID.
+        Each description is stored alongside the fingerprint of the Feed
+        it was made for (e.g.: its metadata as returned by the Search operation),
+        so that a Feed with the same ID but a different structure is described again.
+        When several Threads need the same description at the same time,
+        only one of them describes the Feed and the others wait for it.
+        """
+
+        self._descriptions: Dict[Tuple[str, str], Tuple[Hashable, Future]] = {}
+        self._lock: Lock = Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(
+        self,
+        twin_type: str,
+        feed_id: str,
+        fingerprint: Hashable,
+        describe_feed: Callable[[], Any],
+    ) -> Any:
+        """Return the description of a Feed, describing it only if
+        no Feed of the same Twin type, ID and fingerprint has been described yet.
+
+        Args:
+            twin_type (str): the type of the Twin (e.g.: the value of its TYPE Property).
+            feed_id (str): the Feed ID.
+            fingerprint (Hashable): a cheap summary of the Feed's structure.
+            describe_feed (Callable): the function describing the Feed.
+
+        Returns:
+            the description of the Feed.
+        """
+
+        key = (twin_type, feed_id)
+
+        with self._lock:
+            cached_fingerprint, cached_description = self._descriptions.get(
+                key, (None, None)
+            )
+            if cached_description and cached_fingerprint == fingerprint:
+                self.hits += 1
+                description_future = cached_description
+                to_describe = False
+            else:
+                self.misses += 1
+                description_future = Future()
+                self._descriptions[key] = (fingerprint, description_future)
+                to_describe = True
+
+        if to_describe:
+            try:
+                description_future.set_result(describe_feed())
+            except BaseException as ex:
+                # Don't cache the failure: the next call describes the Feed again
+                with self._lock:
+                    if (
+                        self._descriptions.get(key, (None, None))[1]
+                        is description_future
+                    ):
+                        del self._descriptions[key]
+                description_future.set_exception(ex)
+
+        return description_future.result()
@@ -0,0 +1,163 @@
+"""The following REST Clients keep a pool of connections open to the IOTICS Host
+so that each REST call doesn't open a new TCP+TLS connection.
+The headers (e.g.: the token) are set once and sent with every call.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+# The responses of the Host worth a retry (rate limited or temporarily unavailable)
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+
+class RestClient:
+    def __init__(
+        self,
+        headers: Optional[dict] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    ):
+        """A REST Client reusing the same (keep-alive) connections for all the calls.
+
+        Args:
+            headers (dict, optional): the headers sent with every call.
+            pool_size (int, optional): the max number of connections kept open
+                per Host, i.e.: the number of concurrent calls not waiting
+                for a free connection.
+            retries (int, optional): the max number of retries of a call.
+                Only the idempotent calls (e.g.: GET, PUT) are retried after
+                an error response, any call is retried if it couldn't connect.
+            backoff_factor (float, optional): the backoff between the retries
+                (0.5s, 1s, 2s, ... with the default value).
+        """
+
+        self._pool_size: int = pool_size
+        self._session: Session = Session()
+        if headers:
+            self._session.headers.update(headers)
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS_CODES,
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def set_token(self, token: str):
+        """Use a new token (e.g.: after the previous one expired) for the next calls."""
+
+        self._session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        payload: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        **kwargs,
+    ) -> Response:
+        """Make a REST call and return the raw response,
+        e.g.: to iterate over the lines of a Search response (stream=True).
+        The headers given are sent in addition to the Client's ones.
+        """
+
+        return self._session.request(
+            method=method, url=endpoint, headers=headers, json=payload, **kwargs
+        )
+
+    def call(
+        self,
+        method: str,
+        endpoint: str,
+        payload: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        **kwargs,
+    ) -> dict:
+        """Make a REST call and return the JSON response.
+        An exception is raised if the call failed.
+        """
+
+        with self.request(
+            method=method, endpoint=endpoint, payload=payload, headers=headers, **kwargs
+        ) as response:
+            response.raise_for_status()
+
+            return response.json()
+
+    def close(self):
+        self._session.close()
+
+
+class AsyncRestClient:
+    def __init__(self, rest_client: Optional[RestClient] = None, **kwargs):
+        """An asyncio version of the REST Client to make many calls concurrently,
+        e.g.: with 'asyncio.gather'. The calls are made by a pool of Threads,
+        as many as the connections of the REST Client so that no call
+        waits for a free connection.
+
+        Args:
+            rest_client (RestClient, optional): the REST Client making the calls.
+                If not given, a new one is created with the arguments given
+                (e.g.: headers, pool_size).
+        """
+
+        self._rest_client: RestClient = rest_client or RestClient(**kwargs)
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=self._rest_client.pool_size,
+            thread_name_prefix="rest_client",
+        )
+
+    @property
+    def rest_client(self) -> RestClient:
+        return self._rest_client
+
+    def set_token(self, token: str):
+        self._rest_client.set_token(token)
+
+    async def call(
+        self,
+        method: str,
+        endpoint: str,
+        payload: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        **kwargs,
+    ) -> dict:
+        """Make a REST call and return the JSON response.
+        An exception is raised if the call failed.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self._executor,
+            lambda: self._rest_client.call(
+                method=method,
+                endpoint=endpoint,
+                payload=payload,
+                headers=headers,
+                **kwargs,
+            ),
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._rest_client.close()
@@ -1,7 +1,19 @@
 import sys
 from typing import Optional
 
-from requests import Response, request
+from helpers.rest_client import RestClient
+
+# Shared by all the calls so that the connections to the Host are reused
+_default_rest_client: RestClient = None
+
+
+def get_default_rest_client() -> RestClient:
+    global _default_rest_client
+
+    if not _default_rest_client:
+        _default_rest_client = RestClient()
+
+    return _default_rest_client
 
 
 def make_api_call(
@@ -9,13 +21,19 @@ def make_api_call(
     endpoint: str,
     headers: Optional[dict] = None,
     payload: Optional[dict] = None,
+    rest_client: Optional[RestClient] = None,
 ) -> dict:
+    """Make a REST call and return the JSON response. Exit if the call failed.
+    The call is made with the REST Client given (e.g.: one with the auth headers
+    already set) or a default one, both keeping the connections open.
+    """
+
+    rest_client = rest_client or get_default_rest_client()
+
     try:
-        req_resp: Response = request(
-            method=method, url=endpoint, headers=headers, json=payload
+        response: dict = rest_client.call(
+            method=method, endpoint=endpoint, headers=headers, payload=payload
         )
-        req_resp.raise_for_status()
-        response: dict = req_resp.json()
     except Exception as ex:
         print("Getting error", ex)
         sys.exit(1)
@@ -0,0 +1,95 @@
+"""Benchmark of the end-to-end throughput of batched shares.
+Each share is simulated with a fixed per-RPC latency; the data samples are batched
+with 'SampleBatcher', encoded as JSON and unbatched on the consumer side
+with 'DataProcessor.unpack_feed_samples'. It prints the number of readings
+delivered per second for different batch sizes.
+
+Run it from the 'iotics-connector-example-common' folder:
+    python3 benchmarks/bench_batched_shares.py
+"""
+
+import json
+import os
+import sys
+from time import perf_counter, sleep
+from types import SimpleNamespace
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "src",
+        "iotics",
+        "connector",
+        "example",
+        "common",
+    ),
+)
+
+from batching import SampleBatcher  # noqa: E402
+from data_processor import DataProcessor  # noqa: E402
+
+READINGS_N = 2_000
+RPC_LATENCY_SEC = 0.002
+BATCH_SIZES = [1, 10, 50, 100]
+
+
+def share_feed_data(data: dict, occurred_at: int):
+    """Simulate a Share Feed Data operation and return the Feed message
+    as it would be received by a follower."""
+
+    sleep(RPC_LATENCY_SEC)
+
+    return SimpleNamespace(
+        payload=SimpleNamespace(
+            feedData=SimpleNamespace(
+                data=json.dumps(data).encode(),
+                mime="application/json",
+                occurredAt=SimpleNamespace(seconds=occurred_at, nanos=0),
+            )
+        )
+    )
+
+
+def run(batch_size: int) -> float:
+    sample_batcher = SampleBatcher(max_samples=batch_size, max_delay=60)
+    readings_received = 0
+
+    start_time = perf_counter()
+    for reading_n in range(READINGS_N):
+        occurred_at = 1_700_000_000 + reading_n
+        data_sample = {"reading": 20 + (reading_n % 100) / 10}
+
+        if batch_size == 1:
+            data_to_share = data_sample
+        else:
+            data_to_share = sample_batcher.add(data_sample, occurred_at)
+            if not data_to_share:
+                continue
+
+        feed_message = share_feed_data(data_to_share, occurred_at)
+        readings_received += len(DataProcessor.unpack_feed_samples(feed_message))
+    elapsed_time = perf_counter() - start_time
+
+    readings_per_second = readings_received / elapsed_time
+    print(
+        f"batch size {batch_size:>4}: {readings_received:>6} readings, "
+        f"{readings_per_second:>12,.0f} readings/s"
+    )
+
+    return readings_per_second
+
+
+def main():
+    print(
+        f"Sharing {READINGS_N:,} readings with a simulated RPC latency "
+        f"of {RPC_LATENCY_SEC * 1000:.0f}ms"
+    )
+    baseline = run(BATCH_SIZES[0])
+    for batch_size in BATCH_SIZES[1:]:
+        print(f"{'':>16}speed-up: {run(batch_size) / baseline:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Micro-benchmark of the Feed payload decoding used on the hot path of every follower.
+It compares the previous decoding ('json.loads' + 'datetime.fromtimestamp' + 'str'
+on every message) with 'DataProcessor.unpack_feed_data', and prints the number
+of messages decoded per second on a single core.
+
+Run it from the 'iotics-connector-example-common' folder:
+    python3 benchmarks/bench_feed_decoder.py
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "src",
+        "iotics",
+        "connector",
+        "example",
+        "common",
+    ),
+)
+
+from data_processor import DataProcessor  # noqa: E402
+from feed_decoder import JSON_BACKEND  # noqa: E402
+
+MESSAGES_N = 200_000
+
+
+def make_feed_messages(messages_n: int) -> list:
+    """Build Feed messages with the same shape as the ones returned by 'fetch_interests'."""
+
+    return [
+        SimpleNamespace(
+            payload=SimpleNamespace(
+                feedData=SimpleNamespace(
+                    data=json.dumps({"reading": 20 + (n % 100) / 10}).encode(),
+                    mime="application/json",
+                    occurredAt=SimpleNamespace(seconds=1_700_000_000 + n, nanos=n),
+                )
+            )
+        )
+        for n in range(messages_n)
+    ]
+
+
+def baseline_unpack_feed_data(feed_data):
+    """The decoding previously made by 'DataProcessor.unpack_feed_data'."""
+
+    received_data: dict = json.loads(feed_data.payload.feedData.data)
+    occurred_at_unix_time = feed_data.payload.feedData.occurredAt.seconds
+    occurred_at_timestamp = str(datetime.fromtimestamp(occurred_at_unix_time))
+
+    return received_data, occurred_at_timestamp
+
+
+def run(name: str, unpack_function, feed_messages: list) -> float:
+    start_time = perf_counter()
+    for feed_message in feed_messages:
+        unpack_function(feed_message)
+    elapsed_time = perf_counter() - start_time
+
+    messages_per_second = len(feed_messages) / elapsed_time
+    print(f"{name:<40} {messages_per_second:>12,.0f} messages/s")
+
+    return messages_per_second
+
+
+def main():
+    feed_messages = make_feed_messages(MESSAGES_N)
+
+    print(f"Decoding {MESSAGES_N:,} Feed messages (JSON backend: {JSON_BACKEND})")
+    before = run(
+        "before (json + datetime string)", baseline_unpack_feed_data, feed_messages
+    )
+    after = run(
+        "after (unpack_feed_data)", DataProcessor.unpack_feed_data, feed_messages
+    )
+    print(f"Speed-up: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
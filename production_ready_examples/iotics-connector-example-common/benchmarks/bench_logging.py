@@ -0,0 +1,128 @@
+"""Benchmark of the cost of logging each message received on the hot path.
+Several Threads log one line per message, as 'print_feed_data_on_screen' does,
+to an output stream with a fixed write latency (e.g.: a Docker log driver).
+It prints the number of messages/s processed by the Threads with a synchronous
+'StreamHandler', with the asynchronous queue-based logging, with the asynchronous
+logging plus per-call-site rate limiting, and with a periodic summary only.
+
+Run it from the 'iotics-connector-example-common' folder:
+    python3 benchmarks/bench_logging.py
+"""
+
+import io
+import logging
+import os
+import sys
+from logging import config
+from threading import Thread
+from time import perf_counter, sleep
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        "..",
+        "src",
+        "iotics",
+        "connector",
+        "example",
+        "common",
+    ),
+)
+
+from async_logging import ActivitySummary, setup_logging  # noqa: E402
+
+MESSAGES_N = 5_000
+THREADS_N = 4
+WRITE_LATENCY_SEC = 0.0002
+
+
+class SlowStream(io.StringIO):
+    """Output stream taking a fixed time to write each line."""
+
+    def write(self, text: str) -> int:
+        sleep(WRITE_LATENCY_SEC)
+        return len(text)
+
+
+SLOW_STREAM = SlowStream()
+LOGGING_CONFIGURATION = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"simple": {"format": "[%(asctime)s] %(levelname)s: %(message)s"}},
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "level": "INFO",
+            "formatter": "simple",
+            "stream": "ext://__main__.SLOW_STREAM",
+        }
+    },
+    "root": {"level": "INFO", "handlers": ["console"]},
+}
+
+log = logging.getLogger("bench")
+
+
+def log_messages(messages_n: int):
+    for message_n in range(messages_n):
+        log.info(
+            "Received data %s published by Twin DID %s via Feed %s at %s",
+            {"reading": message_n},
+            "did:iotics:iotBench",
+            "temperature",
+            "2024-01-01 00:00:00",
+        )
+
+
+def summarise_messages(activity_summary: ActivitySummary, messages_n: int):
+    for _ in range(messages_n):
+        activity_summary.add("did:iotics:iotBench/temperature")
+
+
+def run(name: str, target, *args) -> float:
+    threads = [
+        Thread(target=target, args=[*args, MESSAGES_N // THREADS_N])
+        for _ in range(THREADS_N)
+    ]
+
+    start_time = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = perf_counter() - start_time
+
+    messages_per_second = MESSAGES_N / elapsed_time
+    print(f"{name:<28}: {messages_per_second:>12,.0f} messages/s")
+
+    return messages_per_second
+
+
+def main():
+    print(
+        f"Logging {MESSAGES_N:,} messages from {THREADS_N} Threads with a write "
+        f"latency of {WRITE_LATENCY_SEC * 1e6:.0f}us"
+    )
+
+    config.dictConfig(LOGGING_CONFIGURATION)
+    baseline = run("synchronous", log_messages)
+
+    # The listeners are stopped, flushing their queue, at exit
+    setup_logging(LOGGING_CONFIGURATION, rate_limit=False)
+    speed_up = run("asynchronous", log_messages) / baseline
+    print(f"{'':>30}speed-up: {speed_up:.1f}x")
+
+    setup_logging(LOGGING_CONFIGURATION, rate_limit=True)
+    speed_up = run("asynchronous + rate limited", log_messages) / baseline
+    print(f"{'':>30}speed-up: {speed_up:.1f}x")
+
+    activity_summary = ActivitySummary(
+        description="Received", item_name="Feed messages", key_name="Feeds"
+    )
+    speed_up = run("summary", summarise_messages, activity_summary) / baseline
+    print(f"{'':>30}speed-up: {speed_up:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
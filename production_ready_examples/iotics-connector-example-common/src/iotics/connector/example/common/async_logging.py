@@ -0,0 +1,217 @@
+import atexit
+import logging
+from logging import config
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Dict, Tuple
+
+import constants as constant
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+class RateLimitFilter(logging.Filter):
+    """Limit the number of records logged by each call site (i.e.: file and line)
+    with a token bucket. The records dropped are counted and the number is appended
+    to the next record logged by the same call site.
+    Only the records up to 'max_level' are limited, so warnings and errors
+    are always logged.
+    """
+
+    def __init__(
+        self,
+        rate: float = constant.LOG_RATE_LIMIT_PER_SEC,
+        burst: int = constant.LOG_RATE_LIMIT_BURST,
+        max_level: int = logging.INFO,
+    ):
+        """Constructor of a RateLimitFilter object.
+
+        Args:
+            rate (float): the number of records per second logged by each call site.
+            burst (int): the number of records a call site can log at once.
+            max_level (int): the highest level limited.
+        """
+
+        super().__init__()
+        self._rate: float = rate
+        self._burst: int = burst
+        self._max_level: int = max_level
+        # By call site: the tokens left, the time of the last refill
+        # and the number of records dropped
+        self._call_sites: Dict[Tuple[str, int], list] = {}
+        self._lock: Lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self._max_level:
+            return True
+
+        now = monotonic()
+        call_site = (record.pathname, record.lineno)
+        with self._lock:
+            bucket = self._call_sites.get(call_site)
+            if bucket is None:
+                bucket = self._call_sites[call_site] = [self._burst, now, 0]
+
+            tokens, last_refill, dropped_n = bucket
+            tokens = min(self._burst, tokens + (now - last_refill) * self._rate)
+            if tokens < 1:
+                bucket[0], bucket[1], bucket[2] = tokens, now, dropped_n + 1
+                return False
+
+            bucket[0], bucket[1], bucket[2] = tokens - 1, now, 0
+
+        if dropped_n:
+            record.msg = f"{record.msg} [{dropped_n} similar messages suppressed]"
+
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller: records are dropped
+    if the queue is full, and the message is formatted by the listener Thread
+    instead of the caller. The arguments of a record must therefore not be
+    modified after being logged.
+    """
+
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped_n: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped_n += 1
+
+
+def setup_logging(
+    configuration: dict = constant.LOGGING_CONFIGURATION,
+    rate_limit: bool = True,
+) -> QueueListener:
+    """Configure the logging so that the handlers of the configuration
+    (e.g.: the console) are run by a background Thread. The Threads logging
+    only put the records into a bounded queue, so they are never slowed down
+    by the output. Optionally, the records of each call site are rate limited.
+    The records still in the queue are flushed at exit.
+
+    Args:
+        configuration (dict): the logging configuration (see 'logging.config').
+        rate_limit (bool): whether to rate limit the records of each call site.
+
+    Returns:
+        QueueListener: the listener running the handlers.
+    """
+
+    config.dictConfig(configuration)
+
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+
+    queue_handler = _NonBlockingQueueHandler(Queue(constant.LOG_QUEUE_SIZE))
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+
+    queue_listener = QueueListener(
+        queue_handler.queue, *handlers, respect_handler_level=True
+    )
+    queue_listener.start()
+    registry.gauge(
+        "iotics_log_records_dropped",
+        "Number of log records dropped because the logging queue was full",
+        function=lambda: queue_handler.dropped_n,
+    )
+    atexit.register(queue_listener.stop)
+
+    return queue_listener
+
+
+class ActivitySummary:
+    """Count events (e.g.: data samples received) by key (e.g.: the Twin and Feed)
+    and periodically log a single summary line such as
+    "Received 1200 data samples from 40 Feeds in the last 10s",
+    as an alternative to logging each event.
+    """
+
+    def __init__(
+        self,
+        description: str,
+        item_name: str,
+        key_name: str,
+        period: float = constant.LOG_SUMMARY_PERIOD_SEC,
+    ):
+        """Constructor of an ActivitySummary object.
+
+        Args:
+            description (str): what happened to the items, e.g.: "Received".
+            item_name (str): the name of the items counted, e.g.: "data samples".
+            key_name (str): the name of the keys, e.g.: "Feeds".
+            period (float): how often (in seconds) the summary is logged.
+        """
+
+        self._description: str = description
+        self._item_name: str = item_name
+        self._key_name: str = key_name
+        self._period: float = period
+        self._counts: Dict[str, int] = {}
+        self._lock: Lock = Lock()
+        self._stopped: Event = Event()
+        self._summary_thread: Thread = None
+
+    def add(self, key: str, items_n: int = 1):
+        """Count new items.
+
+        Args:
+            key (str): the key of the items.
+            items_n (int, optional): the number of items.
+        """
+
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + items_n
+
+    def log_summary(self):
+        """Log the number of items and keys counted since the previous summary."""
+
+        with self._lock:
+            counts, self._counts = self._counts, {}
+
+        if counts:
+            log.info(
+                "%s %d %s from %d %s in the last %ss",
+                self._description,
+                sum(counts.values()),
+                self._item_name,
+                len(counts),
+                self._key_name,
+                self._period,
+            )
+
+    def _summary_loop(self):
+        while not self._stopped.wait(self._period):
+            self.log_summary()
+
+    def start(self):
+        """Start the Thread periodically logging the summary."""
+
+        if self._summary_thread:
+            return
+
+        self._summary_thread = Thread(
+            target=self._summary_loop, name="activity_summary", daemon=True
+        )
+        self._summary_thread.start()
+
+    def stop(self):
+        """Stop the Thread and log the last summary."""
+
+        self._stopped.set()
+        self.log_summary()
@@ -0,0 +1,116 @@
+import json
+import logging
+from threading import Lock
+from time import monotonic
+from typing import List, Optional
+
+import constants as constant
+
+log = logging.getLogger(__name__)
+
+
+class SampleBatcher:
+    """Accumulate data samples, each with its own timestamp, so they can be
+    shared with a single Share Feed Data operation. A batch is ready when
+    it reaches the max number of samples, the max size in bytes
+    or when its oldest sample has waited for longer than the max delay.
+    As the latter is only checked when a sample is added, 'flush_if_due'
+    is expected to be called periodically (e.g.: by a scheduler job).
+    """
+
+    def __init__(
+        self,
+        max_samples: int = constant.BATCH_MAX_SAMPLES,
+        max_delay: float = constant.BATCH_MAX_DELAY_SEC,
+        max_bytes: int = constant.BATCH_MAX_BYTES,
+    ):
+        self._max_samples: int = max_samples
+        self._max_delay: float = max_delay
+        self._max_bytes: int = max_bytes
+
+        self._samples: List[dict] = []
+        self._size_bytes: int = 0
+        self._first_sample_time: float = None
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, data_sample: dict, occurred_at: int) -> Optional[dict]:
+        """Add a new data sample to the batch.
+
+        Args:
+            data_sample (dict): the data sample to add.
+            occurred_at (int): the time at which the data sample was generated
+                in seconds since the epoch.
+
+        Returns:
+            Optional[dict]: the batch payload to share if the batch is ready,
+                None otherwise.
+        """
+
+        sample = dict(data_sample)
+        sample[constant.BATCH_OCCURRED_AT_KEY] = occurred_at
+        # Rough estimation of the encoded size of the sample
+        sample_size_bytes = len(json.dumps(sample))
+
+        with self._lock:
+            if not self._samples:
+                self._first_sample_time = monotonic()
+            self._samples.append(sample)
+            self._size_bytes += sample_size_bytes
+
+            if self.is_ready():
+                return self._flush()
+
+        return None
+
+    def is_ready(self) -> bool:
+        """Whether the batch has reached any of its bounds."""
+
+        if not self._samples:
+            return False
+
+        return (
+            len(self._samples) >= self._max_samples
+            or self._size_bytes >= self._max_bytes
+            or monotonic() - self._first_sample_time >= self._max_delay
+        )
+
+    def flush_if_due(self) -> Optional[dict]:
+        """Empty the batch if its oldest sample has waited for longer
+        than the max delay, even if no other sample has been added since.
+
+        Returns:
+            Optional[dict]: the batch payload to share if the batch is ready,
+                None otherwise.
+        """
+
+        with self._lock:
+            if self.is_ready():
+                return self._flush()
+
+        return None
+
+    def flush(self) -> Optional[dict]:
+        """Empty the batch.
+
+        Returns:
+            Optional[dict]: the batch payload to share, None if the batch is empty.
+        """
+
+        with self._lock:
+            return self._flush()
+
+    def _flush(self) -> Optional[dict]:
+        if not self._samples:
+            return None
+
+        batch_payload = {constant.BATCH_SAMPLES_KEY: self._samples}
+        log.debug("Flushing batch of %d samples", len(self._samples))
+
+        self._samples = []
+        self._size_bytes = 0
+        self._first_sample_time = None
+
+        return batch_payload
@@ -1,22 +1,66 @@
-import json
 import logging
 from datetime import datetime
 from queue import Empty, Queue
-from typing import List, Tuple
+from time import time
+from typing import Dict, List, Optional, Tuple
 
 import constants as constant
+from async_logging import ActivitySummary
+from feed_decoder import OccurredAt
+from latency_histogram import LatencyRecorder
+from metrics import registry
+from payload_codec import decode_payload
+from sketches import FeedSummary
 
 log = logging.getLogger(__name__)
 
+FEED_GAPS = registry.counter(
+    "iotics_feed_gaps_total",
+    "Number of gaps found in the Feed data stored, when a Feed is followed again",
+    ["feed_id"],
+)
+FEED_SAMPLES_BACKFILLED = registry.counter(
+    "iotics_feed_samples_backfilled_total",
+    "Number of data samples missed by the Feed stream and stored afterwards",
+    ["feed_id"],
+)
+FEED_SAMPLES_MISSED = registry.counter(
+    "iotics_feed_samples_missed_total",
+    "Estimated number of data samples missed and not available anymore",
+    ["feed_id"],
+)
+
 
 class DataProcessor:
     """Object simulating a data processor."""
 
-    def __init__(self):
-        """Constructor of the DataProcessor Class."""
+    def __init__(
+        self, latency_recorder: LatencyRecorder = None, log_each_message: bool = True
+    ):
+        """Constructor of the DataProcessor Class.
+
+        Args:
+            latency_recorder (LatencyRecorder, optional): the recorder of the latencies
+                of the data processed. A new one is created by default.
+            log_each_message (bool, optional): whether to log each message received
+                and each reading read from the DB (default), or a periodic summary.
+        """
 
         self._db_writer = None
         self._db_reader = None
+        # By Feed, the time (in seconds) of the last data sample exported to DB
+        self._last_exported_at: Dict[str, int] = {}
+        self._latency_recorder: LatencyRecorder = latency_recorder or LatencyRecorder()
+        self._feed_data_summary: ActivitySummary = None
+        if not log_each_message:
+            self._feed_data_summary = ActivitySummary(
+                description="Received", item_name="Feed messages", key_name="Feeds"
+            )
+            self._feed_data_summary.start()
+
+    @property
+    def latency_recorder(self) -> LatencyRecorder:
+        return self._latency_recorder
 
     def initialise_db_writer(
         self, db_name: str, db_username: str, db_password: str
@@ -36,7 +80,10 @@ class DataProcessor:
 
         try:
             self._db_writer = DBWriter(
-                db_name=db_name, db_username=db_username, db_password=db_password
+                db_name=db_name,
+                db_username=db_username,
+                db_password=db_password,
+                latency_recorder=self._latency_recorder,
             )
         except Exception as ex:
             log.error("An exception was raised when initialising the DBWriter: %s", ex)
@@ -71,36 +118,71 @@ class DataProcessor:
         return True
 
     @staticmethod
-    def unpack_feed_data(feed_data) -> Tuple[dict, str]:
+    def unpack_feed_data(feed_data) -> Tuple[dict, OccurredAt]:
         """Retrieve the Feed's data and timestamp from the Feed message.
+        The data is decoded according to its MIME type (JSON by default).
+        The timestamp is only formatted into a string when converted with 'str()'.
 
         Args:
             feed_data: the Feed message to unpack
 
         Returns:
-            Tuple[str, str]: the Feed's data and timestamp
+            Tuple[dict, OccurredAt]: the Feed's data and timestamp
         """
 
-        received_data: dict = json.loads(feed_data.payload.feedData.data)
-        occurred_at_unix_time = feed_data.payload.feedData.occurredAt.seconds
-        occurred_at_timestamp = str(datetime.fromtimestamp(occurred_at_unix_time))
+        feed_data_payload = feed_data.payload.feedData
+        received_data: dict = decode_payload(
+            feed_data_payload.data, feed_data_payload.mime
+        )
+        occurred_at_timestamp = OccurredAt.from_timestamp(feed_data_payload.occurredAt)
 
         return received_data, occurred_at_timestamp
 
+    @classmethod
+    def unpack_feed_samples(cls, feed_data) -> List[Tuple[dict, OccurredAt]]:
+        """Retrieve the list of data samples and their timestamps from the Feed message.
+        A batched Feed message includes several data samples, each with its own timestamp.
+        A non-batched Feed message is returned as a list with a single item.
+
+        Args:
+            feed_data: the Feed message to unpack
+
+        Returns:
+            List[Tuple[dict, OccurredAt]]: the data samples and their timestamps
+        """
+
+        received_data, occurred_at_timestamp = cls.unpack_feed_data(feed_data)
+
+        batched_samples = received_data.get(constant.BATCH_SAMPLES_KEY)
+        if batched_samples is None:
+            return [(received_data, occurred_at_timestamp)]
+
+        feed_samples = []
+        for batched_sample in batched_samples:
+            sample_occurred_at = batched_sample.pop(constant.BATCH_OCCURRED_AT_KEY)
+            feed_samples.append((batched_sample, OccurredAt(sample_occurred_at)))
+
+        return feed_samples
+
     @staticmethod
-    def unpack_input_data(input_message) -> Tuple[dict, str]:
+    def unpack_input_data(input_message) -> Tuple[dict, OccurredAt]:
         """Retrieve the Input's data and timestamp from the Input message.
+        The timestamp is only formatted into a string when converted with 'str()'.
 
         Args:
             input_message: the Input message to unpack
 
         Returns:
-            Tuple[str, str]: the Input's data and timestamp
+            Tuple[dict, OccurredAt]: the Input's data and timestamp
         """
 
-        received_data: dict = json.loads(input_message.payload.message.data)
-        occurred_at_unix_time = input_message.payload.message.occurredAt.seconds
-        occurred_at_timestamp = str(datetime.fromtimestamp(occurred_at_unix_time))
+        input_message_payload = input_message.payload.message
+        received_data: dict = decode_payload(
+            input_message_payload.data, input_message_payload.mime
+        )
+        occurred_at_timestamp = OccurredAt.from_timestamp(
+            input_message_payload.occurredAt
+        )
 
         return received_data, occurred_at_timestamp
 
@@ -115,15 +197,19 @@ class DataProcessor:
             feed_data: Feed data received.
         """
 
-        received_data, occurred_at_timestamp = self.unpack_feed_data(feed_data)
-
-        log.info(
-            "Received data %s published by Twin DID %s via Feed %s at %s",
-            received_data,
-            publisher_twin_did,
-            publisher_feed_id,
-            occurred_at_timestamp,
-        )
+        if self._feed_data_summary:
+            # Only count the message, without decoding it
+            self._feed_data_summary.add(f"{publisher_twin_did}/{publisher_feed_id}")
+            return
+
+        for received_data, occurred_at_timestamp in self.unpack_feed_samples(feed_data):
+            log.info(
+                "Received data %s published by Twin DID %s via Feed %s at %s",
+                received_data,
+                publisher_twin_did,
+                publisher_feed_id,
+                occurred_at_timestamp,
+            )
 
     def print_input_message_on_screen(
         self, receiver_twin_did: str, receiver_input_id: str, input_message
@@ -146,25 +232,188 @@ class DataProcessor:
             occurred_at_timestamp,
         )
 
-    def export_to_db(self, publisher_twin_did: str, publisher_feed_id: str, feed_data):
+    def record_feed_latency(
+        self,
+        publisher_twin_did: str,
+        publisher_feed_id: str,
+        feed_data,
+        received_at: float,
+    ):
+        """Record the end-to-end latency of a Feed message, i.e.: the time between
+        the message's 'occurredAt' and the time it was received. Only the message's
+        timestamp is used, so the payload is not decoded.
+
+        Args:
+            publisher_twin_did (str): the Twin DID publishing data.
+            publisher_feed_id (str): the Feed ID from which the data is published.
+            feed_data: Feed data received.
+            received_at (float): the time the message was received
+                in seconds since the epoch.
+        """
+
+        occurred_at = OccurredAt.from_timestamp(feed_data.payload.feedData.occurredAt)
+        self._latency_recorder.record(
+            metric=constant.LATENCY_END_TO_END,
+            key=f"{publisher_twin_did}/{publisher_feed_id}",
+            value=received_at - occurred_at.unix_time,
+        )
+
+    def _store_feed_samples(
+        self,
+        publisher_twin_did: str,
+        publisher_feed_id: str,
+        feed_samples: List[Tuple[dict, OccurredAt]],
+        received_at: float = None,
+    ):
+        feed_key = f"{publisher_twin_did}/{publisher_feed_id}"
+        for received_data, occurred_at_timestamp in feed_samples:
+            if received_at is not None:
+                # Each sample of a batch has its own timestamp
+                self._latency_recorder.record(
+                    metric=constant.LATENCY_END_TO_END,
+                    key=feed_key,
+                    value=received_at - occurred_at_timestamp.unix_time,
+                )
+
+            self._db_writer.store_to_db(
+                datetime=str(occurred_at_timestamp),
+                sensor_twin_did=publisher_twin_did,
+                sensor_feed_id=publisher_feed_id,
+                sensor_reading=received_data.get(constant.SENSOR_FEED_VALUE),
+            )
+
+            if occurred_at_timestamp.seconds > self._last_exported_at.get(feed_key, 0):
+                self._last_exported_at[feed_key] = occurred_at_timestamp.seconds
+
+    def export_to_db(
+        self,
+        publisher_twin_did: str,
+        publisher_feed_id: str,
+        feed_data,
+        received_at: float = None,
+    ):
         """Export to DB the data received.
 
         Args:
             publisher_twin_did (str): the Twin DID publishing data.
             publisher_feed_id (str): the Feed ID from which the data is published.
             feed_data: Feed data received.
+            received_at (float, optional): the time the message was received
+                in seconds since the epoch. If given, the end-to-end latency
+                of each data sample is recorded.
+        """
+
+        self._store_feed_samples(
+            publisher_twin_did,
+            publisher_feed_id,
+            self.unpack_feed_samples(feed_data),
+            received_at=received_at,
+        )
+
+    def get_last_exported_at(
+        self, publisher_twin_did: str, publisher_feed_id: str
+    ) -> float:
+        """Return the time of the last data sample of a Feed exported to DB
+        by this process or, if none, found in the DB (e.g.: before a restart).
+
+        Args:
+            publisher_twin_did (str): the Twin DID publishing data.
+            publisher_feed_id (str): the Feed ID from which the data is published.
+
+        Returns:
+            float: the time in seconds since the epoch, None if no data is stored.
         """
 
-        received_data, occurred_at_timestamp = self.unpack_feed_data(feed_data)
+        last_exported_at = self._last_exported_at.get(
+            f"{publisher_twin_did}/{publisher_feed_id}"
+        )
+        if last_exported_at is None:
+            try:
+                last_timestamp = self._db_writer.select_last_timestamp(
+                    twin_did=publisher_twin_did, feed_id=publisher_feed_id
+                )
+            except Exception as ex:
+                log.error("Error reading the last timestamp stored: %s", ex)
+                return None
+
+            if last_timestamp:
+                # Stored as the local datetime of the 'occurredAt' (see 'OccurredAt')
+                last_exported_at = datetime.fromisoformat(last_timestamp).timestamp()
+
+        return last_exported_at
+
+    def backfill_to_db(
+        self,
+        publisher_twin_did: str,
+        publisher_feed_id: str,
+        last_stored_feed_data=None,
+        feed_period: float = None,
+        message_period: float = None,
+    ) -> int:
+        """Export to DB the data samples missed while a Feed wasn't followed
+        (e.g.: the Connector restarted or the stream dropped) that are still
+        available, i.e.: the ones of the last Feed message stored by the Host
+        newer than the last sample exported. Given the Feed's update period,
+        the samples not available anymore are estimated and reported.
+
+        Args:
+            publisher_twin_did (str): the Twin DID publishing data.
+            publisher_feed_id (str): the Feed ID from which the data is published.
+            last_stored_feed_data (optional): the last Feed message stored by the Host.
+            feed_period (float, optional): the seconds between two data samples.
+            message_period (float, optional): the seconds between two Feed messages,
+                longer than the Feed period if the data samples are shared in batches.
+
+        Returns:
+            int: the number of data samples backfilled.
+        """
 
-        self._db_writer.store_to_db(
-            datetime=occurred_at_timestamp,
-            sensor_twin_did=publisher_twin_did,
-            sensor_feed_id=publisher_feed_id,
-            sensor_reading=received_data.get(constant.SENSOR_FEED_VALUE),
+        last_exported_at = self.get_last_exported_at(
+            publisher_twin_did, publisher_feed_id
         )
 
-    def generate_db_credentials(self, full_name: str) -> Tuple[str, str]:
+        feed_samples = []
+        if last_stored_feed_data:
+            feed_samples = [
+                (received_data, occurred_at_timestamp)
+                for received_data, occurred_at_timestamp in self.unpack_feed_samples(
+                    last_stored_feed_data
+                )
+                if last_exported_at is None
+                or occurred_at_timestamp.seconds > last_exported_at
+            ]
+        if feed_samples:
+            self._store_feed_samples(
+                publisher_twin_did, publisher_feed_id, feed_samples
+            )
+            FEED_SAMPLES_BACKFILLED.labels(publisher_feed_id).inc(len(feed_samples))
+
+        if last_exported_at is None or not feed_period:
+            return len(feed_samples)
+
+        message_period = max(message_period or feed_period, feed_period)
+        gap_sec = time() - last_exported_at
+        if gap_sec > message_period * constant.FEED_GAP_PERIODS_N:
+            # The samples of the batch not shared yet by the Publisher aren't missed
+            pending_samples_n = int(message_period / feed_period) - 1
+            missed_samples_n = max(
+                int(gap_sec / feed_period) - len(feed_samples) - pending_samples_n, 0
+            )
+            FEED_GAPS.labels(publisher_feed_id).inc()
+            FEED_SAMPLES_MISSED.labels(publisher_feed_id).inc(missed_samples_n)
+            log.warning(
+                "No data stored for %ds from Twin %s, Feed %s: "
+                "%d samples backfilled, about %d missed",
+                gap_sec,
+                publisher_twin_did,
+                publisher_feed_id,
+                len(feed_samples),
+                missed_samples_n,
+            )
+
+        return len(feed_samples)
+
+    def generate_db_credentials(self, full_name: str) -> Optional[Tuple[str, str]]:
         """Generate a set of credentials, specifically a 'username' and 'password'
         to access the DB.
 
@@ -173,7 +422,8 @@ class DataProcessor:
                 used to generate the credentials.
 
         Returns:
-            Tuple[str, str]: username and password used to access the DB
+            Tuple[str, str]: username and password used to access the DB,
+                None if the DB user couldn't be created.
         """
 
         # Remove any space between name and surname to make the username
@@ -185,26 +435,44 @@ class DataProcessor:
             "Granting DB access with username %s and password %s", username, password
         )
 
-        self._db_writer.add_new_user(username=username, password=password)
+        if not self._db_writer.add_new_user(username=username, password=password):
+            return None
 
         return username, password
 
+    def _log_readings(self, readings: list):
+        """Log the readings retrieved from the DB, or only their number
+        and the number of Feeds they come from if each message is not logged.
+
+        Args:
+            readings (list): the readings retrieved from the DB.
+        """
+
+        if self._feed_data_summary:
+            feeds = {(reading.twin_did, reading.feed_id) for reading in readings}
+            log.info(
+                "Retrieved %d readings from %d Feeds from DB", len(readings), len(feeds)
+            )
+            return
+
+        log.info("Data retrieved from DB:")
+
+        for reading in readings:
+            log.info(
+                "timestamp: %s, twin_did: %s, feed_id: %s, reading: %s",
+                reading.timestamp,
+                reading.twin_did,
+                reading.feed_id,
+                reading.reading,
+            )
+
     def print_all_data_from_db(self):
         """Print on screen all readings from the DB."""
 
         readings = self._db_reader.select_all_readings()
 
         if readings:
-            log.info("Data retrieved from DB:")
-
-            for reading in readings:
-                log.info(
-                    "timestamp: %s, twin_did: %s, feed_id: %s, reading: %s",
-                    reading.timestamp,
-                    reading.twin_did,
-                    reading.feed_id,
-                    reading.reading,
-                )
+            self._log_readings(readings)
         else:
             log.info("No data from DB")
 
@@ -218,19 +486,157 @@ class DataProcessor:
         )
 
         if readings:
-            log.info("Data retrieved from DB:")
-
-            for reading in readings:
-                log.info(
-                    "timestamp: %s, twin_did: %s, feed_id: %s, reading: %s",
-                    reading.timestamp,
-                    reading.twin_did,
-                    reading.feed_id,
-                    reading.reading,
-                )
+            self._log_readings(readings)
         else:
             log.info("No new data from DB")
 
+    def print_new_data_from_db(self, last_reading_id: int = None) -> int:
+        """Print on screen the readings stored in the DB after a given one.
+
+        Args:
+            last_reading_id (int, optional): the id of the last reading printed.
+                All readings are printed by default.
+
+        Returns:
+            int: the id of the last reading printed so far.
+        """
+
+        if last_reading_id is None:
+            readings = self._db_reader.select_all_readings()
+        else:
+            readings = self._db_reader.select_readings_after(last_reading_id)
+
+        if not readings:
+            log.info("No new data from DB")
+            return last_reading_id
+
+        self._log_readings(readings)
+
+        return max(reading.id for reading in readings)
+
+    @staticmethod
+    def _log_aggregated_readings(aggregated_readings: list):
+        for aggregated_reading in aggregated_readings:
+            log.info(
+                "twin_did: %s, feed_id: %s, from: %s, average: %s, min: %s, "
+                "max: %s, count: %d",
+                aggregated_reading.twin_did,
+                aggregated_reading.feed_id,
+                aggregated_reading.bucket_start,
+                aggregated_reading.average,
+                aggregated_reading.minimum,
+                aggregated_reading.maximum,
+                aggregated_reading.count,
+            )
+
+    def print_aggregated_data_from_db(
+        self,
+        bucket_size: int,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        twin_did: str = None,
+        feed_id: str = None,
+    ):
+        """Print on screen the average, min, max and number of readings
+        of each Twin and Feed in time buckets, computed by the DB.
+
+        Args:
+            bucket_size (int): the length of the time buckets in seconds.
+            start_datetime (datetime, optional): The start datetime.
+            end_datetime (datetime, optional): The end datetime.
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+        """
+
+        aggregated_readings = self._db_reader.select_aggregated_readings(
+            bucket_size=bucket_size,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            twin_did=twin_did,
+            feed_id=feed_id,
+        )
+
+        if not aggregated_readings:
+            log.info("No data from DB")
+            return
+
+        log.info("Data aggregated by %ds from DB:", bucket_size)
+        self._log_aggregated_readings(aggregated_readings)
+
+    def print_last_data_from_db(self, twin_did: str = None, feed_id: str = None):
+        """Print on screen the most recent reading of each Twin and Feed.
+
+        Args:
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+        """
+
+        readings = self._db_reader.select_last_readings(
+            twin_did=twin_did, feed_id=feed_id
+        )
+
+        if readings:
+            self._log_readings(readings)
+        else:
+            log.info("No data from DB")
+
+    def print_downsampled_data_from_db(
+        self,
+        points_n: int,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        twin_did: str = None,
+        feed_id: str = None,
+    ):
+        """Print on screen the readings of each Twin and Feed
+        downsampled by the DB to about 'points_n' points.
+
+        Args:
+            points_n (int): the target number of points of each Twin and Feed.
+            start_datetime (datetime, optional): The start datetime.
+                The oldest reading by default.
+            end_datetime (datetime, optional): The end datetime.
+                The most recent reading by default.
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+        """
+
+        aggregated_readings = self._db_reader.select_downsampled_readings(
+            points_n=points_n,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            twin_did=twin_did,
+            feed_id=feed_id,
+        )
+
+        if not aggregated_readings:
+            log.info("No data from DB")
+            return
+
+        log.info("Data downsampled to %d points from DB:", points_n)
+        self._log_aggregated_readings(aggregated_readings)
+
+    def listen_for_new_db_data(self) -> bool:
+        """Listen for the notifications of new readings stored in the DB.
+
+        Returns:
+            bool: whether the notifications can be received.
+        """
+
+        return self._db_reader.listen_for_new_readings()
+
+    def wait_for_new_db_data(self, timeout: float) -> bool:
+        """Wait until new readings are stored in the DB or the timeout expires.
+
+        Args:
+            timeout (float): max time to wait in seconds.
+
+        Returns:
+            bool: whether new readings have been notified.
+        """
+
+        return self._db_reader.wait_for_new_readings(timeout)
+
     def get_list_of_items(self, data_received_queue: Queue) -> List[float]:
         """Append each items of a Queue into a List by emptying the queue.
 
@@ -250,21 +656,86 @@ class DataProcessor:
                 # exception is received.
                 data_received = data_received_queue.get_nowait()
 
-                # Convert the Feed data received into a Python dict
+                # Convert the Feed data received into a list of Python dicts
+                for received_data, occurred_at_timestamp in self.unpack_feed_samples(
+                    data_received
+                ):
+                    log.debug("Received data %s from queue", received_data)
+
+                    # The data received is a dictionary.
+                    # We want to get only the list of values from such dictionary.
+                    new_items = received_data.values()
+                    log.debug("Adding %s to items_list", new_items)
+                    items_list.extend(new_items)
+        except Empty:
+            log.debug("Queue empty")
+
+        return items_list
+
+    def get_summary_of_items(self, data_received_queue: Queue) -> FeedSummary:
+        """Aggregate each items of a Queue into a mergeable summary
+        by emptying the queue.
+
+        Args:
+            data_received_queue (Queue): the queue that will be
+                emptied and aggregated.
+
+        Returns:
+            FeedSummary: the summary of the items consumed from the queue.
+        """
+
+        summary = FeedSummary()
+
+        try:
+            while True:
+                data_received = data_received_queue.get_nowait()
+
+                twin_did = data_received.payload.interest.followedFeedId.twinId
+                for received_data, occurred_at_timestamp in self.unpack_feed_samples(
+                    data_received
+                ):
+                    log.debug("Received data %s from queue", received_data)
+
+                    for new_item in received_data.values():
+                        summary.add(new_item, twin_did)
+        except Empty:
+            log.debug("Queue empty")
+
+        return summary
+
+    def merge_partial_summaries(
+        self, partial_summaries_queue: Queue
+    ) -> Dict[str, FeedSummary]:
+        """Merge the partial summaries shared by the Synthesiser shards
+        by emptying the queue.
+
+        Args:
+            partial_summaries_queue (Queue): the queue of partial summaries
+                that will be emptied and merged.
+
+        Returns:
+            Dict[str, FeedSummary]: the merged summary of each type of data.
+        """
+
+        merged_summaries: Dict[str, FeedSummary] = {}
+
+        try:
+            while True:
+                data_received = partial_summaries_queue.get_nowait()
+
                 received_data, occurred_at_timestamp = self.unpack_feed_data(
                     data_received
                 )
-                log.debug("Received data %s from queue", received_data)
 
-                # The data received is a dictionary.
-                # We want to get only the list of values from such dictionary.
-                new_items = received_data.values()
-                log.debug("Adding %s to items_list", new_items)
-                items_list.extend(new_items)
+                for data_type, partial_summary in received_data.items():
+                    merged_summary = merged_summaries.setdefault(
+                        data_type, FeedSummary()
+                    )
+                    merged_summary.merge(FeedSummary.from_dict(partial_summary))
         except Empty:
             log.debug("Queue empty")
 
-        return items_list
+        return merged_summaries
 
     def compute_average(self, items_list: List[float]) -> float:
         """Compute the average from a list of items.
@@ -10,15 +10,14 @@ log = logging.getLogger(__name__)
 class DataSource:
     """Object simulating a data source."""
 
-    def make_temperature_reading(self) -> dict:
-        """Generate a new temperature data sample after a predefined period.
+    def generate_temperature_reading(self) -> dict:
+        """Generate a new temperature data sample straight away.
+        Used when the period is handled by a scheduler.
 
         Returns:
             temperature_data (dict): a new data sample generated.
         """
 
-        sleep(constant.TEMPERATURE_READING_PERIOD)
-
         rand_temperature: float = round(
             uniform(constant.MIN_TEMP_VALUE, constant.MAX_TEMP_VALUE), 2
         )
@@ -28,18 +27,39 @@ class DataSource:
 
         return temperature_data
 
-    def make_humidity_reading(self) -> dict:
-        """Generate a new humidity data sample after a predefined period.
+    def generate_humidity_reading(self) -> dict:
+        """Generate a new humidity data sample straight away.
+        Used when the period is handled by a scheduler.
 
         Returns:
             humidity_data (dict): a new data sample generated.
         """
 
-        sleep(constant.HUMIDITY_READING_PERIOD)
-
         rand_humidity: int = randint(constant.MIN_HUM_VALUE, constant.MAX_HUM_VALUE)
         log.debug("Generated humidity reading of %d", rand_humidity)
 
         humidity_data: dict = {constant.SENSOR_FEED_VALUE: rand_humidity}
 
         return humidity_data
+
+    def make_temperature_reading(self) -> dict:
+        """Generate a new temperature data sample after a predefined period.
+
+        Returns:
+            temperature_data (dict): a new data sample generated.
+        """
+
+        sleep(constant.TEMPERATURE_READING_PERIOD)
+
+        return self.generate_temperature_reading()
+
+    def make_humidity_reading(self) -> dict:
+        """Generate a new humidity data sample after a predefined period.
+
+        Returns:
+            humidity_data (dict): a new data sample generated.
+        """
+
+        sleep(constant.HUMIDITY_READING_PERIOD)
+
+        return self.generate_humidity_reading()
@@ -1,7 +1,8 @@
 import logging
 
 import constants as constant
-from sqlalchemy import Column, Float, Integer, String, create_engine
+from sqlalchemy import Column, Float, Index, Integer, String, create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
 from utilities import check_global_var
@@ -23,6 +24,12 @@ class SensorReading(Base):
     """
 
     __tablename__ = "SensorReadings"
+    # Used by the per Twin/Feed queries (e.g.: the aggregations of the DBReader)
+    __table_args__ = (
+        Index(
+            "ix_sensor_readings_twin_feed_timestamp", "twin_did", "feed_id", "timestamp"
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     timestamp = Column(String(100))
@@ -37,6 +44,7 @@ class DBManager:
         check_global_var(var=db_username, var_name="DB_USERNAME")
         check_global_var(var=db_password, var_name="POSTGRES_PASSWORD")
 
+        self._engine: Engine = None
         self._session: Session = None
 
         self._db_name: str = db_name
@@ -48,12 +56,12 @@ class DBManager:
 
     def _initialise(self):
         log.debug("Connecting to DB...")
-        engine = create_engine(self._db_url)
+        self._engine = create_engine(self._db_url)
 
         try:
-            Base.metadata.create_all(engine)
+            Base.metadata.create_all(self._engine)
         except Exception as ex:
             log.error("Exception raised in initialising DB: %s", ex)
         else:
-            self._session = Session(engine)
+            self._session = Session(self._engine)
             log.debug("Connected to DB")
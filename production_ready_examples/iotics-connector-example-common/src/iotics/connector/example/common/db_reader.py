@@ -1,9 +1,14 @@
 import logging
+import select
 from datetime import datetime
+from math import ceil
+from time import monotonic, sleep
 
 import constants as constant
+import psycopg2
 from db_manager import DBManager, SensorReading
-from sqlalchemy import and_
+from psycopg2 import extensions
+from sqlalchemy import DateTime, and_, cast, extract, func
 
 log = logging.getLogger(__name__)
 
@@ -13,6 +18,7 @@ class DBReader(DBManager):
         super().__init__(
             db_username=db_username, db_password=db_password, db_name=db_name
         )
+        self._listen_connection = None
         self._initialise()
 
     def select_all_readings(self):
@@ -70,3 +76,291 @@ class DBReader(DBManager):
             log.debug("Fetched readings in range successfully")
 
         return readings
+
+    def select_readings_after(self, last_reading_id: int):
+        """Fetches the sensor readings stored after a given one.
+        Unlike the datetime range, it includes the readings whose timestamp
+        is older than the last access but that were stored after it.
+
+        Args:
+            last_reading_id (int): the id of the last reading already fetched.
+
+        Returns:
+            list: A list of SensorReading objects ordered by id.
+        """
+
+        readings = []
+
+        try:
+            with self._session:
+                readings = (
+                    self._session.query(SensorReading)
+                    .filter(SensorReading.id > last_reading_id)
+                    .order_by(SensorReading.id)
+                    .all()
+                )
+        except Exception as ex:
+            log.error("Error fetching new readings: %s", ex)
+        else:
+            log.debug("Fetched new readings successfully")
+
+        return readings
+
+    @staticmethod
+    def _filter_readings(
+        query,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        twin_did: str = None,
+        feed_id: str = None,
+    ):
+        """Filter a query on the SensorReading Table by datetime range, Twin and Feed.
+        The timestamps are compared as strings, as stored."""
+
+        if start_datetime:
+            query = query.filter(
+                SensorReading.timestamp
+                >= start_datetime.strftime(constant.DATETIME_FORMAT)
+            )
+        if end_datetime:
+            query = query.filter(
+                SensorReading.timestamp
+                <= end_datetime.strftime(constant.DATETIME_FORMAT)
+            )
+        if twin_did:
+            query = query.filter(SensorReading.twin_did == twin_did)
+        if feed_id:
+            query = query.filter(SensorReading.feed_id == feed_id)
+
+        return query
+
+    def select_aggregated_readings(
+        self,
+        bucket_size: int,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        twin_did: str = None,
+        feed_id: str = None,
+    ):
+        """Fetches the average, min, max and number of sensor readings
+        of each Twin and Feed in time buckets. The aggregation is computed
+        by the database, so only one row per bucket is returned.
+
+        Args:
+            bucket_size (int): the length of the time buckets in seconds.
+            start_datetime (datetime, optional): The start datetime.
+            end_datetime (datetime, optional): The end datetime.
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+
+        Returns:
+            list: A list of rows with 'twin_did', 'feed_id', 'bucket_start',
+                'average', 'minimum', 'maximum' and 'count',
+                ordered by Twin, Feed and bucket.
+        """
+
+        readings = []
+
+        # Buckets are aligned to the epoch: timestamp - (epoch seconds % bucket_size)
+        epoch_seconds = extract("epoch", cast(SensorReading.timestamp, DateTime))
+        bucket_start = func.timezone(
+            "UTC",
+            func.to_timestamp(func.floor(epoch_seconds / bucket_size) * bucket_size),
+        ).label("bucket_start")
+
+        try:
+            with self._session:
+                query = self._session.query(
+                    SensorReading.twin_did,
+                    SensorReading.feed_id,
+                    bucket_start,
+                    func.avg(SensorReading.reading).label("average"),
+                    func.min(SensorReading.reading).label("minimum"),
+                    func.max(SensorReading.reading).label("maximum"),
+                    func.count(SensorReading.id).label("count"),
+                )
+                readings = (
+                    self._filter_readings(
+                        query, start_datetime, end_datetime, twin_did, feed_id
+                    )
+                    .group_by(
+                        SensorReading.twin_did, SensorReading.feed_id, bucket_start
+                    )
+                    .order_by(
+                        SensorReading.twin_did, SensorReading.feed_id, bucket_start
+                    )
+                    .all()
+                )
+        except Exception as ex:
+            log.error("Error fetching aggregated readings: %s", ex)
+        else:
+            log.debug("Fetched aggregated readings successfully")
+
+        return readings
+
+    def select_last_readings(self, twin_did: str = None, feed_id: str = None):
+        """Fetches the most recent sensor reading of each Twin and Feed.
+
+        Args:
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+
+        Returns:
+            list: A list of SensorReading objects, one per Twin and Feed.
+        """
+
+        readings = []
+
+        try:
+            with self._session:
+                query = self._session.query(SensorReading).distinct(
+                    SensorReading.twin_did, SensorReading.feed_id
+                )
+                readings = (
+                    self._filter_readings(query, twin_did=twin_did, feed_id=feed_id)
+                    .order_by(
+                        SensorReading.twin_did,
+                        SensorReading.feed_id,
+                        SensorReading.timestamp.desc(),
+                        SensorReading.id.desc(),
+                    )
+                    .all()
+                )
+        except Exception as ex:
+            log.error("Error fetching last readings: %s", ex)
+        else:
+            log.debug("Fetched last readings successfully")
+
+        return readings
+
+    def select_downsampled_readings(
+        self,
+        points_n: int,
+        start_datetime: datetime = None,
+        end_datetime: datetime = None,
+        twin_did: str = None,
+        feed_id: str = None,
+    ):
+        """Fetches the sensor readings of each Twin and Feed downsampled to
+        about 'points_n' points, i.e.: aggregated in buckets whose size is
+        the datetime range divided by the number of points.
+
+        Args:
+            points_n (int): the target number of points of each Twin and Feed.
+            start_datetime (datetime, optional): The start datetime.
+                The oldest reading by default.
+            end_datetime (datetime, optional): The end datetime.
+                The most recent reading by default.
+            twin_did (str, optional): only the readings of this Twin.
+            feed_id (str, optional): only the readings of this Feed.
+
+        Returns:
+            list: A list of rows as returned by 'select_aggregated_readings'.
+        """
+
+        if not start_datetime or not end_datetime:
+            try:
+                with self._session:
+                    query = self._session.query(
+                        func.min(SensorReading.timestamp),
+                        func.max(SensorReading.timestamp),
+                    )
+                    oldest_timestamp, newest_timestamp = self._filter_readings(
+                        query, start_datetime, end_datetime, twin_did, feed_id
+                    ).one()
+            except Exception as ex:
+                log.error("Error fetching the datetime range of the readings: %s", ex)
+                return []
+
+            if oldest_timestamp is None:
+                return []
+
+            start_datetime = start_datetime or datetime.strptime(
+                oldest_timestamp, constant.DATETIME_FORMAT
+            )
+            end_datetime = end_datetime or datetime.strptime(
+                newest_timestamp, constant.DATETIME_FORMAT
+            )
+
+        range_seconds = (end_datetime - start_datetime).total_seconds()
+        bucket_size = max(ceil(range_seconds / max(points_n, 1)), 1)
+
+        return self.select_aggregated_readings(
+            bucket_size=bucket_size,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            twin_did=twin_did,
+            feed_id=feed_id,
+        )
+
+    def listen_for_new_readings(self) -> bool:
+        """Listen, on a dedicated connection, for the notifications
+        sent by the DBWriter when new readings are stored.
+
+        Returns:
+            bool: whether the notifications can be received.
+        """
+
+        try:
+            connection = psycopg2.connect(self._db_url)
+            connection.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{constant.DB_NEW_READINGS_CHANNEL}";')
+        except Exception as ex:
+            log.warning("Can't listen for new readings notifications: %s", ex)
+            return False
+
+        self._listen_connection = connection
+        log.debug("Listening for new readings notifications")
+
+        return True
+
+    def _close_listen_connection(self):
+        try:
+            self._listen_connection.close()
+        except Exception:
+            pass
+
+        self._listen_connection = None
+
+    def wait_for_new_readings(self, timeout: float) -> bool:
+        """Wait until new readings are notified or the timeout expires.
+        All the notifications received meanwhile are consumed,
+        so a burst of writes wakes the caller up only once.
+        If the listening connection is lost, it is opened again
+        on the next call; until then, this only waits for the timeout.
+
+        Args:
+            timeout (float): max time to wait in seconds.
+
+        Returns:
+            bool: whether new readings have been notified.
+        """
+
+        if not self._listen_connection and not self.listen_for_new_readings():
+            sleep(timeout)
+            return False
+
+        connection = self._listen_connection
+        deadline = monotonic() + timeout
+
+        try:
+            connection.poll()
+            while not connection.notifies:
+                remaining_time = deadline - monotonic()
+                if remaining_time <= 0:
+                    return False
+
+                select.select([connection], [], [], remaining_time)
+                connection.poll()
+
+            notifications_n = len(connection.notifies)
+            connection.notifies.clear()
+        except Exception as ex:
+            log.warning("Lost the connection listening for new readings: %s", ex)
+            self._close_listen_connection()
+            return False
+
+        log.debug("Received %d new readings notifications", notifications_n)
+
+        return True
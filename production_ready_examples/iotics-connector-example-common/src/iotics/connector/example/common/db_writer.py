@@ -1,27 +1,59 @@
 import logging
-from queue import Queue
+from queue import Empty, Queue
 from threading import Thread
+from time import monotonic
+from typing import Set
 
+import constants as constant
 from db_manager import DBManager, SensorReading
-from sqlalchemy import text
+from latency_histogram import LatencyRecorder
+from metrics import registry
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
 from sqlalchemy_utils import create_database, database_exists
 
 log = logging.getLogger(__name__)
 
+DB_WRITES = registry.counter(
+    "iotics_db_writes_total", "Number of readings written to the DB", ["status"]
+)
+DB_COMMIT_DURATION = registry.histogram(
+    "iotics_db_commit_duration_seconds", "Duration of the DB commits"
+)
+DB_NOTIFICATIONS = registry.counter(
+    "iotics_db_notifications_total", "Number of new readings notifications sent"
+)
+
 
 class DBWriter(DBManager):
     """Manages the database connection and operations."""
 
-    def __init__(self, db_name: str, db_username: str, db_password: str):
+    def __init__(
+        self,
+        db_name: str,
+        db_username: str,
+        db_password: str,
+        latency_recorder: LatencyRecorder = None,
+    ):
         """ "Initialises the DBManager instance,
         sets up the queue, and initializes the database.
+        If a LatencyRecorder is given, the time each item spends
+        in the queue before being written is recorded.
         """
 
         super().__init__(
             db_username=db_username, db_password=db_password, db_name=db_name
         )
 
+        self._latency_recorder: LatencyRecorder = latency_recorder
         self._queue = Queue()
+        # The DB users known to exist, so they aren't looked up again
+        self._existing_users: Set[str] = set()
+        registry.gauge(
+            "iotics_db_writer_queue_size",
+            "Number of readings waiting to be written to the DB",
+            function=self._queue.qsize,
+        )
         self._initialise_db()
 
     def _initialise_db(self):
@@ -40,24 +72,162 @@ class DBWriter(DBManager):
 
         log.debug("DB Initialised successfully")
 
-    def _store(self):
-        """Background thread method that continuously stores sensor readings
-        from the queue to the database.
+    def _get_batch(self, timeout: float = None) -> list:
+        """Wait for the next item of the queue, then take the items
+        already queued as well, up to 'DB_WRITE_BATCH_MAX_SIZE'.
+
+        Args:
+            timeout (float, optional): max time to wait in seconds. Forever by default.
+
+        Returns:
+            list: the items taken, empty if none was queued within the timeout.
         """
 
-        log.debug("Waiting for incoming items to store...")
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except Empty:
+            return []
 
-        while True:
-            sensor_reading: SensorReading = self._queue.get()
+        while len(batch) < constant.DB_WRITE_BATCH_MAX_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _notify_new_readings(self, readings_n: int):
+        """Notify the listeners of the new readings channel (e.g.: the Historian
+        Reader). Postgres only delivers the notification when the transaction
+        is committed, so the readings can be read as soon as it is received.
+
+        Args:
+            readings_n (int): the number of new readings.
+        """
+
+        self._session.execute(
+            text("SELECT pg_notify(:channel, :payload);"),
+            {"channel": constant.DB_NEW_READINGS_CHANNEL, "payload": str(readings_n)},
+        )
+        DB_NOTIFICATIONS.inc()
+
+    def _write_batch(self, batch: list, notify_readings_n: int = 0) -> bool:
+        """Store a batch of sensor readings in a single transaction.
+
+        Args:
+            batch (list): the sensor readings and the time they were enqueued.
+            notify_readings_n (int, optional): if not 0, the number of new readings
+                notified within the same transaction.
+
+        Returns:
+            bool: whether the batch has been stored. If not, nothing is stored
+                (see '_write_rows').
+        """
+
+        if self._latency_recorder:
+            dequeued_at = monotonic()
+            for sensor_reading, enqueued_at in batch:
+                self._latency_recorder.record(
+                    metric=constant.LATENCY_DB_QUEUE,
+                    key=f"{sensor_reading.twin_did}/{sensor_reading.feed_id}",
+                    value=dequeued_at - enqueued_at,
+                )
+
+        try:
+            with DB_COMMIT_DURATION.time():
+                self._session.add_all([sensor_reading for sensor_reading, _ in batch])
+                if notify_readings_n:
+                    self._notify_new_readings(notify_readings_n)
+                self._session.commit()
+        except Exception as ex:
+            log.warning(
+                "Error storing %d items, storing them one by one: %s", len(batch), ex
+            )
+            self._session.rollback()
+            return False
+
+        DB_WRITES.labels("ok").inc(len(batch))
+        log.debug("%d items stored successfully", len(batch))
+
+        return True
+
+    def _write_rows(self, batch: list) -> int:
+        """Store the sensor readings of a batch one by one (i.e.: after the batch
+        failed), so that a bad reading doesn't discard the other ones.
+
+        Args:
+            batch (list): the sensor readings and the time they were enqueued.
+
+        Returns:
+            int: the number of readings stored.
+        """
 
+        stored_n = 0
+        for sensor_reading, _ in batch:
             try:
                 self._session.add(sensor_reading)
                 self._session.commit()
             except Exception as ex:
                 log.error("Error storing item: %s", ex)
+                DB_WRITES.labels("error").inc()
                 self._session.rollback()
             else:
-                log.debug("Item stored successfully")
+                DB_WRITES.labels("ok").inc()
+                stored_n += 1
+
+        return stored_n
+
+    def _store(self):
+        """Background thread method that continuously stores sensor readings
+        from the queue to the database, in batches of the items queued meanwhile.
+        The new readings are notified with the batch that stores them, but at most
+        once every 'DB_NOTIFY_MIN_INTERVAL_SEC': under high write rates the readings
+        committed in between are notified together at the end of the interval.
+        """
+
+        log.debug("Waiting for incoming items to store...")
+
+        last_notified_at = float("-inf")
+        unnotified_readings_n = 0
+
+        while True:
+            timeout = None
+            if unnotified_readings_n:
+                timeout = max(
+                    last_notified_at
+                    + constant.DB_NOTIFY_MIN_INTERVAL_SEC
+                    - monotonic(),
+                    0,
+                )
+
+            batch = self._get_batch(timeout)
+            is_notify_due = (
+                monotonic() - last_notified_at >= constant.DB_NOTIFY_MIN_INTERVAL_SEC
+            )
+
+            if batch:
+                readings_n = unnotified_readings_n + len(batch)
+                if not self._write_batch(
+                    batch, notify_readings_n=readings_n if is_notify_due else 0
+                ):
+                    # The readings stored are notified at the next iteration
+                    unnotified_readings_n += self._write_rows(batch)
+                    continue
+                unnotified_readings_n = readings_n
+            elif unnotified_readings_n and is_notify_due:
+                try:
+                    self._notify_new_readings(unnotified_readings_n)
+                    self._session.commit()
+                except Exception as ex:
+                    # The readers still poll the DB periodically
+                    log.error("Error notifying new readings: %s", ex)
+                    self._session.rollback()
+            else:
+                continue
+
+            if is_notify_due:
+                last_notified_at = monotonic()
+                unnotified_readings_n = 0
 
     def store_to_db(
         self,
@@ -82,40 +252,82 @@ class DBWriter(DBManager):
             reading=sensor_reading,
         )
 
-        self._queue.put(sensor_reading_obj)
+        self._queue.put((sensor_reading_obj, monotonic()))
         log.debug("Item added to the queue")
 
-    def _check_user_exists(self, username: str) -> bool:
+    def select_last_timestamp(self, twin_did: str, feed_id: str) -> str:
+        """Return the timestamp of the last reading stored for a Feed.
+        It uses its own DB session, like 'add_new_user'.
+
+        Args:
+            twin_did (str): the Twin that shared the readings.
+            feed_id (str): the Feed that the readings were shared from.
+
+        Returns:
+            str: the timestamp of the last reading, None if there isn't any.
+        """
+
+        with Session(self._engine) as session:
+            return (
+                session.query(func.max(SensorReading.timestamp))
+                .filter(
+                    SensorReading.twin_did == twin_did,
+                    SensorReading.feed_id == feed_id,
+                )
+                .scalar()
+            )
+
+    @staticmethod
+    def _check_user_exists(session: Session, username: str) -> bool:
         """Check if a user already exists in the database."""
 
         query = text("SELECT 1 FROM pg_roles WHERE rolname = :username;")
-        result = self._session.execute(query, {"username": username})
+        result = session.execute(query, {"username": username})
         return bool(result.scalar())
 
-    def add_new_user(self, username: str, password: str):
-        # Check if the user already exists
-        user_exists = self._check_user_exists(username)
+    def add_new_user(self, username: str, password: str) -> bool:
+        """Create a DB user with SELECT privileges, unless it already exists.
+        It uses its own DB session, so it can be called by several Threads
+        concurrently with the writes of the readings.
 
-        if user_exists:
-            log.debug("Role %s already exists", username)
-            return
+        Args:
+            username (str): the username of the new user.
+            password (str): the password of the new user.
+
+        Returns:
+            bool: whether the user exists (True) or couldn't be created (False).
+        """
 
         create_new_user_sql = text(f"CREATE USER {username} WITH PASSWORD :password;")
         grant_privileges_sql = text(
             f"GRANT SELECT ON ALL TABLES IN SCHEMA public TO {username};"
         )
 
-        try:
-            with self._session:
-                self._session.execute(create_new_user_sql, {"password": password})
-                self._session.execute(grant_privileges_sql)
-                self._session.commit()
-        except Exception as ex:
-            self._session.rollback()
-            log.error("An error occurred: %s", ex)
-        else:
-            log.info(
-                "User %s and Password %s created and SELECT privileges granted successfully",
-                username,
-                password,
-            )
+        if username in self._existing_users:
+            log.debug("Role %s already exists", username)
+            return True
+
+        with Session(self._engine) as session:
+            # Check if the user already exists
+            if self._check_user_exists(session=session, username=username):
+                log.debug("Role %s already exists", username)
+                self._existing_users.add(username)
+                return True
+
+            try:
+                session.execute(create_new_user_sql, {"password": password})
+                session.execute(grant_privileges_sql)
+                session.commit()
+            except Exception as ex:
+                session.rollback()
+                log.error("An error occurred: %s", ex)
+                return False
+            else:
+                self._existing_users.add(username)
+                log.info(
+                    "User %s and Password %s created and SELECT privileges granted successfully",
+                    username,
+                    password,
+                )
+
+                return True
@@ -0,0 +1,380 @@
+import faulthandler
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+import constants as constant
+
+log = logging.getLogger(__name__)
+
+
+def _get_output_path(output_dir: str, prefix: str, extension: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    return os.path.join(output_dir, f"{prefix}_{os.getpid()}_{timestamp}.{extension}")
+
+
+def _get_thread_cpu_time(thread_ident: int) -> Optional[float]:
+    """Return the CPU time consumed by a Thread, None if not supported."""
+
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_ident))
+    except (AttributeError, OSError):
+        return None
+
+
+class SamplingProfiler:
+    """Statistical CPU profiler. The stacks of all the Threads are sampled at
+    a fixed interval and aggregated in the collapsed format used by flame graph
+    tools (e.g.: 'flamegraph.pl', speedscope): one line per distinct stack,
+    with the frames from the root to the leaf separated by ';' and followed by
+    the number of samples. Where the platform allows it, a Thread is only sampled
+    if it used the CPU since the previous sample, so Threads waiting for
+    data or locks don't hide where the CPU time is spent.
+    """
+
+    def __init__(
+        self,
+        interval: float = constant.PROFILER_SAMPLING_INTERVAL_SEC,
+        cpu_only: bool = True,
+    ):
+        """Constructor of a SamplingProfiler object.
+
+        Args:
+            interval (float): the time between samples in seconds.
+            cpu_only (bool): whether to only sample the Threads using the CPU.
+                If False, all the Threads are sampled (wall-clock profile).
+        """
+
+        self._interval: float = interval
+        self._cpu_only: bool = cpu_only
+        self._lock: Lock = Lock()
+
+    @staticmethod
+    def _format_frame(frame) -> str:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _collapse_stack(self, frame) -> str:
+        frames: List[str] = []
+        while frame is not None:
+            frames.append(self._format_frame(frame))
+            frame = frame.f_back
+
+        return ";".join(reversed(frames))
+
+    def profile(self, duration: float, output_path: str) -> int:
+        """Sample the stacks for a time window and write them
+        in the collapsed format. Only one profile can run at a time.
+
+        Args:
+            duration (float): the length of the window in seconds.
+            output_path (str): the path of the file to write.
+
+        Returns:
+            int: the number of samples collected, -1 if a profile was already running.
+        """
+
+        if not self._lock.acquire(blocking=False):
+            log.warning("A CPU profile is already running")
+            return -1
+
+        try:
+            stack_counts = self._sample(duration)
+        finally:
+            self._lock.release()
+
+        with open(output_path, "w", encoding="utf-8") as output_file:
+            for stack, samples_n in stack_counts.most_common():
+                output_file.write(f"{stack} {samples_n}\n")
+
+        samples_n = sum(stack_counts.values())
+        log.info(
+            "CPU profile of %ss written to %s (%d samples)",
+            duration,
+            output_path,
+            samples_n,
+        )
+
+        return samples_n
+
+    def _sample(self, duration: float) -> Counter:
+        stack_counts: Counter = Counter()
+        cpu_times: Dict[int, float] = {}
+        profiler_thread_ident = threading.get_ident()
+        cpu_only = (
+            self._cpu_only and _get_thread_cpu_time(profiler_thread_ident) is not None
+        )
+
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            for thread_ident, frame in sys._current_frames().items():
+                if thread_ident == profiler_thread_ident:
+                    continue
+
+                if cpu_only:
+                    cpu_time = _get_thread_cpu_time(thread_ident)
+                    previous_cpu_time = cpu_times.get(thread_ident)
+                    cpu_times[thread_ident] = cpu_time
+                    if (
+                        cpu_time is None
+                        or previous_cpu_time is None
+                        or cpu_time <= previous_cpu_time
+                    ):
+                        continue
+
+                stack_counts[self._collapse_stack(frame)] += 1
+
+            time.sleep(self._interval)
+
+        return stack_counts
+
+    def start(self, duration: float, output_path: str):
+        """Profile in a background Thread.
+
+        Args:
+            duration (float): the length of the window in seconds.
+            output_path (str): the path of the file to write.
+        """
+
+        Thread(
+            target=self.profile,
+            args=[duration, output_path],
+            name="cpu_profiler",
+            daemon=True,
+        ).start()
+
+
+def format_thread_stacks() -> str:
+    """Return the current stack of every Thread, with the Thread names.
+
+    Returns:
+        str: the stacks of all the Threads.
+    """
+
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks: List[str] = []
+    for thread_ident, frame in sys._current_frames().items():
+        thread_name = thread_names.get(thread_ident, "unknown")
+        stacks.append(f'Thread "{thread_name}" ({thread_ident}):\n')
+        stacks.extend(traceback.format_stack(frame))
+        stacks.append("\n")
+
+    return "".join(stacks)
+
+
+class MemoryTracer:
+    """Take tracemalloc snapshots and report the lines of code whose
+    allocations grew the most since the previous snapshot.
+    Tracing is started on the first snapshot unless it is already running,
+    so the first snapshot only acts as the baseline.
+    """
+
+    def __init__(
+        self,
+        frames_n: int = constant.TRACEMALLOC_FRAMES,
+        top_n: int = constant.TRACEMALLOC_TOP_N,
+    ):
+        """Constructor of a MemoryTracer object.
+
+        Args:
+            frames_n (int): number of frames stored for each allocation.
+            top_n (int): number of allocators reported.
+        """
+
+        self._frames_n: int = frames_n
+        self._top_n: int = top_n
+        self._previous_snapshot: tracemalloc.Snapshot = None
+        self._lock: Lock = Lock()
+
+    def start(self):
+        """Start tracing the allocations."""
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames_n)
+            log.info("Tracing memory allocations (%d frames)", self._frames_n)
+
+    def snapshot(self, output_path: str = None) -> List[str]:
+        """Take a snapshot and log the top allocators compared with the previous one.
+
+        Args:
+            output_path (str, optional): the path where to dump the snapshot,
+                e.g.: to be analysed offline with 'tracemalloc.Snapshot.load'.
+
+        Returns:
+            List[str]: the top allocators diffs, empty for the first snapshot.
+        """
+
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                self.start()
+
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                    tracemalloc.Filter(False, "<unknown>"),
+                ]
+            )
+            if output_path:
+                snapshot.dump(output_path)
+
+            current_size, peak_size = tracemalloc.get_traced_memory()
+            log.info(
+                "Traced memory: current %.1f MiB, peak %.1f MiB",
+                current_size / 2**20,
+                peak_size / 2**20,
+            )
+
+            top_diffs: List[str] = []
+            if self._previous_snapshot:
+                diffs = snapshot.compare_to(self._previous_snapshot, "lineno")
+                top_diffs = [str(diff) for diff in diffs[: self._top_n]]
+                log.info(
+                    "Top %d allocators since the previous snapshot:\n%s",
+                    len(top_diffs),
+                    "\n".join(top_diffs),
+                )
+            else:
+                log.info("Baseline memory snapshot taken")
+
+            self._previous_snapshot = snapshot
+
+        return top_diffs
+
+
+class Diagnostics:
+    """Diagnostics of a live Connector, triggered by signals:
+    - SIGUSR1: log the stack of every Thread;
+    - SIGUSR2: write a CPU profile of the next 'profile_duration' seconds;
+    - SIGRTMIN (Linux): take a memory snapshot and log the top allocators
+      since the previous one.
+    The output files are written into 'output_dir'.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = constant.DIAGNOSTICS_DIR,
+        profile_duration: float = constant.PROFILER_DURATION_SEC,
+    ):
+        """Constructor of a Diagnostics object.
+
+        Args:
+            output_dir (str): the directory where the output files are written.
+            profile_duration (float): the length in seconds of the CPU profiles
+                triggered by a signal.
+        """
+
+        self._output_dir: str = output_dir
+        self._profile_duration: float = profile_duration
+        self._profiler: SamplingProfiler = SamplingProfiler()
+        self._memory_tracer: MemoryTracer = MemoryTracer()
+
+    @property
+    def memory_tracer(self) -> MemoryTracer:
+        return self._memory_tracer
+
+    def dump_thread_stacks(self, *_):
+        log.info("Stacks of all the Threads:\n%s", format_thread_stacks())
+
+    def start_profile(self, duration: float = None):
+        """Write a CPU profile of the next 'duration' seconds in the background."""
+
+        duration = duration or self._profile_duration
+        output_path = _get_output_path(self._output_dir, "cpu_profile", "collapsed")
+        log.info("Profiling the CPU for %ss...", duration)
+        self._profiler.start(duration, output_path)
+
+    def take_memory_snapshot(self):
+        """Take a memory snapshot in the background."""
+
+        output_path = _get_output_path(self._output_dir, "memory", "snapshot")
+        Thread(
+            target=self._memory_tracer.snapshot,
+            args=[output_path],
+            name="memory_snapshot",
+            daemon=True,
+        ).start()
+
+    def start_periodic_memory_snapshots(self, period: float):
+        """Take a memory snapshot every 'period' seconds.
+
+        Args:
+            period (float): the time between snapshots in seconds.
+        """
+
+        def take_snapshots():
+            while True:
+                self._memory_tracer.snapshot()
+                time.sleep(period)
+
+        Thread(
+            target=take_snapshots, name="periodic_memory_snapshots", daemon=True
+        ).start()
+
+    def install_signal_handlers(self):
+        """Install the signal handlers. Signals are only handled by the main Thread,
+        so the handlers return straight away and the work is done by other Threads.
+        """
+
+        if threading.current_thread() is not threading.main_thread():
+            log.warning("Diagnostics signal handlers can only be installed by main")
+            return
+
+        signal.signal(signal.SIGUSR1, self.dump_thread_stacks)
+        signal.signal(signal.SIGUSR2, lambda *_: self.start_profile())
+        if hasattr(signal, "SIGRTMIN"):
+            signal.signal(signal.SIGRTMIN, lambda *_: self.take_memory_snapshot())
+
+        log.debug("Diagnostics signal handlers installed")
+
+
+def install_diagnostics() -> Diagnostics:
+    """Set up the diagnostics of the process according to the env variables:
+    - DIAGNOSTICS_DIR: the directory where the output files are written;
+    - DIAGNOSTICS_PROFILE_SEC: the length of the CPU profiles triggered by SIGUSR2;
+    - DIAGNOSTICS_PROFILE_AT_START_SEC: if set, profile the CPU from the start
+      for this number of seconds;
+    - DIAGNOSTICS_TRACEMALLOC: if '1', trace the memory allocations from the start;
+    - DIAGNOSTICS_MEMORY_SNAPSHOT_PERIOD_SEC: if set, take a memory snapshot
+      with this period.
+    The fatal errors' tracebacks (e.g.: segmentation faults) are always printed.
+
+    Returns:
+        Diagnostics: the diagnostics of the process.
+    """
+
+    faulthandler.enable()
+
+    diagnostics = Diagnostics(
+        output_dir=os.getenv("DIAGNOSTICS_DIR", constant.DIAGNOSTICS_DIR),
+        profile_duration=float(
+            os.getenv("DIAGNOSTICS_PROFILE_SEC", constant.PROFILER_DURATION_SEC)
+        ),
+    )
+    diagnostics.install_signal_handlers()
+
+    if os.getenv("DIAGNOSTICS_TRACEMALLOC") == "1":
+        diagnostics.memory_tracer.start()
+
+    memory_snapshot_period = os.getenv("DIAGNOSTICS_MEMORY_SNAPSHOT_PERIOD_SEC")
+    if memory_snapshot_period:
+        diagnostics.start_periodic_memory_snapshots(float(memory_snapshot_period))
+
+    profile_at_start = os.getenv("DIAGNOSTICS_PROFILE_AT_START_SEC")
+    if profile_at_start:
+        diagnostics.start_profile(float(profile_at_start))
+
+    return diagnostics
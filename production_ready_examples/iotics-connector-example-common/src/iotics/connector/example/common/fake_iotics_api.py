@@ -0,0 +1,687 @@
+import json
+import logging
+from hashlib import blake2b
+from queue import Empty, Queue
+from random import Random
+from threading import Lock
+from time import sleep, time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Tuple
+
+import constants as constant
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+from iotics.api import (
+    common_pb2,
+    feed_pb2,
+    input_pb2,
+    interest_pb2,
+    search_pb2,
+    twin_pb2,
+)
+from iotics.lib.grpc.helpers import create_timestamp
+from iotics.lib.grpc.search import SearchApi
+
+log = logging.getLogger(__name__)
+
+# Used to unblock the streams when they are cancelled
+_CANCELLED = object()
+
+
+class FakeRpcError(grpc.RpcError):
+    """gRPC exception raised by the fake IOTICS host.
+    It exposes 'code()' and 'details()' like the exceptions raised by gRPC calls,
+    so 'expected_grpc_exception' handles it the same way."""
+
+    def __init__(self, code: grpc.StatusCode, details: str = ""):
+        super().__init__(details)
+        self._code: grpc.StatusCode = code
+        self._details: str = details
+
+    def code(self) -> grpc.StatusCode:
+        return self._code
+
+    def details(self) -> str:
+        return self._details
+
+    def __str__(self) -> str:
+        return f"<FakeRpcError {self._code.name}: {self._details}>"
+
+
+class FakeIoticsHost:
+    """In-process stand-in of an IOTICSpace. It keeps the Twins, the last data
+    shared by each Feed and the Feed/Input subscribers in memory, so several
+    Connectors of the same process can interact with each other.
+    Each operation can be delayed (latency) and can fail (error injection).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: grpc.StatusCode = grpc.StatusCode.UNAVAILABLE,
+        seed: int = None,
+    ):
+        """Constructor of a FakeIoticsHost object.
+
+        Args:
+            latency (float, optional): seconds added to each operation.
+            latency_jitter (float, optional): max random seconds added to the latency.
+            error_rate (float, optional): probability of an operation failing.
+            error_code (grpc.StatusCode, optional): the code of the errors injected.
+            seed (int, optional): seed of the latency jitter and error injection.
+        """
+
+        self._latency: float = latency
+        self._latency_jitter: float = latency_jitter
+        self._error_rate: float = error_rate
+        self._error_code: grpc.StatusCode = error_code
+        self._random: Random = Random(seed)
+
+        self._lock: Lock = Lock()
+        self._twins: Dict[str, twin_pb2.UpsertTwinRequest.Payload] = {}
+        self._last_stored: Dict[Tuple[str, str], common_pb2.FeedData] = {}
+        self._feed_subscribers: Dict[Tuple[str, str], List[Queue]] = {}
+        self._input_subscribers: Dict[Tuple[str, str], List[Queue]] = {}
+
+    @property
+    def host_id(self) -> str:
+        return constant.FAKE_HOST_ID
+
+    def simulate_call(self, operation: str, token: str):
+        """Apply the latency and the error injection to an operation
+        and check the token has not expired.
+
+        Args:
+            operation (str): the name of the operation.
+            token (str): the token used by the caller.
+        """
+
+        if self._latency or self._latency_jitter:
+            sleep(self._latency + self._random.uniform(0, self._latency_jitter))
+
+        if get_token_expiry(token) <= time():
+            raise FakeRpcError(grpc.StatusCode.UNAUTHENTICATED, "token expired")
+
+        if self._error_rate and self._random.random() < self._error_rate:
+            log.debug("Injecting %s error in '%s'", self._error_code.name, operation)
+            raise FakeRpcError(self._error_code, f"error injected in '{operation}'")
+
+    def upsert_twin(self, payload: twin_pb2.UpsertTwinRequest.Payload):
+        with self._lock:
+            self._twins[payload.twinId.id] = payload
+
+    def delete_twin(self, twin_did: str):
+        with self._lock:
+            self._twins.pop(twin_did, None)
+
+    def get_twin(self, twin_did: str) -> twin_pb2.UpsertTwinRequest.Payload:
+        with self._lock:
+            twin = self._twins.get(twin_did)
+
+        if not twin:
+            raise FakeRpcError(grpc.StatusCode.NOT_FOUND, f"Twin {twin_did} not found")
+
+        return twin
+
+    def search_twins(
+        self, filter_properties: List[common_pb2.Property], text: str = None
+    ) -> List[twin_pb2.UpsertTwinRequest.Payload]:
+        """Return the Twins including all the given Properties
+        (and the text in any of their Properties, if provided)."""
+
+        with self._lock:
+            twins = list(self._twins.values())
+
+        twins_found = []
+        for twin in twins:
+            if not all(
+                filter_property in twin.properties
+                for filter_property in filter_properties
+            ):
+                continue
+            if text and not any(
+                text.lower() in str(twin_property).lower()
+                for twin_property in twin.properties
+            ):
+                continue
+            twins_found.append(twin)
+
+        return twins_found
+
+    def share_feed_data(self, twin_did: str, feed_id: str, feed_data):
+        twin = self.get_twin(twin_did)
+        feed_key = (twin_did, feed_id)
+        if not any(feed.id == feed_id for feed in twin.feeds):
+            raise FakeRpcError(grpc.StatusCode.NOT_FOUND, f"Feed {feed_id} not found")
+
+        with self._lock:
+            self._last_stored[feed_key] = feed_data
+            subscribers = list(self._feed_subscribers.get(feed_key, []))
+
+        for subscriber in subscribers:
+            subscriber.put(feed_data)
+
+    def get_last_stored(self, twin_did: str, feed_id: str) -> common_pb2.FeedData:
+        with self._lock:
+            return self._last_stored.get((twin_did, feed_id))
+
+    def subscribe_feed(self, twin_did: str, feed_id: str) -> Queue:
+        subscriber = Queue()
+        with self._lock:
+            self._feed_subscribers.setdefault((twin_did, feed_id), []).append(
+                subscriber
+            )
+
+        return subscriber
+
+    def unsubscribe_feed(self, twin_did: str, feed_id: str, subscriber: Queue):
+        with self._lock:
+            subscribers = self._feed_subscribers.get((twin_did, feed_id), [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+
+    def send_input_message(
+        self, twin_did: str, input_id: str, input_message: input_pb2.InputMessage
+    ):
+        twin = self.get_twin(twin_did)
+        if not any(twin_input.id == input_id for twin_input in twin.inputs):
+            raise FakeRpcError(grpc.StatusCode.NOT_FOUND, f"Input {input_id} not found")
+
+        # Like in IOTICS, messages sent while nobody is receiving are lost
+        with self._lock:
+            subscribers = list(self._input_subscribers.get((twin_did, input_id), []))
+
+        for subscriber in subscribers:
+            subscriber.put(input_message)
+
+    def subscribe_input(self, twin_did: str, input_id: str) -> Queue:
+        subscriber = Queue()
+        with self._lock:
+            self._input_subscribers.setdefault((twin_did, input_id), []).append(
+                subscriber
+            )
+
+        return subscriber
+
+    def unsubscribe_input(self, twin_did: str, input_id: str, subscriber: Queue):
+        with self._lock:
+            subscribers = self._input_subscribers.get((twin_did, input_id), [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+
+
+class FakeStream:
+    """Iterator of the messages of a Feed or Input, behaving like
+    a gRPC server-streaming call: it raises an UNAUTHENTICATED error when
+    the token used to open it expires, a DEADLINE_EXCEEDED error after
+    the timeout and a CANCELLED error once cancelled."""
+
+    def __init__(
+        self,
+        subscriber: Queue,
+        make_response,
+        token_expiry: float,
+        unsubscribe,
+        timeout: float = None,
+        initial_items: list = None,
+    ):
+        self._subscriber: Queue = subscriber
+        self._make_response = make_response
+        self._token_expiry: float = token_expiry
+        self._unsubscribe = unsubscribe
+        self._deadline: float = time() + timeout if timeout else None
+        self._closed: bool = False
+
+        for item in initial_items or []:
+            self._subscriber.put(item)
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+
+        while True:
+            expiry = self._token_expiry
+            if self._deadline:
+                expiry = min(expiry, self._deadline)
+
+            try:
+                item = self._subscriber.get(timeout=max(expiry - time(), 0))
+            except Empty:
+                self._close()
+                if self._deadline and self._deadline <= time():
+                    raise FakeRpcError(
+                        grpc.StatusCode.DEADLINE_EXCEEDED, "deadline exceeded"
+                    )
+                raise FakeRpcError(grpc.StatusCode.UNAUTHENTICATED, "token expired")
+
+            if item is _CANCELLED:
+                self._close()
+                raise FakeRpcError(grpc.StatusCode.CANCELLED, "stream cancelled")
+
+            return self._make_response(item)
+
+    def _close(self):
+        if not self._closed:
+            self._closed = True
+            self._unsubscribe(self._subscriber)
+
+    def cancel(self):
+        """Stop the stream, like 'grpc.Future.cancel()'."""
+
+        self._subscriber.put(_CANCELLED)
+
+
+class _FakeFeedStub:
+    """Stand-in of the gRPC Feed stub used by 'share_encoded_feed_data'."""
+
+    def __init__(self, fake_iotics_api: "FakeIoticsApi"):
+        self._fake_iotics_api: FakeIoticsApi = fake_iotics_api
+
+    def ShareFeedData(self, request: feed_pb2.ShareFeedDataRequest):
+        self._fake_iotics_api.simulate_call("share_feed_data")
+        self._fake_iotics_api.host.share_feed_data(
+            twin_did=request.args.feedId.twinId,
+            feed_id=request.args.feedId.id,
+            feed_data=request.payload.sample,
+        )
+
+        return feed_pb2.ShareFeedDataResponse()
+
+
+class FakeIoticsApi:
+    """Stand-in of 'IoticsApi' implementing the subset of operations used by
+    the Connectors on top of a FakeIoticsHost. The token is read from the auth
+    object when the API is created and at any 'update_channel',
+    like the credentials of a real gRPC channel.
+    """
+
+    get_search_payload = staticmethod(SearchApi.get_search_payload)
+
+    def __init__(self, auth, host: FakeIoticsHost):
+        """Constructor of a FakeIoticsApi object.
+
+        Args:
+            auth: the object providing the token (e.g.: a FakeIdentity).
+            host (FakeIoticsHost): the fake IOTICSpace.
+        """
+
+        self._auth = auth
+        self._host: FakeIoticsHost = host
+        self._token: str = auth.get_token()
+        self.feed_api = SimpleNamespace(stub=_FakeFeedStub(self))
+
+    @property
+    def auth(self):
+        return self._auth
+
+    @property
+    def host(self) -> FakeIoticsHost:
+        return self._host
+
+    def update_channel(self, channel=None):
+        self._token = self._auth.get_token()
+
+    def simulate_call(self, operation: str):
+        self._host.simulate_call(operation, self._token)
+
+    def get_local_host_id(self, headers=None) -> str:
+        return self._host.host_id
+
+    def upsert_twin(
+        self,
+        twin_did: str,
+        location: common_pb2.GeoLocation = None,
+        properties: List[common_pb2.Property] = None,
+        feeds: List[feed_pb2.UpsertFeedWithMeta] = None,
+        inputs: List[input_pb2.UpsertInputWithMeta] = None,
+        headers=None,
+    ) -> twin_pb2.UpsertTwinResponse:
+        self.simulate_call("upsert_twin")
+        self._host.upsert_twin(
+            twin_pb2.UpsertTwinRequest.Payload(
+                twinId=common_pb2.TwinID(id=twin_did),
+                location=location,
+                properties=properties,
+                feeds=feeds,
+                inputs=inputs,
+            )
+        )
+
+        return twin_pb2.UpsertTwinResponse(
+            payload=twin_pb2.UpsertTwinResponse.Payload(
+                twinId=common_pb2.TwinID(id=twin_did)
+            )
+        )
+
+    def delete_twin(self, twin_did: str, headers=None) -> twin_pb2.DeleteTwinResponse:
+        self.simulate_call("delete_twin")
+        self._host.delete_twin(twin_did)
+
+        return twin_pb2.DeleteTwinResponse(
+            payload=twin_pb2.DeleteTwinResponse.Payload(
+                twinId=common_pb2.TwinID(id=twin_did)
+            )
+        )
+
+    def describe_twin(
+        self, twin_did: str, remote_host_id: str = None, headers=None
+    ) -> twin_pb2.DescribeTwinResponse:
+        self.simulate_call("describe_twin")
+        twin = self._host.get_twin(twin_did)
+
+        return twin_pb2.DescribeTwinResponse(
+            payload=twin_pb2.DescribeTwinResponse.Payload(
+                twinId=common_pb2.TwinID(id=twin_did, hostId=self._host.host_id),
+                result=twin_pb2.DescribeTwinResponse.MetaResult(
+                    location=twin.location if twin.HasField("location") else None,
+                    properties=twin.properties,
+                    feeds=[
+                        twin_pb2.FeedMeta(
+                            feedId=feed_pb2.FeedID(id=feed.id, twinId=twin_did),
+                            storeLast=feed.storeLast,
+                        )
+                        for feed in twin.feeds
+                    ],
+                    inputs=[
+                        twin_pb2.InputMeta(
+                            inputId=input_pb2.InputID(id=twin_input.id, twinId=twin_did)
+                        )
+                        for twin_input in twin.inputs
+                    ],
+                ),
+            )
+        )
+
+    def search_iter(
+        self,
+        client_app_id: str,
+        payload: search_pb2.SearchRequest.Payload,
+        scope=common_pb2.Scope.LOCAL,
+        lang: str = None,
+        timeout: int = 3,
+    ) -> Iterator[search_pb2.SearchResponse]:
+        self.simulate_call("search_iter")
+        twins_found = self._host.search_twins(
+            filter_properties=list(payload.filter.properties),
+            text=payload.filter.text.value if payload.filter.HasField("text") else None,
+        )
+
+        yield search_pb2.SearchResponse(
+            headers=common_pb2.Headers(clientAppId=client_app_id),
+            payload=search_pb2.SearchResponse.Payload(
+                responseType=payload.responseType,
+                hostId=self._host.host_id,
+                twins=[
+                    search_pb2.SearchResponse.TwinDetails(
+                        twinId=common_pb2.TwinID(
+                            id=twin.twinId.id, hostId=self._host.host_id
+                        ),
+                        location=twin.location if twin.HasField("location") else None,
+                        properties=twin.properties,
+                        feeds=[
+                            search_pb2.SearchResponse.FeedDetails(
+                                feedId=feed_pb2.FeedID(
+                                    id=feed.id, twinId=twin.twinId.id
+                                ),
+                                storeLast=feed.storeLast,
+                                properties=feed.properties,
+                            )
+                            for feed in twin.feeds
+                        ],
+                        inputs=[
+                            search_pb2.SearchResponse.InputDetails(
+                                inputId=input_pb2.InputID(
+                                    id=twin_input.id, twinId=twin.twinId.id
+                                ),
+                                properties=twin_input.properties,
+                            )
+                            for twin_input in twin.inputs
+                        ],
+                    )
+                    for twin in twins_found
+                ],
+            ),
+        )
+
+    def share_feed_data(
+        self,
+        twin_did: str,
+        feed_id: str,
+        data: dict,
+        occurred_at: int = None,
+        headers=None,
+    ) -> feed_pb2.ShareFeedDataResponse:
+        self.simulate_call("share_feed_data")
+        self._host.share_feed_data(
+            twin_did=twin_did,
+            feed_id=feed_id,
+            feed_data=common_pb2.FeedData(
+                occurredAt=Timestamp(seconds=occurred_at or int(time())),
+                mime=constant.MIME_JSON,
+                data=json.dumps(data).encode(),
+            ),
+        )
+
+        return feed_pb2.ShareFeedDataResponse()
+
+    def _make_interest(
+        self, follower_twin_did: str, followed_twin_did: str, followed_feed_id: str
+    ) -> interest_pb2.Interest:
+        return interest_pb2.Interest(
+            followerTwinId=common_pb2.TwinID(id=follower_twin_did),
+            followedFeedId=feed_pb2.FeedID(
+                id=followed_feed_id, twinId=followed_twin_did
+            ),
+        )
+
+    def fetch_interests(
+        self,
+        follower_twin_did: str,
+        followed_twin_did: str,
+        followed_feed_id: str,
+        remote_host_id: str = None,
+        fetch_last_stored: bool = True,
+        headers=None,
+    ) -> FakeStream:
+        self.simulate_call("fetch_interests")
+        self._host.get_twin(followed_twin_did)
+
+        interest = self._make_interest(
+            follower_twin_did, followed_twin_did, followed_feed_id
+        )
+        last_stored = self._host.get_last_stored(followed_twin_did, followed_feed_id)
+
+        def make_response(feed_data) -> interest_pb2.FetchInterestResponse:
+            return interest_pb2.FetchInterestResponse(
+                payload=interest_pb2.FetchInterestResponse.Payload(
+                    interest=interest, feedData=feed_data
+                )
+            )
+
+        def unsubscribe(subscriber: Queue):
+            self._host.unsubscribe_feed(followed_twin_did, followed_feed_id, subscriber)
+
+        return FakeStream(
+            subscriber=self._host.subscribe_feed(followed_twin_did, followed_feed_id),
+            make_response=make_response,
+            token_expiry=get_token_expiry(self._token),
+            unsubscribe=unsubscribe,
+            initial_items=[last_stored] if fetch_last_stored and last_stored else None,
+        )
+
+    def fetch_last_stored(
+        self,
+        follower_twin_did: str,
+        followed_twin_did: str,
+        followed_feed_id: str,
+        remote_host_id: str = None,
+        headers=None,
+    ) -> interest_pb2.FetchInterestResponse:
+        self.simulate_call("fetch_last_stored")
+        last_stored = self._host.get_last_stored(followed_twin_did, followed_feed_id)
+        if not last_stored:
+            raise FakeRpcError(grpc.StatusCode.NOT_FOUND, "No data stored")
+
+        return interest_pb2.FetchInterestResponse(
+            payload=interest_pb2.FetchInterestResponse.Payload(
+                interest=self._make_interest(
+                    follower_twin_did, followed_twin_did, followed_feed_id
+                ),
+                feedData=last_stored,
+            )
+        )
+
+    def send_input_message(
+        self,
+        message,
+        sender_twin_did: str,
+        receiver_twin_did: str,
+        input_id: str,
+        mime_type: str = constant.MIME_JSON,
+        remote_host_id: str = None,
+        headers=None,
+    ) -> interest_pb2.SendInputMessageResponse:
+        self.simulate_call("send_input_message")
+        self._host.send_input_message(
+            twin_did=receiver_twin_did,
+            input_id=input_id,
+            input_message=input_pb2.InputMessage(
+                occurredAt=create_timestamp(),
+                mime=mime_type,
+                data=json.dumps(message).encode(),
+            ),
+        )
+
+        return interest_pb2.SendInputMessageResponse()
+
+    def receive_input_messages(
+        self, twin_did: str, input_id: str, timeout: int = None, headers=None
+    ) -> FakeStream:
+        self.simulate_call("receive_input_messages")
+        self._host.get_twin(twin_did)
+
+        input_id_message = input_pb2.InputID(id=input_id, twinId=twin_did)
+
+        def make_response(input_message) -> input_pb2.ReceiveInputMessageResponse:
+            return input_pb2.ReceiveInputMessageResponse(
+                payload=input_pb2.ReceiveInputMessageResponse.Payload(
+                    inputId=input_id_message, message=input_message
+                )
+            )
+
+        def unsubscribe(subscriber: Queue):
+            self._host.unsubscribe_input(twin_did, input_id, subscriber)
+
+        return FakeStream(
+            subscriber=self._host.subscribe_input(twin_did, input_id),
+            make_response=make_response,
+            token_expiry=get_token_expiry(self._token),
+            unsubscribe=unsubscribe,
+            timeout=timeout,
+        )
+
+
+class FakeIdentity:
+    """Stand-in of 'Identity' that doesn't need a resolver. Twin DIDs are derived
+    from the Twin key names, so they are stable across runs, and tokens
+    are fake strings carrying their expiry time.
+    """
+
+    def __init__(
+        self,
+        agent_key_name: str = "fake_agent",
+        token_duration: int = constant.FAKE_TOKEN_DURATION_SEC,
+    ):
+        self._agent_key_name: str = agent_key_name
+        self._token_duration: int = token_duration
+        self._user_identity = SimpleNamespace(did=make_fake_did("fake_user"))
+        self._agent_identity = SimpleNamespace(did=make_fake_did(agent_key_name))
+        self._token: str = None
+        self._token_last_updated: float = None
+        self._token_refresh_period: int = int(
+            self._token_duration * constant.TOKEN_REFRESH_PERIOD_PERCENT
+        )
+
+        self._refresh_token()
+
+    @property
+    def user_identity(self):
+        return self._user_identity
+
+    @property
+    def agent_identity(self):
+        return self._agent_identity
+
+    @property
+    def token_last_updated(self) -> float:
+        return self._token_last_updated
+
+    @property
+    def token_duration(self) -> int:
+        return int(self._token_duration)
+
+    @property
+    def token_refresh_period(self) -> int:
+        return self._token_refresh_period
+
+    def get_host(self) -> str:
+        return constant.FAKE_HOST_ID
+
+    def get_token(self) -> str:
+        return self._token
+
+    def _refresh_token(self):
+        self._token_last_updated = time()
+        self._token = make_fake_token(self._token_last_updated + self._token_duration)
+
+    def create_twin_with_control_delegation(
+        self, twin_key_name: str, twin_seed: str = None
+    ):
+        return SimpleNamespace(
+            did=make_fake_did(f"{self._agent_key_name}/{twin_key_name}")
+        )
+
+    def auto_refresh_token(
+        self,
+        refresh_token_lock: Lock,
+        iotics_api: FakeIoticsApi,
+        token_refresh_period_percent: float = constant.TOKEN_REFRESH_PERIOD_PERCENT,
+    ):
+        """Same behaviour as 'Identity.auto_refresh_token'."""
+
+        self._token_refresh_period = int(
+            self._token_duration * token_refresh_period_percent
+        )
+
+        while True:
+            time_to_refresh: float = self._token_refresh_period - (
+                time() - self._token_last_updated
+            )
+            sleep(max(time_to_refresh, 0))
+            with refresh_token_lock:
+                self._refresh_token()
+                iotics_api.update_channel()
+
+            log.debug("Fake token refreshed correctly")
+
+
+def make_fake_did(key_name: str) -> str:
+    return "did:iotics:" + blake2b(key_name.encode(), digest_size=16).hexdigest()
+
+
+def make_fake_token(expiry: float) -> str:
+    return f"{constant.FAKE_TOKEN_PREFIX}{expiry}"
+
+
+def get_token_expiry(token: str) -> float:
+    """Return the expiry time of a fake token (0 if the token is not valid)."""
+
+    if not token or not token.startswith(constant.FAKE_TOKEN_PREFIX):
+        return 0
+
+    return float(token[len(constant.FAKE_TOKEN_PREFIX) :])
@@ -0,0 +1,88 @@
+import json
+import logging
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+# Use the fastest JSON backend available, falling back to the standard library.
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+
+        _loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        _loads = json.loads
+        JSON_BACKEND = "json"
+
+
+def decode_json_payload(data: bytes) -> dict:
+    """Parse a JSON payload with the fastest JSON backend available.
+
+    Args:
+        data (bytes): the raw payload.
+
+    Returns:
+        dict: the payload parsed.
+    """
+
+    return _loads(data)
+
+
+class OccurredAt:
+    """Timestamp of a Feed or Input message kept as integer seconds/nanos.
+    The conversion to a datetime string is only made (once) when needed.
+    """
+
+    __slots__ = ("seconds", "nanos", "_formatted")
+
+    def __init__(self, seconds: int, nanos: int = 0):
+        self.seconds: int = seconds
+        self.nanos: int = nanos
+        self._formatted: str = None
+
+    @classmethod
+    def from_timestamp(cls, timestamp) -> "OccurredAt":
+        """Build an OccurredAt from a protobuf Timestamp.
+
+        Args:
+            timestamp: the protobuf Timestamp of the message.
+
+        Returns:
+            OccurredAt: the timestamp of the message.
+        """
+
+        return cls(timestamp.seconds, timestamp.nanos)
+
+    @property
+    def unix_time(self) -> float:
+        return self.seconds + self.nanos / 1e9
+
+    def to_datetime(self) -> datetime:
+        return datetime.fromtimestamp(self.seconds)
+
+    def __str__(self) -> str:
+        if self._formatted is None:
+            self._formatted = str(datetime.fromtimestamp(self.seconds))
+
+        return self._formatted
+
+    def __repr__(self) -> str:
+        return f"OccurredAt(seconds={self.seconds}, nanos={self.nanos})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, OccurredAt):
+            return NotImplemented
+
+        return (self.seconds, self.nanos) == (other.seconds, other.nanos)
+
+    def __lt__(self, other: "OccurredAt") -> bool:
+        return (self.seconds, self.nanos) < (other.seconds, other.nanos)
+
+    def __hash__(self) -> int:
+        return hash((self.seconds, self.nanos))
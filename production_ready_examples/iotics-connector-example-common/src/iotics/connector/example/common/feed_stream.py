@@ -0,0 +1,412 @@
+import heapq
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable, Iterator, List, Tuple
+
+import constants as constant
+import grpc
+from iotics.api import common_pb2, interest_pb2
+from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import registry
+from retry_policy import CircuitOpenError, RetryError
+from scheduler import get_phase
+from utilities import retry_on_exception
+
+log = logging.getLogger(__name__)
+
+FEED_STREAM_HANDOVERS = registry.counter(
+    "iotics_feed_stream_handovers_total",
+    "Number of Feed streams replaced before their token expired, by outcome",
+    ["status"],
+)
+FEED_STREAM_DUPLICATES = registry.counter(
+    "iotics_feed_stream_duplicates_total",
+    "Number of samples received by both a Feed stream and its replacement",
+)
+
+
+class FeedStreamManager:
+    """Follow a Feed across token refreshes without losing data.
+    A Feed stream ('fetch_interests') fails when the token it was opened with
+    expires: instead of waiting for that and opening a new stream afterwards,
+    losing the samples shared in between, 'renew' (called periodically,
+    see 'FeedStreamRenewer') opens the replacement stream with the latest
+    token while the current one is still open, and 'close_replaced_streams'
+    closes the latter once the streams have overlapped for a while.
+    The iterator keeps reading the stream it started with until it is closed,
+    then moves on to the current one: meanwhile the samples of the new stream
+    are held by gRPC, subject to its flow control. The samples received by both
+    streams during the overlap (same occurredAt and data) are dropped.
+    """
+
+    def __init__(
+        self,
+        iotics_api: IoticsApi,
+        refresh_token_lock: Lock,
+        follower_twin_did: str,
+        followed_twin_did: str,
+        followed_feed_id: str,
+        dedupe_size: int = constant.FEED_STREAM_DEDUPE_SIZE,
+    ):
+        """Constructor of a FeedStreamManager object.
+
+        Args:
+            iotics_api (IoticsApi): the IOTICS gRPC API used to open the streams.
+            refresh_token_lock (Lock): used to prevent race conditions.
+            follower_twin_did (str): the Twin following the Feed.
+            followed_twin_did (str): the Twin sharing the Feed.
+            followed_feed_id (str): the Feed to follow.
+            dedupe_size (int): number of recent samples checked for duplicates.
+        """
+
+        self._iotics_api: IoticsApi = iotics_api
+        self._refresh_token_lock: Lock = refresh_token_lock
+        self._follower_twin_did: str = follower_twin_did
+        self._followed_twin_did: str = followed_twin_did
+        self._followed_feed_id: str = followed_feed_id
+        self._dedupe_size: int = dedupe_size
+
+        self._current_stream = None
+        self._current_stream_n: int = None
+        self._streams_n: int = 0
+        self._replaced_streams: list = []
+        self._lock: Lock = Lock()
+        # By recent sample, the number of the stream that received it
+        self._recent_samples: OrderedDict = OrderedDict()
+
+    @property
+    def followed_twin_did(self) -> str:
+        return self._followed_twin_did
+
+    @property
+    def followed_feed_id(self) -> str:
+        return self._followed_feed_id
+
+    @property
+    def stream_key(self) -> str:
+        return f"{self._follower_twin_did}/{self._followed_twin_did}/{self._followed_feed_id}"
+
+    def _open_stream(self):
+        """Open a new stream and make it the current one.
+
+        Returns:
+            the previous stream, if any.
+        """
+
+        feed_listener = retry_on_exception(
+            grpc_operation=self._iotics_api.fetch_interests,
+            function_name="fetch_interests",
+            refresh_token_lock=self._refresh_token_lock,
+            follower_twin_did=self._follower_twin_did,
+            followed_twin_did=self._followed_twin_did,
+            followed_feed_id=self._followed_feed_id,
+            # 'fetch_last_stored' is set to False otherwise
+            # at any new stream we would get the last shared value again
+            fetch_last_stored=False,
+        )
+
+        with self._lock:
+            self._streams_n += 1
+            previous_stream = self._current_stream
+            self._current_stream = feed_listener
+            self._current_stream_n = self._streams_n
+
+        return previous_stream
+
+    def _is_duplicate(self, stream_n: int, feed_data: common_pb2.FeedData) -> bool:
+        occurred_at = feed_data.occurredAt
+        sample_key = (occurred_at.seconds, occurred_at.nanos, hash(feed_data.data))
+
+        received_by = self._recent_samples.get(sample_key)
+        if received_by is not None and received_by != stream_n:
+            return True
+
+        self._recent_samples[sample_key] = stream_n
+        if len(self._recent_samples) > self._dedupe_size:
+            self._recent_samples.popitem(last=False)
+
+        return False
+
+    def renew(self) -> bool:
+        """Replace the current stream with one opened with the current token.
+        The replaced stream stays open until 'close_replaced_streams' is called.
+
+        Returns:
+            bool: whether the stream has been replaced.
+        """
+
+        with self._lock:
+            # The next iteration will open a new stream anyway
+            if self._current_stream is None:
+                return False
+
+        try:
+            previous_stream = self._open_stream()
+        except RetryError as ex:
+            FEED_STREAM_HANDOVERS.labels("failed").inc()
+            log.warning(
+                "Can't renew the stream of Twin %s, Feed %s: %s",
+                self._followed_twin_did,
+                self._followed_feed_id,
+                ex,
+            )
+            return False
+
+        FEED_STREAM_HANDOVERS.labels("ok").inc()
+        if previous_stream:
+            with self._lock:
+                self._replaced_streams.append(previous_stream)
+
+        return True
+
+    def close_replaced_streams(self):
+        """Close the streams replaced by 'renew'."""
+
+        with self._lock:
+            replaced_streams = self._replaced_streams
+            self._replaced_streams = []
+
+        for replaced_stream in replaced_streams:
+            replaced_stream.cancel()
+
+    def reset(self):
+        """Close the current stream (e.g.: when it stopped receiving data):
+        the iteration raises its CANCELLED error and a new stream is opened.
+        """
+
+        with self._lock:
+            current_stream = self._current_stream
+
+        if current_stream:
+            current_stream.cancel()
+
+    def open(self):
+        """Open a new stream if none is open. The samples received
+        are kept until they are iterated.
+        """
+
+        with self._lock:
+            stream_needed = self._current_stream is None
+
+        if stream_needed:
+            previous_stream = self._open_stream()
+            # Opened by a concurrent 'renew'
+            if previous_stream:
+                previous_stream.cancel()
+
+    def fetch_last_stored(self) -> interest_pb2.FetchInterestResponse:
+        """Return the last sample stored by the Host for the Feed, if any.
+        If the stream receives the same sample, it is dropped as a duplicate.
+
+        Returns:
+            FetchInterestResponse: the last sample stored, None if there isn't any
+                or it couldn't be fetched.
+        """
+
+        try:
+            last_stored_feed_data = retry_on_exception(
+                grpc_operation=self._iotics_api.fetch_last_stored,
+                function_name="fetch_last_stored",
+                refresh_token_lock=self._refresh_token_lock,
+                follower_twin_did=self._follower_twin_did,
+                followed_twin_did=self._followed_twin_did,
+                followed_feed_id=self._followed_feed_id,
+            )
+        except CircuitOpenError:
+            raise
+        except RetryError as ex:
+            if (
+                ex.last_exception
+                and ex.last_exception.code() != grpc.StatusCode.NOT_FOUND
+            ):
+                log.warning(
+                    "Can't fetch the last sample of Twin %s, Feed %s: %s",
+                    self._followed_twin_did,
+                    self._followed_feed_id,
+                    ex,
+                )
+            return None
+
+        # Stream number 0 is never used by a stream
+        self._is_duplicate(0, last_stored_feed_data.payload.feedData)
+
+        return last_stored_feed_data
+
+    def __iter__(self) -> Iterator[interest_pb2.FetchInterestResponse]:
+        """Return the samples of the Feed, opening a new stream if none is open.
+        The iteration stops (or raises the exception of the stream) when
+        the current stream ends without being replaced.
+        """
+
+        self.open()
+        with self._lock:
+            feed_listener = self._current_stream
+            stream_n = self._current_stream_n
+
+        while feed_listener is not None:
+            try:
+                for latest_feed_data in feed_listener:
+                    if self._is_duplicate(stream_n, latest_feed_data.payload.feedData):
+                        FEED_STREAM_DUPLICATES.inc()
+                        continue
+
+                    yield latest_feed_data
+                error = None
+            except grpc.RpcError as ex:
+                error = ex
+
+            with self._lock:
+                is_current_stream = feed_listener is self._current_stream
+                if is_current_stream:
+                    self._current_stream = None
+                    self._current_stream_n = None
+                else:
+                    # The end of a replaced stream (e.g.: cancelled) is expected:
+                    # move on to the stream replacing it
+                    log.debug("Replaced stream #%d closed: %s", stream_n, error)
+                    feed_listener = self._current_stream
+                    stream_n = self._current_stream_n
+
+            if is_current_stream:
+                if error:
+                    raise error
+                return
+
+
+class FeedStreamRenewer:
+    """Renew the Feed streams of a Connector before their token expires without
+    reopening all of them at the same time. The token is expected to be
+    refreshed early (see 'FEED_STREAM_TOKEN_REFRESH_PERIOD_PERCENT'),
+    so a stream opened with any token
+    can be renewed up to a renewal period later, i.e.: the time a token is still
+    valid after the next refresh, minus the overlap of the streams and a margin.
+    Each stream is renewed once per renewal period at a stable offset derived
+    from its key (see 'get_phase'), with the latest token: with thousands
+    of streams the reconnections are spread evenly over the whole period
+    rather than bunched after each token refresh.
+    The replaced streams are closed 'overlap' seconds after their renewal.
+    """
+
+    def __init__(
+        self,
+        iotics_identity,
+        overlap: float = constant.FEED_STREAM_OVERLAP_SEC,
+        margin: float = constant.FEED_STREAM_RENEWAL_MARGIN_SEC,
+        workers_n: int = constant.FEED_STREAM_RENEWAL_WORKERS,
+    ):
+        """Constructor of a FeedStreamRenewer object.
+
+        Args:
+            iotics_identity (Identity): the Identity refreshing the token.
+            overlap (float): how long (in seconds) both streams are open.
+            margin (float): time (in seconds) left before the token of a stream
+                expires when it is renewed at the latest.
+            workers_n (int): number of threads opening the new streams.
+        """
+
+        self._iotics_identity = iotics_identity
+        self._overlap: float = overlap
+        self._margin: float = margin
+        self._workers_n: int = workers_n
+
+        # The renewal offsets of the streams are relative to this time
+        self._epoch: float = monotonic()
+        # The renewals and closures due, by time
+        self._heap: List[Tuple[float, int, Callable]] = []
+        self._sequence = count()
+        self._condition: Condition = Condition()
+        self._executor: ThreadPoolExecutor = None
+
+        registry.gauge(
+            "iotics_feed_stream_renewer_tasks_pending",
+            "Number of Feed stream renewals and closures scheduled",
+            function=lambda: len(self._heap),
+        )
+
+    def _get_renewal_period(self) -> float:
+        token_duration = self._iotics_identity.token_duration
+        token_refresh_period = self._iotics_identity.token_refresh_period
+        # A stream may have been opened with a token refreshed a whole
+        # refresh period ago: it must be renewed before that token expires
+        renewal_period = (
+            token_duration - token_refresh_period - self._overlap - self._margin
+        )
+        if renewal_period < 1:
+            log.warning(
+                "Token duration of %ss too short to renew the Feed streams in time",
+                token_duration,
+            )
+
+        return max(renewal_period, 1)
+
+    def add_feed_stream(self, feed_stream: FeedStreamManager):
+        """Renew a Feed stream once per renewal period from now on.
+
+        Args:
+            feed_stream (FeedStreamManager): the Feed stream to renew.
+        """
+
+        renewal_period = self._get_renewal_period()
+        phase = get_phase(feed_stream.stream_key, renewal_period)
+        # The next time, from now, matching the offset of the stream
+        now = monotonic()
+        due_at = now + (self._epoch + phase - now) % renewal_period
+
+        self._schedule_at(due_at, partial(self._renew, feed_stream, due_at))
+
+    def _schedule_at(self, due_at: float, function: Callable):
+        with self._condition:
+            heapq.heappush(self._heap, (due_at, next(self._sequence), function))
+            self._condition.notify()
+
+    def _schedule(self, delay: float, function: Callable):
+        self._schedule_at(monotonic() + delay, function)
+
+    def _renew(self, feed_stream: FeedStreamManager, due_at: float):
+        # Scheduled from the previous due time, so that delays don't accumulate
+        next_due_at = due_at + self._get_renewal_period()
+        self._schedule_at(next_due_at, partial(self._renew, feed_stream, next_due_at))
+
+        try:
+            renewed = feed_stream.renew()
+        except Exception as ex:
+            log.exception("Exception raised renewing a Feed stream: %s", ex)
+            return
+
+        if renewed:
+            self._schedule(self._overlap, feed_stream.close_replaced_streams)
+
+    def _scheduler_loop(self):
+        while True:
+            with self._condition:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                due_at, _, function = self._heap[0]
+                time_to_run = due_at - monotonic()
+                if time_to_run > 0:
+                    self._condition.wait(time_to_run)
+                    continue
+
+                heapq.heappop(self._heap)
+
+            self._executor.submit(function)
+
+    def start(self):
+        """Start renewing the Feed streams."""
+
+        if self._executor:
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers_n, thread_name_prefix="feed_stream_renewal"
+        )
+        Thread(
+            target=self._scheduler_loop, name="feed_stream_renewer", daemon=True
+        ).start()
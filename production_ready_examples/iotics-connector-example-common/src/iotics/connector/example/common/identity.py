@@ -1,7 +1,7 @@
 import logging
 from datetime import datetime, timedelta
 from threading import Lock
-from time import sleep, time
+from time import perf_counter, sleep, time
 
 import constants as constant
 from iotics.lib.grpc.auth import AuthInterface
@@ -11,10 +11,15 @@ from iotics.lib.identity.api.high_level_api import (
     RegisteredIdentity,
     get_rest_high_level_identity_api,
 )
+from metrics import registry
 from utilities import check_global_var
 
 log = logging.getLogger(__name__)
 
+TOKEN_REFRESH_DURATION = registry.histogram(
+    "iotics_token_refresh_duration_seconds", "Time taken to generate a new IOTICS token"
+)
+
 
 class Identity(AuthInterface):
     def __init__(
@@ -40,6 +45,9 @@ class Identity(AuthInterface):
         self._agent_identity: RegisteredIdentity = None
         self._token: str = None
         self._token_last_updated: float = None
+        self._token_refresh_period: int = int(
+            self._token_duration * constant.TOKEN_REFRESH_PERIOD_PERCENT
+        )
 
         self._initialise()
 
@@ -88,6 +96,10 @@ class Identity(AuthInterface):
     def token_duration(self) -> int:
         return int(self._token_duration)
 
+    @property
+    def token_refresh_period(self) -> int:
+        return self._token_refresh_period
+
     def get_host(self) -> str:
         return self._grpc_endpoint
 
@@ -100,11 +112,13 @@ class Identity(AuthInterface):
         is aware of when to generate a new token.
         """
 
+        started_at = perf_counter()
         self._token: str = self._high_level_identity_api.create_agent_auth_token(
             agent_registered_identity=self._agent_identity,
             user_did=self._user_identity.did,
             duration=self._token_duration,
         )
+        TOKEN_REFRESH_DURATION.observe(perf_counter() - started_at)
         self._token_last_updated = time()
 
         log.debug(
@@ -146,19 +160,30 @@ class Identity(AuthInterface):
 
         return twin_identity
 
-    def auto_refresh_token(self, refresh_token_lock: Lock, iotics_api: IoticsApi):
+    def auto_refresh_token(
+        self,
+        refresh_token_lock: Lock,
+        iotics_api: IoticsApi,
+        token_refresh_period_percent: float = constant.TOKEN_REFRESH_PERIOD_PERCENT,
+    ):
         """Automatically refresh then IOTICS token before it expires.
 
         Args:
             refresh_token_lock (Lock): used to prevent race conditions.
             iotics_api (IoticsApi): the instance of IOTICS gRPC API
                 used to execute Twins operations.
+            token_refresh_period_percent (float, optional): after which part
+                of its duration the token is refreshed.
         """
 
-        token_period = int(self._token_duration * constant.TOKEN_REFRESH_PERIOD_PERCENT)
+        self._token_refresh_period = int(
+            self._token_duration * token_refresh_period_percent
+        )
 
         while True:
-            time_to_refresh: int = token_period - (time() - self._token_last_updated)
+            time_to_refresh: int = self._token_refresh_period - (
+                time() - self._token_last_updated
+            )
             sleep(time_to_refresh)
             with refresh_token_lock:
                 self._refresh_token()
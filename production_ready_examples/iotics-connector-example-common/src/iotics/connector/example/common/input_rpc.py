@@ -0,0 +1,311 @@
+import heapq
+import logging
+import random
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from functools import partial
+from itertools import count
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Dict, List, Tuple
+from uuid import uuid4
+
+import constants as constant
+import grpc
+from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import registry
+from utilities import RPC_CALLS, expected_grpc_exception, wait_for_token_refresh
+
+log = logging.getLogger(__name__)
+
+INPUT_RPC_REQUESTS = registry.counter(
+    "iotics_input_rpc_requests_total",
+    "Number of requests sent over Inputs, by outcome",
+    ["input_id", "status"],
+)
+INPUT_RPC_DURATION = registry.histogram(
+    "iotics_input_rpc_duration_seconds",
+    "Time between a request sent over Inputs and its reply",
+    ["input_id"],
+)
+INPUT_RPC_RESENDS = registry.counter(
+    "iotics_input_rpc_resends_total",
+    "Number of requests resent over Inputs because no reply was received",
+    ["input_id"],
+)
+
+
+def add_correlation_id(message: dict, request_data: dict) -> dict:
+    """Add the correlation ID of a request, if any, to the message replying to it.
+
+    Args:
+        message (dict): the reply message.
+        request_data (dict): the data of the request received.
+
+    Returns:
+        dict: the reply message.
+    """
+
+    correlation_id = request_data.get(constant.CORRELATION_ID_VALUE)
+    if correlation_id:
+        message = {**message, constant.CORRELATION_ID_VALUE: correlation_id}
+
+    return message
+
+
+class _PendingRequest:
+    __slots__ = (
+        "future",
+        "receiver_twin_did",
+        "input_id",
+        "message",
+        "timeout",
+        "sent_at",
+        "deadline",
+        "backoff",
+    )
+
+    def __init__(
+        self,
+        future: Future,
+        receiver_twin_did: str,
+        input_id: str,
+        message: dict,
+        timeout: float,
+        backoff: float,
+    ):
+        self.future: Future = future
+        self.receiver_twin_did: str = receiver_twin_did
+        self.input_id: str = input_id
+        self.message: dict = message
+        self.timeout: float = timeout
+        self.sent_at: float = monotonic()
+        self.deadline: float = self.sent_at + timeout
+        self.backoff: float = backoff
+
+
+class InputRpcClient:
+    """Request/response calls over IOTICS Inputs. Each request is sent to
+    the receiver Twin's Input with a new correlation ID and a Future is returned.
+    The receiver replies to one of the sender Twin's Inputs with the same
+    correlation ID (see 'add_correlation_id'): the sender's Input listener passes
+    the replies to 'resolve', which completes the matching Future.
+    Until a reply is received, the request is resent with exponential backoff
+    and jitter, so replies arrive after about a network round trip
+    while an unresponsive receiver isn't flooded.
+    The resends of all the requests are scheduled by a single Thread, from a heap
+    ordered by their due time, and sent by a small pool of workers.
+    """
+
+    def __init__(
+        self,
+        iotics_api: IoticsApi,
+        refresh_token_lock: Lock,
+        sender_twin_did: str,
+        timeout: float = constant.INPUT_RPC_TIMEOUT_SEC,
+        initial_backoff: float = constant.INPUT_RPC_INITIAL_BACKOFF_SEC,
+        max_backoff: float = constant.INPUT_RPC_MAX_BACKOFF_SEC,
+        workers_n: int = constant.INPUT_RPC_WORKERS,
+    ):
+        """Constructor of an InputRpcClient object.
+
+        Args:
+            iotics_api (IoticsApi): the IOTICS gRPC API used to send the requests.
+            refresh_token_lock (Lock): used to prevent race conditions.
+            sender_twin_did (str): the Twin sending the requests and receiving the replies.
+            timeout (float): how long (in seconds) to wait for a reply by default.
+            initial_backoff (float): the max time (in seconds) before the first resend.
+            max_backoff (float): the max time (in seconds) between resends.
+            workers_n (int): number of threads sending the requests.
+        """
+
+        self._iotics_api: IoticsApi = iotics_api
+        self._refresh_token_lock: Lock = refresh_token_lock
+        self._sender_twin_did: str = sender_twin_did
+        self._timeout: float = timeout
+        self._initial_backoff: float = initial_backoff
+        self._max_backoff: float = max_backoff
+        self._pending_requests: Dict[str, _PendingRequest] = {}
+        self._lock: Lock = Lock()
+
+        # The resends due, by time
+        self._heap: List[Tuple[float, int, str]] = []
+        self._sequence = count()
+        self._condition: Condition = Condition()
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=workers_n, thread_name_prefix="input_rpc"
+        )
+        Thread(target=self._resend_loop, name="input_rpc_resender", daemon=True).start()
+
+    def request(
+        self,
+        receiver_twin_did: str,
+        input_id: str,
+        message: dict,
+        timeout: float = None,
+    ) -> Future:
+        """Send a request to a Twin's Input. The request is resent until
+        a reply is received, the timeout expires or the Future is cancelled.
+
+        Args:
+            receiver_twin_did (str): the Twin receiving the request.
+            input_id (str): the Input of the receiver Twin.
+            message (dict): the request message.
+            timeout (float, optional): how long (in seconds) to wait for a reply.
+
+        Returns:
+            Future: resolved with the data of the reply, or a TimeoutError.
+        """
+
+        correlation_id = uuid4().hex
+        future = Future()
+        pending_request = _PendingRequest(
+            future=future,
+            receiver_twin_did=receiver_twin_did,
+            input_id=input_id,
+            message={**message, constant.CORRELATION_ID_VALUE: correlation_id},
+            timeout=timeout or self._timeout,
+            backoff=self._initial_backoff,
+        )
+        with self._lock:
+            self._pending_requests[correlation_id] = pending_request
+
+        future.add_done_callback(partial(self._on_done, correlation_id))
+        self._executor.submit(self._send, correlation_id, pending_request)
+        self._schedule_resend(correlation_id, pending_request)
+
+        return future
+
+    def _schedule_resend(self, correlation_id: str, pending_request: _PendingRequest):
+        # Wait between half and the whole backoff, so that
+        # the requests of several senders don't stay in sync
+        wait_time = random.uniform(pending_request.backoff / 2, pending_request.backoff)
+        due_at = min(monotonic() + wait_time, pending_request.deadline)
+        pending_request.backoff = min(pending_request.backoff * 2, self._max_backoff)
+
+        with self._condition:
+            heapq.heappush(self._heap, (due_at, next(self._sequence), correlation_id))
+            self._condition.notify()
+
+    def _resend_loop(self):
+        while True:
+            with self._condition:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                due_at, _, correlation_id = self._heap[0]
+                time_to_resend = due_at - monotonic()
+                if time_to_resend > 0:
+                    self._condition.wait(time_to_resend)
+                    continue
+
+                heapq.heappop(self._heap)
+
+            with self._lock:
+                pending_request = self._pending_requests.get(correlation_id)
+                # Otherwise the request has been resolved, failed or cancelled
+                if not pending_request:
+                    continue
+
+                if monotonic() >= pending_request.deadline:
+                    del self._pending_requests[correlation_id]
+                    timed_out = True
+                else:
+                    timed_out = False
+
+            if timed_out:
+                self._fail(
+                    pending_request,
+                    "timeout",
+                    TimeoutError(
+                        f"No reply from {pending_request.receiver_twin_did} "
+                        f"within {pending_request.timeout}s"
+                    ),
+                )
+                continue
+
+            INPUT_RPC_RESENDS.labels(pending_request.input_id).inc()
+            log.debug("No reply to request %s. Resending it...", correlation_id)
+            self._executor.submit(self._send, correlation_id, pending_request)
+            self._schedule_resend(correlation_id, pending_request)
+
+    def _send(self, correlation_id: str, pending_request: _PendingRequest):
+        try:
+            wait_for_token_refresh(self._refresh_token_lock)
+            self._iotics_api.send_input_message(
+                sender_twin_did=self._sender_twin_did,
+                receiver_twin_did=pending_request.receiver_twin_did,
+                input_id=pending_request.input_id,
+                message=pending_request.message,
+            )
+        except grpc.RpcError as ex:
+            # The request is resent anyway until the timeout expires
+            RPC_CALLS.labels("send_input_message", ex.code().name).inc()
+            expected_grpc_exception(exception=ex, operation="send_input_message")
+        except Exception as ex:
+            log.exception("Exception sending request %s: %s", correlation_id, ex)
+            with self._lock:
+                pending_request = self._pending_requests.pop(correlation_id, None)
+
+            # Otherwise the request has been resolved, failed or cancelled
+            if pending_request:
+                self._fail(pending_request, "error", ex)
+        else:
+            RPC_CALLS.labels("send_input_message", "OK").inc()
+            log.debug(
+                "Sent Input Message %s to %s",
+                pending_request.message,
+                pending_request.receiver_twin_did,
+            )
+
+    def _fail(self, pending_request: _PendingRequest, status: str, ex: Exception):
+        try:
+            pending_request.future.set_exception(ex)
+        except InvalidStateError:
+            return
+
+        INPUT_RPC_REQUESTS.labels(pending_request.input_id, status).inc()
+
+    def _on_done(self, correlation_id: str, future: Future):
+        # The Future is only cancelled by the caller: stop resending the request
+        if not future.cancelled():
+            return
+
+        with self._lock:
+            pending_request = self._pending_requests.pop(correlation_id, None)
+
+        if pending_request:
+            INPUT_RPC_REQUESTS.labels(pending_request.input_id, "cancelled").inc()
+
+    def resolve(self, received_data: dict) -> bool:
+        """Complete the Future of the request a reply refers to.
+        To be called with the data of each message received by the Input(s)
+        the replies are sent to.
+
+        Args:
+            received_data (dict): the data of the reply received.
+
+        Returns:
+            bool: whether the reply matches a pending request.
+        """
+
+        correlation_id = received_data.get(constant.CORRELATION_ID_VALUE)
+        with self._lock:
+            pending_request = self._pending_requests.pop(correlation_id, None)
+
+        if not pending_request:
+            log.debug("Ignoring reply to unknown request %s", correlation_id)
+            return False
+
+        try:
+            pending_request.future.set_result(received_data)
+        except InvalidStateError:
+            log.debug("Ignoring reply to cancelled request %s", correlation_id)
+            return False
+
+        INPUT_RPC_DURATION.labels(pending_request.input_id).observe(
+            monotonic() - pending_request.sent_at
+        )
+        INPUT_RPC_REQUESTS.labels(pending_request.input_id, "ok").inc()
+
+        return True
@@ -0,0 +1,153 @@
+import logging
+from hashlib import blake2b
+from queue import Queue
+from threading import Lock, Thread
+from typing import Callable, List, Set
+
+import constants as constant
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+KEYED_TASKS = registry.counter(
+    "iotics_keyed_executor_tasks_total",
+    "Number of tasks executed by the keyed executors",
+    ["executor", "status"],
+)
+
+_STOP = object()
+
+
+class KeyedExecutor:
+    """Bounded pool of worker threads executing tasks concurrently, except for
+    the tasks submitted with the same key (e.g.: the Twin that sent a request),
+    which are always executed one at a time in the order they were submitted.
+    Each key is assigned to a worker by hashing it, and each worker has
+    a bounded queue: when it is full 'submit' blocks, so a burst of tasks
+    slows down the caller instead of growing the memory.
+    Tasks submitted with 'submit_coalesced' are dropped if a task with the same
+    key is still queued or running (e.g.: a request resent before being answered).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers_n: int = constant.KEYED_EXECUTOR_WORKERS,
+        queue_size: int = constant.KEYED_EXECUTOR_QUEUE_SIZE,
+    ):
+        """Constructor of a KeyedExecutor object.
+
+        Args:
+            name (str): the name of the executor, used for the Threads and metrics.
+            workers_n (int): number of worker threads.
+            queue_size (int): max number of tasks waiting for each worker.
+        """
+
+        self._name: str = name
+        self._queues: List[Queue] = [
+            Queue(maxsize=queue_size) for _ in range(workers_n)
+        ]
+        self._workers: List[Thread] = []
+        # The keys of the coalesced tasks queued or running
+        self._coalesced_keys: Set[str] = set()
+        self._coalesced_keys_lock: Lock = Lock()
+
+        registry.gauge(
+            "iotics_keyed_executor_queue_size",
+            "Number of tasks waiting to be executed",
+            ["executor"],
+            function=lambda: {(self._name,): self.queue_size},
+        )
+
+    @property
+    def queue_size(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def _get_queue(self, key: str) -> Queue:
+        hashed_key = int.from_bytes(
+            blake2b(key.encode(), digest_size=8).digest(), "big"
+        )
+
+        return self._queues[hashed_key % len(self._queues)]
+
+    def _work(self, queue: Queue):
+        while True:
+            task = queue.get()
+            if task is _STOP:
+                break
+
+            function, args, kwargs, coalesced_key = task
+            try:
+                function(*args, **kwargs)
+            except Exception as ex:
+                log.exception("Exception raised by a task of %s: %s", self._name, ex)
+                KEYED_TASKS.labels(self._name, "error").inc()
+            else:
+                KEYED_TASKS.labels(self._name, "ok").inc()
+            finally:
+                if coalesced_key is not None:
+                    with self._coalesced_keys_lock:
+                        self._coalesced_keys.discard(coalesced_key)
+
+    def start(self):
+        """Start the worker threads."""
+
+        if self._workers:
+            return
+
+        for worker_n, queue in enumerate(self._queues):
+            worker = Thread(
+                target=self._work,
+                args=[queue],
+                name=f"{self._name}_worker_{worker_n}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+        log.debug("Started %d workers for %s", len(self._workers), self._name)
+
+    def submit(self, key: str, function: Callable, *args, **kwargs):
+        """Queue a task to be executed after the tasks already submitted
+        with the same key. Blocks while the queue of the key's worker is full.
+
+        Args:
+            key (str): the key whose tasks are executed in order.
+            function (Callable): the function to call.
+        """
+
+        self._get_queue(key).put((function, args, kwargs, None))
+
+    def submit_coalesced(self, key: str, function: Callable, *args, **kwargs) -> bool:
+        """Queue a task like 'submit', unless a task submitted with
+        'submit_coalesced' and the same key is still queued or running.
+
+        Args:
+            key (str): the key whose tasks are executed in order.
+            function (Callable): the function to call.
+
+        Returns:
+            bool: whether the task has been queued, False if it has been coalesced.
+        """
+
+        with self._coalesced_keys_lock:
+            if key in self._coalesced_keys:
+                KEYED_TASKS.labels(self._name, "coalesced").inc()
+                return False
+
+            self._coalesced_keys.add(key)
+
+        self._get_queue(key).put((function, args, kwargs, key))
+
+        return True
+
+    def stop(self):
+        """Stop the worker threads once the tasks already submitted are executed."""
+
+        for queue in self._queues:
+            queue.put(_STOP)
+
+        for worker in self._workers:
+            worker.join()
+
+        self._workers = []
@@ -0,0 +1,417 @@
+import logging
+import math
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, List
+
+import constants as constant
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """HDR-style histogram of latencies. Values are recorded as integer microseconds
+    into log-linear buckets: each power of 2 is split into the same number of
+    sub-buckets, so the relative error of any value is bounded by the number of
+    significant digits regardless of its magnitude. Only the non-empty buckets are
+    kept, so memory doesn't depend on the range of values tracked.
+    Histograms recorded by independent threads can be merged.
+    """
+
+    __slots__ = (
+        "_sub_bucket_bits",
+        "_sub_bucket_count",
+        "_sub_bucket_half_count",
+        "_highest_trackable",
+        "_counts",
+        "count",
+        "min_value",
+        "max_value",
+        "total",
+        "negative_count",
+    )
+
+    def __init__(
+        self,
+        significant_digits: int = constant.LATENCY_SIGNIFICANT_DIGITS,
+        highest_trackable: float = constant.LATENCY_HIGHEST_TRACKABLE_SEC,
+    ):
+        """Constructor of a LatencyHistogram object.
+
+        Args:
+            significant_digits (int): number of significant decimal digits
+                kept for each value.
+            highest_trackable (float): the highest value (in seconds) tracked.
+                Higher values are recorded as this value.
+        """
+
+        self._sub_bucket_bits: int = math.ceil(math.log2(2 * 10**significant_digits))
+        self._sub_bucket_count: int = 1 << self._sub_bucket_bits
+        self._sub_bucket_half_count: int = self._sub_bucket_count >> 1
+        self._highest_trackable: int = int(highest_trackable * 1e6)
+        self._counts: Dict[int, int] = {}
+        self.count: int = 0
+        self.min_value: float = None
+        self.max_value: float = None
+        self.total: float = 0
+        # Latencies computed across hosts can be negative because of clock skew.
+        # They are recorded as 0 and counted separately.
+        self.negative_count: int = 0
+
+    def _get_bucket_index(self, value: int) -> int:
+        if value < self._sub_bucket_count:
+            return value
+
+        shift = value.bit_length() - self._sub_bucket_bits
+        sub_bucket = (value >> shift) - self._sub_bucket_half_count
+
+        return (
+            self._sub_bucket_count + (shift - 1) * self._sub_bucket_half_count
+        ) + sub_bucket
+
+    def _get_bucket_value(self, bucket_index: int) -> int:
+        """Return the value in the middle of a bucket."""
+
+        if bucket_index < self._sub_bucket_count:
+            return bucket_index
+
+        shift, sub_bucket = divmod(
+            bucket_index - self._sub_bucket_count, self._sub_bucket_half_count
+        )
+        shift += 1
+        lowest_value = (sub_bucket + self._sub_bucket_half_count) << shift
+
+        return lowest_value + (1 << (shift - 1))
+
+    def record(self, value: float):
+        """Record a new latency.
+
+        Args:
+            value (float): the latency in seconds.
+        """
+
+        if value < 0:
+            self.negative_count += 1
+            value = 0
+
+        self.count += 1
+        self.total += value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+        bucket_index = self._get_bucket_index(
+            min(int(value * 1e6), self._highest_trackable)
+        )
+        self._counts[bucket_index] = self._counts.get(bucket_index, 0) + 1
+
+    def merge(self, other: "LatencyHistogram"):
+        """Merge another histogram with the same significant digits into this one.
+
+        Args:
+            other (LatencyHistogram): the histogram to merge.
+        """
+
+        if other._sub_bucket_bits != self._sub_bucket_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+
+        for bucket_index, bucket_count in list(other._counts.items()):
+            self._counts[bucket_index] = (
+                self._counts.get(bucket_index, 0) + bucket_count
+            )
+
+        if other.count:
+            self.count += other.count
+            self.total += other.total
+            self.negative_count += other.negative_count
+            if self.min_value is None or other.min_value < self.min_value:
+                self.min_value = other.min_value
+            if self.max_value is None or other.max_value > self.max_value:
+                self.max_value = other.max_value
+
+    def reset(self):
+        """Remove all the values recorded."""
+
+        self._counts = {}
+        self.count = 0
+        self.min_value = None
+        self.max_value = None
+        self.total = 0
+        self.negative_count = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+
+    def get_quantiles(self, quantiles: Iterable[float]) -> List[float]:
+        """Return the approximate values (in seconds) at the given quantiles.
+
+        Args:
+            quantiles (Iterable[float]): the quantiles, between 0 and 1.
+
+        Returns:
+            List[float]: the value at each quantile, None if no value was recorded.
+        """
+
+        quantiles = list(quantiles)
+        if not self.count:
+            return [None] * len(quantiles)
+
+        sorted_buckets = sorted(self._counts.items())
+        values: List[float] = []
+        for quantile in quantiles:
+            rank = max(math.ceil(quantile * self.count), 1)
+            cumulative_count = 0
+            for bucket_index, bucket_count in sorted_buckets:
+                cumulative_count += bucket_count
+                if cumulative_count >= rank:
+                    break
+
+            value = self._get_bucket_value(bucket_index) / 1e6
+            # The middle of the bucket can be outside the range of the values
+            values.append(min(max(value, self.min_value), self.max_value))
+
+        return values
+
+    def quantile(self, quantile: float) -> float:
+        """Return the approximate value (in seconds) at the given quantile.
+
+        Args:
+            quantile (float): the quantile, between 0 and 1.
+
+        Returns:
+            float: the value at the quantile, None if no value was recorded.
+        """
+
+        return self.get_quantiles([quantile])[0]
+
+    def get_stats(self) -> dict:
+        """Return the count, mean, min, max and percentiles (in seconds)
+        of the latencies recorded.
+
+        Returns:
+            dict: the statistics of the histogram.
+        """
+
+        stats = {
+            "count": self.count,
+            "negative_count": self.negative_count,
+            "mean": self.mean,
+            "min": self.min_value,
+            "max": self.max_value,
+            "sum": self.total,
+        }
+        quantile_values = self.get_quantiles(constant.LATENCY_PERCENTILES.values())
+        for percentile_name, value in zip(
+            constant.LATENCY_PERCENTILES, quantile_values
+        ):
+            stats[percentile_name] = value
+
+        return stats
+
+
+class _LatencyEntry:
+    """The histograms of a metric for a key: one since the start
+    and one since the last summary."""
+
+    __slots__ = ("lock", "total", "interval")
+
+    def __init__(self):
+        self.lock: Lock = Lock()
+        self.total: LatencyHistogram = LatencyHistogram()
+        self.interval: LatencyHistogram = LatencyHistogram()
+
+
+class LatencyRecorder:
+    """Thread-safe collection of latency histograms, one for each metric
+    (e.g.: end-to-end, processing, DB queue) and key (e.g.: the Twin and Feed
+    the data comes from). A summary of the percentiles of the latencies recorded
+    since the previous summary is periodically logged, and the statistics
+    since the start can be retrieved with 'get_stats'.
+    """
+
+    def __init__(self, summary_period: float = constant.LATENCY_SUMMARY_PERIOD_SEC):
+        """Constructor of a LatencyRecorder object.
+
+        Args:
+            summary_period (float): how often (in seconds) the summary is logged.
+                0 disables logging.
+        """
+
+        self._summary_period: float = summary_period
+        self._entries: Dict[str, Dict[str, _LatencyEntry]] = {}
+        self._entries_lock: Lock = Lock()
+        self._stopped: Event = Event()
+        self._summary_thread: Thread = None
+        self._started: bool = False
+
+    def _get_entry(self, metric: str, key: str) -> _LatencyEntry:
+        metric_entries = self._entries.get(metric)
+        entry = metric_entries.get(key) if metric_entries else None
+        if entry:
+            return entry
+
+        with self._entries_lock:
+            return self._entries.setdefault(metric, {}).setdefault(key, _LatencyEntry())
+
+    def record(self, metric: str, key: str, value: float):
+        """Record a new latency.
+
+        Args:
+            metric (str): the name of the metric (e.g.: constant.LATENCY_END_TO_END).
+            key (str): the key the latency refers to (e.g.: the Twin and Feed).
+            value (float): the latency in seconds.
+        """
+
+        entry = self._get_entry(metric, key)
+        with entry.lock:
+            entry.total.record(value)
+            entry.interval.record(value)
+
+    def _copy_histograms(
+        self, metric: str, interval: bool = False, reset: bool = False
+    ) -> Dict[str, LatencyHistogram]:
+        histograms: Dict[str, LatencyHistogram] = {}
+        for key, entry in list(self._entries.get(metric, {}).items()):
+            histogram = LatencyHistogram()
+            with entry.lock:
+                histogram.merge(entry.interval if interval else entry.total)
+                if reset:
+                    entry.interval.reset()
+            histograms[key] = histogram
+
+        return histograms
+
+    def get_stats(self, metric: str = None) -> Dict[str, dict]:
+        """Return the statistics (in seconds) of the latencies recorded since the start,
+        for each key and overall.
+
+        Args:
+            metric (str, optional): the name of the metric. All the metrics by default.
+
+        Returns:
+            Dict[str, dict]: by metric name, the statistics of each key
+                plus the statistics of all the keys merged (as 'overall').
+        """
+
+        metrics = [metric] if metric else list(self._entries)
+
+        stats: Dict[str, dict] = {}
+        for metric_name in metrics:
+            histograms = self._copy_histograms(metric_name)
+            overall_histogram = LatencyHistogram()
+            for histogram in histograms.values():
+                overall_histogram.merge(histogram)
+
+            stats[metric_name] = {
+                "overall": overall_histogram.get_stats(),
+                "keys": {
+                    key: histogram.get_stats() for key, histogram in histograms.items()
+                },
+            }
+
+        return stats
+
+    def log_summary(self):
+        """Log the percentiles of the latencies recorded since the previous summary
+        for each metric, alongside the key with the worst p99."""
+
+        for metric in list(self._entries):
+            histograms = self._copy_histograms(metric, interval=True, reset=True)
+
+            overall_histogram = LatencyHistogram()
+            worst_key: str = None
+            worst_p99: float = None
+            for key, histogram in histograms.items():
+                if not histogram.count:
+                    continue
+
+                overall_histogram.merge(histogram)
+                p99 = histogram.quantile(0.99)
+                if worst_p99 is None or p99 > worst_p99:
+                    worst_key, worst_p99 = key, p99
+
+            if not overall_histogram.count:
+                continue
+
+            p50, p90, p99, p999 = overall_histogram.get_quantiles(
+                [0.5, 0.9, 0.99, 0.999]
+            )
+            log.info(
+                "Latency %s: %d samples, p50 %.1fms p90 %.1fms p99 %.1fms "
+                "p99.9 %.1fms max %.1fms (worst p99 %.1fms for %s)",
+                metric,
+                overall_histogram.count,
+                p50 * 1000,
+                p90 * 1000,
+                p99 * 1000,
+                p999 * 1000,
+                overall_histogram.max_value * 1000,
+                worst_p99 * 1000,
+                worst_key,
+            )
+            if overall_histogram.negative_count:
+                log.warning(
+                    "Latency %s: %d negative samples, check the clocks are in sync",
+                    metric,
+                    overall_histogram.negative_count,
+                )
+
+    def _collect_metrics(self) -> List[str]:
+        """Return the overall percentiles of each metric
+        as a summary in the Prometheus text exposition format."""
+
+        name = "iotics_latency_seconds"
+        lines = [
+            f"# HELP {name} Latency of the data processed, by metric",
+            f"# TYPE {name} summary",
+        ]
+        for metric in list(self._entries):
+            overall_histogram = LatencyHistogram()
+            for histogram in self._copy_histograms(metric).values():
+                overall_histogram.merge(histogram)
+
+            quantile_values = overall_histogram.get_quantiles(
+                constant.LATENCY_PERCENTILES.values()
+            )
+            for quantile, value in zip(
+                constant.LATENCY_PERCENTILES.values(), quantile_values
+            ):
+                if value is not None:
+                    lines.append(
+                        f'{name}{{metric="{metric}",quantile="{quantile}"}} {value}'
+                    )
+            lines.append(f'{name}_sum{{metric="{metric}"}} {overall_histogram.total}')
+            lines.append(f'{name}_count{{metric="{metric}"}} {overall_histogram.count}')
+
+        return lines
+
+    def _summary_loop(self):
+        while not self._stopped.wait(self._summary_period):
+            try:
+                self.log_summary()
+            except Exception as ex:
+                log.exception("Error logging the latency summary: %s", ex)
+
+    def start(self):
+        """Start the Thread periodically logging the summary
+        and export the percentiles as metrics."""
+
+        if self._started:
+            return
+
+        self._started = True
+        registry.add_collector(self._collect_metrics)
+        if not self._summary_period:
+            return
+
+        self._summary_thread = Thread(
+            target=self._summary_loop, name="latency_summary", daemon=True
+        )
+        self._summary_thread.start()
+
+    def stop(self):
+        """Stop logging the summary."""
+
+        self._stopped.set()
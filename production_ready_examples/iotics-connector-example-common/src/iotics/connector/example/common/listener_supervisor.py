@@ -0,0 +1,268 @@
+import logging
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict
+
+import constants as constant
+from metrics import health, registry
+
+log = logging.getLogger(__name__)
+
+LISTENER_RESTARTS = registry.counter(
+    "iotics_listener_restarts_total",
+    "Number of listeners restarted by their supervisor, by reason",
+    ["supervisor", "reason"],
+)
+
+HEALTHY = "healthy"
+STALLED = "stalled"
+DEAD = "dead"
+_STATE_VALUES = {HEALTHY: 0, STALLED: 1, DEAD: 2}
+
+
+class _SupervisedListener:
+    __slots__ = (
+        "key",
+        "target",
+        "args",
+        "expected_period",
+        "on_stall",
+        "thread",
+        "state",
+        "started_at",
+        "last_message_at",
+        "restarts_n",
+        "next_restart_at",
+    )
+
+    def __init__(
+        self,
+        key: str,
+        target: Callable,
+        args: tuple,
+        expected_period: float,
+        on_stall: Callable,
+    ):
+        self.key: str = key
+        self.target: Callable = target
+        self.args: tuple = args
+        self.expected_period: float = expected_period
+        self.on_stall: Callable = on_stall
+        self.thread: Thread = None
+        self.state: str = HEALTHY
+        self.started_at: float = None
+        self.last_message_at: float = None
+        # Consecutive restarts without receiving any message, for the backoff
+        self.restarts_n: int = 0
+        self.next_restart_at: float = None
+
+
+class ListenerSupervisor:
+    """Run listener Threads (e.g.: one per Feed followed) and keep them going.
+    A listener is dead when its Thread stops (e.g.: after too many unexpected
+    exceptions) and stalled when it hasn't received any message for
+    'stall_periods_n' times the period its messages are expected at.
+    Dead listeners are started again, stalled ones are restarted with their
+    'on_stall' function (e.g.: closing the stream so that a new one is opened),
+    both with exponential backoff while the restarts don't help.
+    The state of each listener and the time since its last message are exported.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        check_period: float = constant.LISTENER_SUPERVISOR_CHECK_PERIOD_SEC,
+        stall_periods_n: int = constant.LISTENER_STALL_PERIODS_N,
+        initial_backoff: float = constant.LISTENER_RESTART_INITIAL_BACKOFF_SEC,
+        max_backoff: float = constant.LISTENER_RESTART_MAX_BACKOFF_SEC,
+    ):
+        """Constructor of a ListenerSupervisor object.
+
+        Args:
+            name (str): the name of the supervisor, used for the Threads and metrics.
+            check_period (float): how often (in seconds) the listeners are checked.
+            stall_periods_n (int): expected periods without messages
+                after which a listener is stalled.
+            initial_backoff (float): the time (in seconds) before the first restart.
+            max_backoff (float): the max time (in seconds) between restarts.
+        """
+
+        self._name: str = name
+        self._check_period: float = check_period
+        self._stall_periods_n: int = stall_periods_n
+        self._initial_backoff: float = initial_backoff
+        self._max_backoff: float = max_backoff
+
+        self._listeners: Dict[str, _SupervisedListener] = {}
+        self._lock: Lock = Lock()
+        self._stopped: Event = Event()
+        self._supervisor_thread: Thread = None
+
+        registry.gauge(
+            "iotics_listener_state",
+            "State of each listener: 0 healthy, 1 stalled, 2 dead",
+            ["supervisor", "listener"],
+            function=lambda: {
+                (self._name, listener.key): _STATE_VALUES[listener.state]
+                for listener in list(self._listeners.values())
+            },
+        )
+        registry.gauge(
+            "iotics_listener_last_message_age_seconds",
+            "Time since each listener received its last message (or started)",
+            ["supervisor", "listener"],
+            function=self._get_last_message_ages,
+        )
+
+    def _get_last_message_ages(self) -> dict:
+        now = monotonic()
+
+        return {
+            (self._name, listener.key): now
+            - (listener.last_message_at or listener.started_at or now)
+            for listener in list(self._listeners.values())
+        }
+
+    def _start_listener(self, listener: _SupervisedListener):
+        listener.thread = Thread(
+            target=listener.target, args=listener.args, name=listener.key
+        )
+        listener.started_at = monotonic()
+        listener.state = HEALTHY
+        listener.next_restart_at = None
+        log.debug("Starting new Thread %s...", listener.key)
+        listener.thread.start()
+
+    def add_listener(
+        self,
+        key: str,
+        target: Callable,
+        args: tuple = (),
+        expected_period: float = None,
+        on_stall: Callable = None,
+    ):
+        """Start a listener Thread and supervise it.
+
+        Args:
+            key (str): unique name of the listener, used for its Thread and metrics.
+            target (Callable): the function run by the Thread.
+            args (tuple, optional): the arguments of the function.
+            expected_period (float, optional): the seconds between two messages.
+                If not given, the listener is never considered stalled.
+            on_stall (Callable, optional): the function restarting
+                a stalled listener.
+        """
+
+        listener = _SupervisedListener(
+            key=key,
+            target=target,
+            args=tuple(args),
+            expected_period=expected_period,
+            on_stall=on_stall,
+        )
+        with self._lock:
+            if key in self._listeners:
+                raise ValueError(f"Listener {key} already supervised")
+
+            self._listeners[key] = listener
+
+        self._start_listener(listener)
+
+    def record_message(self, key: str):
+        """Record that a listener received a message, i.e.: it is healthy.
+
+        Args:
+            key (str): the name of the listener.
+        """
+
+        listener = self._listeners.get(key)
+        if listener:
+            listener.last_message_at = monotonic()
+
+    def _get_backoff(self, listener: _SupervisedListener) -> float:
+        return min(self._max_backoff, self._initial_backoff * 2**listener.restarts_n)
+
+    def _check_listener(self, listener: _SupervisedListener, now: float):
+        last_activity_at = max(listener.last_message_at or 0, listener.started_at)
+        if listener.last_message_at and listener.last_message_at > listener.started_at:
+            listener.restarts_n = 0
+
+        if not listener.thread.is_alive():
+            state = DEAD
+        elif listener.expected_period and (
+            now - last_activity_at > listener.expected_period * self._stall_periods_n
+        ):
+            state = STALLED
+        else:
+            listener.state = HEALTHY
+            listener.next_restart_at = None
+            return
+
+        if listener.state != state:
+            if state == DEAD:
+                log.warning("Listener %s exited", listener.key)
+            else:
+                log.warning(
+                    "Listener %s stalled: no message for %.0fs",
+                    listener.key,
+                    now - last_activity_at,
+                )
+            listener.state = state
+        if listener.next_restart_at is None:
+            listener.next_restart_at = now + self._get_backoff(listener)
+        if now < listener.next_restart_at:
+            return
+
+        listener.restarts_n += 1
+        if state == DEAD:
+            LISTENER_RESTARTS.labels(self._name, "dead").inc()
+            self._start_listener(listener)
+        elif listener.on_stall:
+            LISTENER_RESTARTS.labels(self._name, "stalled").inc()
+            log.info("Restarting stalled listener %s...", listener.key)
+            try:
+                listener.on_stall()
+            except Exception as ex:
+                log.exception("Exception restarting listener %s: %s", listener.key, ex)
+            # Give the listener another stall timeout to receive a message
+            listener.started_at = now
+            listener.next_restart_at = None
+
+    def _supervise(self):
+        while not self._stopped.wait(self._check_period):
+            now = monotonic()
+            with self._lock:
+                listeners = list(self._listeners.values())
+
+            for listener in listeners:
+                try:
+                    self._check_listener(listener, now)
+                except Exception as ex:
+                    log.exception(
+                        "Exception checking listener %s: %s", listener.key, ex
+                    )
+
+    def start(self):
+        """Start checking the listeners periodically."""
+
+        if self._supervisor_thread:
+            return
+
+        self._supervisor_thread = Thread(
+            target=self._supervise, name=f"{self._name}_supervisor"
+        )
+        self._supervisor_thread.start()
+        health.add_liveness_check(
+            f"{self._name}_supervisor", self._supervisor_thread.is_alive
+        )
+
+    def join(self):
+        """Wait until the supervisor is stopped."""
+
+        if self._supervisor_thread:
+            self._supervisor_thread.join()
+
+    def stop(self):
+        """Stop checking the listeners. The listener Threads are not stopped."""
+
+        self._stopped.set()
@@ -0,0 +1,483 @@
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import constants as constant
+
+log = logging.getLogger(__name__)
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+
+    labels = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(label_names, label_values)
+    )
+
+    return "{" + labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self.value: float = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper_bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._lock: Lock = Lock()
+        self._upper_bounds: Tuple[float, ...] = upper_bounds
+        self.bucket_counts: List[int] = [0] * (len(upper_bounds) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        bucket_index = bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.bucket_counts[bucket_index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Timer:
+    """Context manager observing the time spent in a block of code."""
+
+    __slots__ = ("_histogram_child", "_started_at")
+
+    def __init__(self, histogram_child: _HistogramChild):
+        self._histogram_child: _HistogramChild = histogram_child
+        self._started_at: float = None
+
+    def __enter__(self):
+        self._started_at = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._histogram_child.observe(perf_counter() - self._started_at)
+
+
+class Metric:
+    """Base class of a metric with an optional set of labels.
+    Each combination of label values has its own child, created on first use."""
+
+    metric_type: str = None
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name: str = name
+        self.description: str = description
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._children_lock: Lock = Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *label_values):
+        """Return the child of the metric for the given label values.
+
+        Args:
+            *label_values: one value for each label name of the metric.
+        """
+
+        child = self._children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(
+                    f"Metric {self.name} expects labels {self.label_names}"
+                )
+            with self._children_lock:
+                child = self._children.setdefault(label_values, self._new_child())
+
+        return child
+
+    def _get_samples(self) -> List[Tuple[str, Tuple[str, ...], tuple, float]]:
+        """Return the samples of the metric as (suffix, extra label names,
+        label values, value) tuples."""
+
+        return [
+            ("", (), label_values, child.value)
+            for label_values, child in list(self._children.items())
+        ]
+
+    def render(self) -> List[str]:
+        """Return the metric in the Prometheus text exposition format.
+
+        Returns:
+            List[str]: the lines of the metric.
+        """
+
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for suffix, extra_label_names, label_values, value in self._get_samples():
+            labels = _format_labels(self.label_names + extra_label_names, label_values)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g.: the number of RPCs made."""
+
+    metric_type = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that can go up and down, e.g.: the number of active threads.
+    The value of a gauge can be computed by a function only when it is scraped
+    (e.g.: the size of a queue), so it costs nothing on the hot path.
+    """
+
+    metric_type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        function: Callable = None,
+    ):
+        """Constructor of a Gauge object.
+
+        Args:
+            name (str): the name of the metric.
+            description (str): the description of the metric.
+            label_names (Sequence[str], optional): the names of the labels.
+            function (Callable, optional): called when the metric is scraped.
+                It returns the value of the gauge, or a dictionary of values
+                by label values if the gauge has labels.
+        """
+
+        super().__init__(name, description, label_names)
+        self.function: Callable = function
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def _get_samples(self) -> List[Tuple[str, Tuple[str, ...], tuple, float]]:
+        if not self.function:
+            return super()._get_samples()
+
+        values = self.function()
+        if not isinstance(values, dict):
+            return [("", (), (), values)]
+
+        return [("", (), label_values, value) for label_values, value in values.items()]
+
+
+class Histogram(Metric):
+    """Distribution of values into cumulative buckets, e.g.: the RPC durations."""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = constant.METRICS_DURATION_BUCKETS_SEC,
+    ):
+        """Constructor of a Histogram object.
+
+        Args:
+            name (str): the name of the metric.
+            description (str): the description of the metric.
+            label_names (Sequence[str], optional): the names of the labels.
+            buckets (Sequence[float], optional): the upper bounds of the buckets.
+        """
+
+        super().__init__(name, description, label_names)
+        self._upper_bounds: Tuple[float, ...] = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self._upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *label_values) -> _Timer:
+        """Return a context manager observing the time spent in a block of code.
+
+        Args:
+            *label_values: one value for each label name of the metric.
+        """
+
+        return _Timer(self.labels(*label_values))
+
+    def _get_samples(self) -> List[Tuple[str, Tuple[str, ...], tuple, float]]:
+        samples = []
+        for label_values, child in list(self._children.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(
+                self._upper_bounds + (float("inf"),), child.bucket_counts
+            ):
+                cumulative_count += bucket_count
+                samples.append(
+                    (
+                        "_bucket",
+                        ("le",),
+                        label_values + (_format_value(upper_bound),),
+                        cumulative_count,
+                    )
+                )
+            samples.append(("_sum", (), label_values, child.sum))
+            samples.append(("_count", (), label_values, child.count))
+
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of the metrics of a process. Registering a metric with
+    the name of an existing one returns the existing metric, so modules shared
+    by several Connectors can define their metrics at import time.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+        self._lock: Lock = Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing_metric = self._metrics.get(metric.name)
+            if existing_metric:
+                if type(existing_metric) is not type(metric):
+                    raise ValueError(
+                        f"Metric {metric.name} already registered "
+                        f"as a {existing_metric.metric_type}"
+                    )
+                if isinstance(metric, Gauge) and metric.function:
+                    existing_metric.function = metric.function
+                return existing_metric
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(
+        self, name: str, description: str, label_names: Sequence[str] = ()
+    ) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        function: Callable = None,
+    ) -> Gauge:
+        return self._register(Gauge(name, description, label_names, function))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = constant.METRICS_DURATION_BUCKETS_SEC,
+    ) -> Histogram:
+        return self._register(Histogram(name, description, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """Add a function called when the metrics are scraped,
+        returning lines already in the text exposition format.
+
+        Args:
+            collector (Callable[[], List[str]]): the function to call.
+        """
+
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: the metrics of the process.
+        """
+
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as ex:
+                log.warning("Error rendering metric %s: %s", metric.name, ex)
+        for collector in list(self._collectors):
+            try:
+                lines.extend(collector())
+            except Exception as ex:
+                log.warning("Error running metrics collector: %s", ex)
+
+        return "\n".join(lines) + "\n"
+
+
+class HealthChecks:
+    """Liveness and readiness of a process. The process is alive if all the
+    liveness checks pass, and ready once all its components are ready."""
+
+    def __init__(self):
+        self._liveness_checks: Dict[str, Callable[[], bool]] = {}
+        self._ready_components: Dict[str, bool] = {}
+
+    def add_liveness_check(self, name: str, check: Callable[[], bool]):
+        """Add a function returning whether a part of the process is alive
+        (e.g.: a Thread that must never stop).
+
+        Args:
+            name (str): the name of the check.
+            check (Callable[[], bool]): the function to call.
+        """
+
+        self._liveness_checks[name] = check
+
+    def set_ready(self, component: str, ready: bool = True):
+        """Set whether a component of the process is ready.
+
+        Args:
+            component (str): the name of the component.
+            ready (bool, optional): whether the component is ready.
+        """
+
+        self._ready_components[component] = ready
+
+    def is_alive(self) -> Tuple[bool, Dict[str, bool]]:
+        checks: Dict[str, bool] = {}
+        for name, check in list(self._liveness_checks.items()):
+            try:
+                checks[name] = bool(check())
+            except Exception as ex:
+                log.warning("Liveness check %s failed: %s", name, ex)
+                checks[name] = False
+
+        return all(checks.values()), checks
+
+    def is_ready(self) -> Tuple[bool, Dict[str, bool]]:
+        components = dict(self._ready_components)
+
+        return bool(components) and all(components.values()), components
+
+
+registry = MetricsRegistry()
+health = HealthChecks()
+
+LISTENERS_ACTIVE = registry.gauge(
+    "iotics_listeners_active",
+    "Number of Feed/Input listener Threads running",
+    ["kind"],
+)
+MESSAGES_RECEIVED = registry.counter(
+    "iotics_messages_received_total",
+    "Number of Feed/Input messages received",
+    ["kind", "id"],
+)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def _send_response(self, status: int, body: str, content_type: str):
+        encoded_body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def _send_health(self, healthy: bool, checks: Dict[str, bool]):
+        body = "\n".join(
+            f"{name}: {'ok' if ok else 'failing'}" for name, ok in checks.items()
+        )
+        self._send_response(
+            200 if healthy else 503,
+            f"{'ok' if healthy else 'failing'}\n{body}\n",
+            "text/plain; charset=utf-8",
+        )
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._send_response(
+                200, registry.render(), "text/plain; version=0.0.4; charset=utf-8"
+            )
+        elif path == "/healthz":
+            self._send_health(*health.is_alive())
+        elif path == "/readyz":
+            self._send_health(*health.is_ready())
+        else:
+            self._send_response(404, "Not found\n", "text/plain; charset=utf-8")
+
+    def log_message(self, format, *args):
+        log.debug("Metrics request: " + format, *args)
+
+
+def start_metrics_server(port: int) -> Optional[ThreadingHTTPServer]:
+    """Start a Thread serving the metrics ('/metrics'), the liveness ('/healthz')
+    and the readiness ('/readyz') of the process over HTTP.
+
+    Args:
+        port (int): the port to listen to. 0 disables the server.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: the server started, None if disabled.
+    """
+
+    if not port:
+        log.debug("Metrics server disabled")
+        return None
+
+    try:
+        metrics_server = ThreadingHTTPServer(("", port), _MetricsRequestHandler)
+    except OSError as ex:
+        log.error("Can't start the metrics server on port %d: %s", port, ex)
+        return None
+
+    metrics_server.daemon_threads = True
+    Thread(
+        target=metrics_server.serve_forever, name="metrics_server", daemon=True
+    ).start()
+    log.info("Serving metrics on port %d", port)
+
+    return metrics_server
@@ -0,0 +1,211 @@
+import json
+import logging
+import struct
+from typing import Dict, List, Tuple
+
+import constants as constant
+from feed_decoder import decode_json_payload
+
+log = logging.getLogger(__name__)
+
+
+class PayloadCodec:
+    """Base class of the codecs used to encode/decode the payload of
+    Feed data samples. Each codec is identified by its MIME type."""
+
+    mime: str = None
+
+    def encode(self, data: dict) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, payload: bytes) -> dict:
+        raise NotImplementedError
+
+
+class JsonCodec(PayloadCodec):
+    mime = constant.MIME_JSON
+
+    def encode(self, data: dict) -> bytes:
+        return json.dumps(data).encode()
+
+    def decode(self, payload: bytes) -> dict:
+        return decode_json_payload(payload)
+
+
+class MessagePackCodec(PayloadCodec):
+    mime = constant.MIME_MSGPACK
+
+    def __init__(self):
+        import msgpack
+
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def encode(self, data: dict) -> bytes:
+        return self._packb(data)
+
+    def decode(self, payload: bytes) -> dict:
+        return self._unpackb(payload)
+
+
+class CborCodec(PayloadCodec):
+    mime = constant.MIME_CBOR
+
+    def __init__(self):
+        import cbor2
+
+        self._dumps = cbor2.dumps
+        self._loads = cbor2.loads
+
+    def encode(self, data: dict) -> bytes:
+        return self._dumps(data)
+
+    def decode(self, payload: bytes) -> dict:
+        return self._loads(payload)
+
+
+class StructCodec(PayloadCodec):
+    """Fixed-layout binary codec. The layout (i.e.: the label and type of each value)
+    is included in the MIME type parameters, so consumers don't need the
+    Feed's metadata to decode the payload.
+    """
+
+    def __init__(self, layout: List[Tuple[str, str]]):
+        """Constructor of a StructCodec object.
+
+        Args:
+            layout (List[Tuple[str, str]]): list of (label, struct format character)
+                of each value of the payload.
+        """
+
+        self._labels: Tuple[str, ...] = tuple(label for label, _ in layout)
+        self._struct = struct.Struct(
+            "<" + "".join(format_char for _, format_char in layout)
+        )
+        layout_parameter = ",".join(
+            f"{label}:{format_char}" for label, format_char in layout
+        )
+        self.mime = f"{constant.MIME_STRUCT};layout={layout_parameter}"
+
+    @classmethod
+    def from_feed_values(cls, feed_values) -> "StructCodec":
+        """Generate a StructCodec from the Feed's Values definition
+        (i.e.: the list of objects returned by 'create_value').
+
+        Args:
+            feed_values: the Values of the Feed.
+
+        Returns:
+            StructCodec: the codec of the Feed's data samples.
+        """
+
+        layout = []
+        for feed_value in feed_values:
+            format_char = constant.STRUCT_FORMAT_BY_DATA_TYPE.get(feed_value.dataType)
+            if not format_char:
+                raise ValueError(
+                    f"Data type '{feed_value.dataType}' of value '{feed_value.label}' "
+                    "can't be encoded with a fixed layout"
+                )
+            layout.append((feed_value.label, format_char))
+
+        return cls(layout)
+
+    @classmethod
+    def from_mime(cls, mime: str) -> "StructCodec":
+        """Generate a StructCodec from the 'layout' parameter of a MIME type.
+
+        Args:
+            mime (str): the MIME type of the payload.
+
+        Returns:
+            StructCodec: the codec of the payload.
+        """
+
+        parameters = dict(
+            parameter.strip().split("=", 1)
+            for parameter in mime.split(";")[1:]
+            if "=" in parameter
+        )
+        layout = [
+            tuple(value_layout.split(":", 1))
+            for value_layout in parameters["layout"].split(",")
+        ]
+
+        return cls(layout)
+
+    def encode(self, data: dict) -> bytes:
+        return self._struct.pack(*(data[label] for label in self._labels))
+
+    def decode(self, payload: bytes) -> dict:
+        return dict(zip(self._labels, self._struct.unpack(payload)))
+
+
+_JSON_CODEC = JsonCodec()
+_CODEC_FACTORIES = {
+    constant.MIME_JSON: lambda: _JSON_CODEC,
+    constant.MIME_MSGPACK: MessagePackCodec,
+    constant.MIME_CBOR: CborCodec,
+}
+_codecs: Dict[str, PayloadCodec] = {constant.MIME_JSON: _JSON_CODEC}
+
+
+def register_codec(mime: str, codec_factory):
+    """Register a new codec so payloads with the given MIME type can be
+    encoded/decoded.
+
+    Args:
+        mime (str): the MIME type handled by the codec.
+        codec_factory: callable returning an instance of the codec.
+    """
+
+    _CODEC_FACTORIES[mime] = codec_factory
+    _codecs.pop(mime, None)
+
+
+def get_codec(mime: str) -> PayloadCodec:
+    """Return the codec of a given MIME type. Codecs are instantiated once
+    and cached; the StructCodec is generated from the MIME type parameters.
+
+    Args:
+        mime (str): the MIME type of the payload.
+
+    Returns:
+        PayloadCodec: the codec to use.
+    """
+
+    codec = _codecs.get(mime)
+    if codec:
+        return codec
+
+    base_mime = mime.split(";", 1)[0].strip()
+    if base_mime == constant.MIME_STRUCT:
+        codec = StructCodec.from_mime(mime)
+    else:
+        codec_factory = _CODEC_FACTORIES.get(base_mime)
+        if not codec_factory:
+            raise ValueError(f"No codec registered for MIME type '{mime}'")
+        codec = codec_factory()
+
+    _codecs[mime] = codec
+    log.debug("Codec %s registered for MIME type %s", type(codec).__name__, mime)
+
+    return codec
+
+
+def decode_payload(payload: bytes, mime: str) -> dict:
+    """Decode the payload of a data sample according to its MIME type.
+    JSON (or no MIME type) is decoded without any lookup.
+
+    Args:
+        payload (bytes): the payload to decode.
+        mime (str): the MIME type of the payload.
+
+    Returns:
+        dict: the payload decoded.
+    """
+
+    if not mime or mime == constant.MIME_JSON:
+        return decode_json_payload(payload)
+
+    return get_codec(mime).decode(payload)
@@ -0,0 +1,295 @@
+import logging
+import random
+from threading import Lock
+from time import monotonic
+from typing import Dict
+
+import constants as constant
+import grpc
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+CIRCUIT_BREAKER_REJECTIONS = registry.counter(
+    "iotics_circuit_breaker_rejections_total",
+    "Number of operations rejected because the circuit was open",
+    ["breaker"],
+)
+CIRCUIT_BREAKER_TRANSITIONS = registry.counter(
+    "iotics_circuit_breaker_transitions_total",
+    "Number of circuit state changes, by new state",
+    ["breaker", "state"],
+)
+
+
+class RetryError(Exception):
+    """Raised when an operation failed and won't be retried any more."""
+
+    def __init__(self, operation: str, attempts: int, reason: str, last_exception=None):
+        super().__init__(
+            f"'{operation}' failed after {attempts} attempt(s) ({reason}): {last_exception}"
+        )
+        self.operation: str = operation
+        self.attempts: int = attempts
+        self.reason: str = reason
+        self.last_exception: Exception = last_exception
+
+
+class CircuitOpenError(RetryError):
+    """Raised without trying the operation while its circuit is open."""
+
+
+class RetryPolicy:
+    """How an operation is retried: up to 'max_attempts' attempts within
+    'deadline' seconds from the first one, waiting a random time between 0 and
+    an exponentially growing backoff between attempts ("full jitter"), so callers
+    failing at the same time don't retry in lockstep.
+    Only the gRPC errors with a retryable status code are retried.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = constant.RETRY_MAX_ATTEMPTS,
+        deadline: float = constant.RETRY_DEADLINE_SEC,
+        initial_backoff: float = constant.RETRY_INITIAL_BACKOFF_SEC,
+        max_backoff: float = constant.RETRY_MAX_BACKOFF_SEC,
+    ):
+        """Constructor of a RetryPolicy object.
+
+        Args:
+            max_attempts (int): max number of attempts, including the first one.
+            deadline (float): max time in seconds from the first attempt
+                to start a new one.
+            initial_backoff (float): the backoff in seconds after the first attempt.
+            max_backoff (float): the max backoff in seconds.
+        """
+
+        self.max_attempts: int = max_attempts
+        self.deadline: float = deadline
+        self.initial_backoff: float = initial_backoff
+        self.max_backoff: float = max_backoff
+
+    @staticmethod
+    def is_retryable(exception: Exception) -> bool:
+        return (
+            isinstance(exception, grpc.RpcError)
+            and exception.code().name in constant.RETRYABLE_GRPC_CODES
+        )
+
+    def get_backoff(self, attempts: int) -> float:
+        """Return the time to wait before the next attempt.
+
+        Args:
+            attempts (int): the number of attempts made so far.
+
+        Returns:
+            float: the time to wait in seconds.
+        """
+
+        backoff = min(self.max_backoff, self.initial_backoff * 2 ** (attempts - 1))
+
+        return random.uniform(0, backoff)
+
+
+_retry_policies: Dict[str, RetryPolicy] = {}
+
+
+def get_retry_policy(operation: str) -> RetryPolicy:
+    """Return the retry policy of an operation: the default one with
+    the overrides of 'RETRY_POLICY_OVERRIDES' for the operation, if any.
+
+    Args:
+        operation (str): the name of the operation, e.g.: 'share_feed_data'.
+
+    Returns:
+        RetryPolicy: the retry policy of the operation.
+    """
+
+    retry_policy = _retry_policies.get(operation)
+    if not retry_policy:
+        retry_policy = _retry_policies.setdefault(
+            operation,
+            RetryPolicy(**constant.RETRY_POLICY_OVERRIDES.get(operation, {})),
+        )
+
+    return retry_policy
+
+
+class RetryBudget:
+    """Limit the retries to a ratio of the operations executed,
+    so that retries can't multiply the load on a struggling Host.
+    Each operation deposits 'ratio' tokens and each retry withdraws one;
+    'min_retries_per_sec' tokens are also deposited every second
+    so that operations executed rarely can still be retried.
+    """
+
+    def __init__(
+        self,
+        ratio: float = constant.RETRY_BUDGET_RATIO,
+        min_retries_per_sec: float = constant.RETRY_BUDGET_MIN_PER_SEC,
+        max_tokens: float = constant.RETRY_BUDGET_MAX_TOKENS,
+    ):
+        """Constructor of a RetryBudget object.
+
+        Args:
+            ratio (float): the max number of retries per operation executed.
+            min_retries_per_sec (float): the retries per second always allowed.
+            max_tokens (float): the max number of retries saved up.
+        """
+
+        self._ratio: float = ratio
+        self._min_retries_per_sec: float = min_retries_per_sec
+        self._max_tokens: float = max_tokens
+        self._tokens: float = max_tokens
+        self._last_refill: float = monotonic()
+        self._lock: Lock = Lock()
+
+    def _refill(self, tokens: float):
+        now = monotonic()
+        self._tokens = min(
+            self._max_tokens,
+            self._tokens
+            + tokens
+            + (now - self._last_refill) * self._min_retries_per_sec,
+        )
+        self._last_refill = now
+
+    def record_operation(self):
+        """Deposit the tokens of a new operation."""
+
+        with self._lock:
+            self._refill(self._ratio)
+
+    def try_retry(self) -> bool:
+        """Withdraw the token of a retry, if any is left.
+
+        Returns:
+            bool: whether the retry is allowed.
+        """
+
+        with self._lock:
+            self._refill(0)
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+
+        return True
+
+
+class CircuitBreaker:
+    """Fail fast while a dependency (e.g.: the IOTICS Host) is down.
+    After 'failure_threshold' consecutive failures the circuit opens and
+    the operations are rejected without being tried. After 'reset_timeout'
+    seconds it is half-open: a single operation is let through as a probe,
+    closing the circuit if it succeeds or opening it again if it fails.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = constant.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC,
+    ):
+        """Constructor of a CircuitBreaker object.
+
+        Args:
+            name (str): the name of the circuit, used for the logs and metrics.
+            failure_threshold (int): consecutive failures opening the circuit.
+            reset_timeout (float): time in seconds before probing an open circuit.
+        """
+
+        self._name: str = name
+        self._failure_threshold: int = failure_threshold
+        self._reset_timeout: float = reset_timeout
+        self._state: str = self.CLOSED
+        self._failures_n: int = 0
+        self._opened_at: float = None
+        self._probe_started_at: float = None
+        self._lock: Lock = Lock()
+
+        registry.gauge(
+            "iotics_circuit_breaker_state",
+            "State of the circuit: 0 closed, 1 half-open, 2 open",
+            ["breaker"],
+            function=lambda: {(self._name,): self._STATE_VALUES[self._state]},
+        )
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+
+        self._state = state
+        CIRCUIT_BREAKER_TRANSITIONS.labels(self._name, state).inc()
+        if state == self.OPEN:
+            self._opened_at = monotonic()
+            log.warning(
+                "Circuit '%s' open: failing fast for %ss",
+                self._name,
+                self._reset_timeout,
+            )
+        else:
+            log.info("Circuit '%s' %s", self._name, state.replace("_", "-"))
+
+    def allow_request(self) -> bool:
+        """Check whether an operation can be tried.
+
+        Returns:
+            bool: False if the circuit is open, or half-open with a probe running.
+        """
+
+        with self._lock:
+            if (
+                self._state == self.OPEN
+                and monotonic() - self._opened_at >= self._reset_timeout
+            ):
+                self._set_state(self.HALF_OPEN)
+
+            if self._state == self.CLOSED:
+                return True
+
+            # A probe that never completed (e.g.: it raised an unrelated exception)
+            # doesn't keep the circuit half-open forever
+            if self._state == self.HALF_OPEN and (
+                self._probe_started_at is None
+                or monotonic() - self._probe_started_at >= self._reset_timeout
+            ):
+                self._probe_started_at = monotonic()
+                return True
+
+        CIRCUIT_BREAKER_REJECTIONS.labels(self._name).inc()
+
+        return False
+
+    def record_success(self):
+        """Record an operation completed, i.e.: the dependency is up."""
+
+        with self._lock:
+            self._failures_n = 0
+            self._probe_started_at = None
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        """Record an operation failed because the dependency is down."""
+
+        with self._lock:
+            self._failures_n += 1
+            if self._state == self.HALF_OPEN or (
+                self._failures_n >= self._failure_threshold
+            ):
+                self._probe_started_at = None
+                self._set_state(self.OPEN)
+
+
+# Shared by all the operations on the IOTICS Host of a Connector
+retry_budget = RetryBudget()
+host_circuit_breaker = CircuitBreaker(name="iotics_host")
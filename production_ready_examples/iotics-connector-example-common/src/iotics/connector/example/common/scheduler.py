@@ -0,0 +1,353 @@
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from itertools import count
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Tuple
+
+import constants as constant
+from metrics import registry
+from sketches import KLLSketch, MinMaxSumCount
+
+log = logging.getLogger(__name__)
+
+STALE_TASKS = registry.counter(
+    "iotics_scheduler_stale_tasks_total",
+    "Number of fanned out tasks dropped because a newer run of their job started",
+    ["job"],
+)
+
+
+class _PeriodicJob:
+    """A function to be called every 'period' seconds."""
+
+    __slots__ = (
+        "job_id",
+        "function",
+        "args",
+        "period",
+        "next_run",
+        "running",
+        "cancelled",
+        "skipped_runs",
+        "jitter",
+        "jitter_quantiles",
+    )
+
+    def __init__(
+        self, job_id: str, function: Callable, args: tuple, period: float, phase: float
+    ):
+        self.job_id: str = job_id
+        self.function: Callable = function
+        self.args: tuple = args
+        self.period: float = period
+        self.next_run: float = monotonic() + phase
+        self.running: bool = False
+        self.cancelled: bool = False
+        self.skipped_runs: int = 0
+        self.jitter: MinMaxSumCount = MinMaxSumCount()
+        self.jitter_quantiles: KLLSketch = KLLSketch()
+
+
+def get_phase(job_id: str, period: float) -> float:
+    """Return the initial delay of a job so that jobs with the same period
+    are spread uniformly across it instead of firing all at once.
+    The phase is derived from the job ID so it is stable across restarts.
+
+    Args:
+        job_id (str): the ID of the job.
+        period (float): the period of the job in seconds.
+
+    Returns:
+        float: the initial delay of the job in seconds.
+    """
+
+    hashed_job_id = int.from_bytes(
+        blake2b(job_id.encode(), digest_size=8).digest(), "big"
+    )
+
+    return period * hashed_job_id / (1 << 64)
+
+
+class PeriodicScheduler:
+    """Single-threaded scheduler of periodic jobs. Jobs are kept in a heap
+    ordered by their next run time and executed by a small pool of worker threads,
+    so the number of threads doesn't grow with the number of jobs.
+    Jobs run at a fixed rate (i.e.: a late run doesn't shift the following ones)
+    and a job is never executed concurrently with itself: if it is still running
+    when it is due again, that run is skipped.
+    The delay between the time a job is due and the time it actually starts
+    (jitter) is recorded for each job.
+    A job can fan out its work (e.g.: one task per Twin) with 'fan_out',
+    which queues at most one chunk of tasks per worker for each run.
+    """
+
+    def __init__(
+        self,
+        workers_n: int = constant.SCHEDULER_WORKERS,
+        stats_period: float = constant.SCHEDULER_STATS_PERIOD_SEC,
+    ):
+        """Constructor of a PeriodicScheduler object.
+
+        Args:
+            workers_n (int): number of worker threads executing the jobs.
+            stats_period (float): how often (in seconds) the jitter statistics
+                are logged. 0 disables logging.
+        """
+
+        self._workers_n: int = workers_n
+        self._stats_period: float = stats_period
+
+        self._jobs: Dict[str, _PeriodicJob] = {}
+        # By job ID, the number of the latest run that fanned out its tasks
+        self._fan_out_runs: Dict[str, int] = {}
+        self._heap: List[Tuple[float, int, _PeriodicJob]] = []
+        self._sequence = count()
+        self._condition: Condition = Condition()
+        self._stopped: Event = Event()
+        self._executor: ThreadPoolExecutor = None
+        self._scheduler_thread: Thread = None
+
+    def add_job(
+        self,
+        job_id: str,
+        function: Callable,
+        period: float,
+        args: tuple = (),
+        phase: float = None,
+    ):
+        """Schedule a function to be called periodically.
+
+        Args:
+            job_id (str): unique ID of the job, used for the jitter statistics.
+            function (Callable): the function to call.
+            period (float): the period in seconds.
+            args (tuple, optional): the arguments of the function.
+            phase (float, optional): the delay before the first run in seconds.
+                By default it is derived from the job ID to spread the jobs
+                across the period.
+        """
+
+        if phase is None:
+            phase = get_phase(job_id, period)
+
+        job = _PeriodicJob(
+            job_id=job_id, function=function, args=args, period=period, phase=phase
+        )
+
+        with self._condition:
+            if job_id in self._jobs:
+                raise ValueError(f"Job {job_id} already scheduled")
+
+            self._jobs[job_id] = job
+            self._push(job)
+            self._condition.notify()
+
+        log.debug("Scheduled job %s every %ss (phase %.3fs)", job_id, period, phase)
+
+    def remove_job(self, job_id: str):
+        """Stop calling a job. A run already started is not interrupted.
+
+        Args:
+            job_id (str): the ID of the job.
+        """
+
+        with self._condition:
+            job = self._jobs.pop(job_id, None)
+            if job:
+                job.cancelled = True
+
+    def fan_out(self, job_id: str, function: Callable, args_list: List[tuple]):
+        """Spread the work of a run of a periodic job across the pool of workers.
+        The tasks are split into one chunk per worker rather than queued one by one,
+        so the queue of the pool doesn't grow with the number of tasks.
+        The tasks of a run not started yet when the next run of the same job
+        fans out its own tasks are stale: they are dropped and counted.
+
+        Args:
+            job_id (str): the ID of the job fanning out its work.
+            function (Callable): the function to call for each task.
+            args_list (List[tuple]): the arguments of the function for each task.
+        """
+
+        with self._condition:
+            run_n = self._fan_out_runs.get(job_id, 0) + 1
+            self._fan_out_runs[job_id] = run_n
+
+        chunks_n = min(self._workers_n, len(args_list))
+        for chunk_n in range(chunks_n):
+            self._executor.submit(
+                self._run_chunk,
+                job_id,
+                run_n,
+                function,
+                args_list[chunk_n::chunks_n],
+            )
+
+    def _run_chunk(
+        self, job_id: str, run_n: int, function: Callable, args_list: List[tuple]
+    ):
+        for task_n, args in enumerate(args_list):
+            if self._fan_out_runs.get(job_id) != run_n:
+                stale_tasks_n = len(args_list) - task_n
+                STALE_TASKS.labels(job_id).inc(stale_tasks_n)
+                log.debug(
+                    "Job %s run again, dropping %d stale tasks", job_id, stale_tasks_n
+                )
+                return
+
+            try:
+                function(*args)
+            except Exception as ex:
+                log.exception("Task %s raised an exception: %s", function.__name__, ex)
+
+    def _push(self, job: _PeriodicJob):
+        heapq.heappush(self._heap, (job.next_run, next(self._sequence), job))
+
+    def _run_job(self, job: _PeriodicJob, scheduled_time: float):
+        jitter = monotonic() - scheduled_time
+        job.jitter.add(jitter)
+        job.jitter_quantiles.add(jitter)
+
+        try:
+            job.function(*job.args)
+        except Exception as ex:
+            log.exception("Job %s raised an exception: %s", job.job_id, ex)
+        finally:
+            job.running = False
+
+    def _dispatch_due_jobs(self) -> float:
+        """Submit the jobs that are due to the worker pool.
+
+        Returns:
+            float: the number of seconds until the next job is due.
+        """
+
+        now = monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            scheduled_time, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+
+            if job.running:
+                job.skipped_runs += 1
+                log.debug("Job %s still running, skipping this run", job.job_id)
+            else:
+                job.running = True
+                self._executor.submit(self._run_job, job, scheduled_time)
+
+            # Fixed-rate scheduling: the next run doesn't depend on when
+            # this one actually started. Runs missed by more than a period
+            # are not caught up.
+            job.next_run = scheduled_time + job.period
+            if job.next_run <= now:
+                missed_periods = int((now - job.next_run) // job.period) + 1
+                job.skipped_runs += missed_periods
+                job.next_run += missed_periods * job.period
+            self._push(job)
+
+        if not self._heap:
+            return None
+
+        return max(self._heap[0][0] - now, 0)
+
+    def _scheduler_loop(self):
+        with self._condition:
+            while not self._stopped.is_set():
+                timeout = self._dispatch_due_jobs()
+                self._condition.wait(timeout)
+
+    def get_jitter_stats(self) -> Dict[str, dict]:
+        """Return the jitter statistics (in seconds) of each job.
+
+        Returns:
+            Dict[str, dict]: the jitter statistics by job ID.
+        """
+
+        jitter_stats: Dict[str, dict] = {}
+        for job_id, job in list(self._jobs.items()):
+            jitter_stats[job_id] = {
+                "runs": job.jitter.count,
+                "skipped_runs": job.skipped_runs,
+                "mean": job.jitter.mean,
+                "p50": job.jitter_quantiles.quantile(0.5),
+                "p99": job.jitter_quantiles.quantile(0.99),
+                "max": job.jitter.max_value,
+            }
+
+        return jitter_stats
+
+    def log_jitter_stats(self):
+        """Log the overall jitter statistics and the job with the worst jitter."""
+
+        overall_jitter = MinMaxSumCount()
+        overall_quantiles = KLLSketch()
+        skipped_runs = 0
+        worst_job: _PeriodicJob = None
+
+        for job in list(self._jobs.values()):
+            overall_jitter.merge(job.jitter)
+            overall_quantiles.merge(job.jitter_quantiles)
+            skipped_runs += job.skipped_runs
+            if job.jitter.count and (
+                worst_job is None or job.jitter.max_value > worst_job.jitter.max_value
+            ):
+                worst_job = job
+
+        if not overall_jitter.count:
+            return
+
+        log.info(
+            "Scheduler: %d jobs, %d runs, %d skipped, jitter mean %.1fms "
+            "p99 %.1fms max %.1fms (job %s)",
+            len(self._jobs),
+            overall_jitter.count,
+            skipped_runs,
+            overall_jitter.mean * 1000,
+            overall_quantiles.quantile(0.99) * 1000,
+            overall_jitter.max_value * 1000,
+            worst_job.job_id,
+        )
+
+    def start(self):
+        """Start the scheduler Thread and the pool of workers."""
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers_n, thread_name_prefix="scheduler_worker"
+        )
+        self._scheduler_thread = Thread(
+            target=self._scheduler_loop, name="scheduler", daemon=True
+        )
+        self._scheduler_thread.start()
+        # The statistics are logged by a job so the scheduler Thread
+        # is never delayed by them
+        if self._stats_period:
+            self.add_job(
+                job_id="scheduler_stats",
+                function=self.log_jitter_stats,
+                period=self._stats_period,
+                phase=self._stats_period,
+            )
+
+        log.debug("Scheduler started with %d workers", self._workers_n)
+
+    def stop(self):
+        """Stop scheduling new runs and wait for the running ones to complete."""
+
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify()
+
+        if self._scheduler_thread:
+            self._scheduler_thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    def join(self):
+        """Block until the scheduler is stopped."""
+
+        self._stopped.wait()
+        if self._scheduler_thread:
+            self._scheduler_thread.join()
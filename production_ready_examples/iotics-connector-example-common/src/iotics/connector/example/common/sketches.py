@@ -0,0 +1,358 @@
+import logging
+import math
+from hashlib import blake2b
+from random import Random
+from typing import Iterable, List
+
+import constants as constant
+
+log = logging.getLogger(__name__)
+
+
+class MinMaxSumCount:
+    """Mergeable summary keeping the Min, Max, Sum and Count of a set of values."""
+
+    __slots__ = ("count", "total", "min_value", "max_value")
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min_value: float = None
+        self.max_value: float = None
+
+    def add(self, value: float):
+        """Add a new value to the summary.
+
+        Args:
+            value (float): the value to add.
+        """
+
+        self.count += 1
+        self.total += value
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def merge(self, other: "MinMaxSumCount"):
+        """Merge another summary into this one.
+
+        Args:
+            other (MinMaxSumCount): the summary to merge.
+        """
+
+        if not other.count:
+            return
+
+        self.count += other.count
+        self.total += other.total
+        if self.min_value is None or other.min_value < self.min_value:
+            self.min_value = other.min_value
+        if self.max_value is None or other.max_value > self.max_value:
+            self.max_value = other.max_value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min_value,
+            "max": self.max_value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MinMaxSumCount":
+        summary = cls()
+        summary.count = data["count"]
+        summary.total = data["total"]
+        summary.min_value = data["min"]
+        summary.max_value = data["max"]
+
+        return summary
+
+
+class KLLSketch:
+    """Mergeable quantile sketch based on the KLL algorithm
+    (Karnin, Lang, Liberty - "Optimal Quantile Approximation in Streams").
+    The memory used is bounded by roughly 3*k items regardless of the number
+    of values added.
+    """
+
+    def __init__(self, k: int = constant.KLL_SKETCH_K, seed: int = None):
+        self._k: int = k
+        self._random: Random = Random(seed)
+        self._compactors: List[List[float]] = [[]]
+        self._size: int = 0
+        self._max_size: int = 0
+
+        self._update_max_size()
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self._compactors) - height - 1
+        return int(math.ceil((2 / 3) ** depth * self._k)) + 1
+
+    def _update_max_size(self):
+        self._max_size = sum(
+            self._capacity(height) for height in range(len(self._compactors))
+        )
+
+    def _compact(self, height: int) -> List[float]:
+        """Sort the items of a compactor and promote every other item
+        (starting from a random offset) to the next level.
+        """
+
+        items = sorted(self._compactors[height])
+        leftover = [items.pop()] if len(items) % 2 else []
+        self._compactors[height] = leftover
+
+        return items[self._random.randint(0, 1) :: 2]
+
+    def _compress(self):
+        for height in range(len(self._compactors)):
+            if len(self._compactors[height]) >= self._capacity(height):
+                if height + 1 >= len(self._compactors):
+                    self._compactors.append([])
+                    self._update_max_size()
+                self._compactors[height + 1].extend(self._compact(height))
+                self._size = sum(len(compactor) for compactor in self._compactors)
+                if self._size < self._max_size:
+                    break
+
+    def add(self, value: float):
+        """Add a new value to the sketch.
+
+        Args:
+            value (float): the value to add.
+        """
+
+        self._compactors[0].append(value)
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        """Merge another sketch into this one.
+
+        Args:
+            other (KLLSketch): the sketch to merge.
+        """
+
+        while len(self._compactors) < len(other._compactors):
+            self._compactors.append([])
+        self._update_max_size()
+
+        for height, compactor in enumerate(other._compactors):
+            self._compactors[height].extend(compactor)
+
+        self._size = sum(len(compactor) for compactor in self._compactors)
+        while self._size >= self._max_size:
+            self._compress()
+
+    @property
+    def count(self) -> int:
+        """Number of values represented by the sketch."""
+
+        return sum(
+            len(compactor) << height
+            for height, compactor in enumerate(self._compactors)
+        )
+
+    def quantile(self, q: float) -> float:
+        """Return the approximate value at a given quantile.
+
+        Args:
+            q (float): the quantile, between 0 and 1.
+
+        Returns:
+            float: the approximate value, None if the sketch is empty.
+        """
+
+        weighted_items = sorted(
+            (item, 1 << height)
+            for height, compactor in enumerate(self._compactors)
+            for item in compactor
+        )
+        if not weighted_items:
+            return None
+
+        target_weight = q * sum(weight for _, weight in weighted_items)
+        cumulative_weight = 0
+        for item, weight in weighted_items:
+            cumulative_weight += weight
+            if cumulative_weight >= target_weight:
+                return item
+
+        return weighted_items[-1][0]
+
+    def to_dict(self) -> dict:
+        return {"k": self._k, "compactors": self._compactors}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch._compactors = [list(compactor) for compactor in data["compactors"]]
+        sketch._size = sum(len(compactor) for compactor in sketch._compactors)
+        sketch._update_max_size()
+
+        return sketch
+
+
+class HyperLogLog:
+    """Mergeable estimator of the number of distinct items added."""
+
+    def __init__(self, precision: int = constant.HLL_PRECISION):
+        self._precision: int = precision
+        self._registers: bytearray = bytearray(1 << precision)
+
+    def add(self, item: str):
+        """Add a new item to the estimator.
+
+        Args:
+            item (str): the item to add.
+        """
+
+        hashed_item = int.from_bytes(
+            blake2b(item.encode(), digest_size=8).digest(), "big"
+        )
+        index = hashed_item >> (64 - self._precision)
+        remaining_bits = hashed_item & ((1 << (64 - self._precision)) - 1)
+        rank = (64 - self._precision) - remaining_bits.bit_length() + 1
+
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Merge another estimator into this one.
+
+        Args:
+            other (HyperLogLog): the estimator to merge.
+        """
+
+        if other._precision != self._precision:
+            raise ValueError("Cannot merge HyperLogLog with different precisions")
+
+        self._registers = bytearray(
+            max(register, other_register)
+            for register, other_register in zip(self._registers, other._registers)
+        )
+
+    def count(self) -> int:
+        """Return the estimated number of distinct items."""
+
+        registers_n = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers_n)
+        estimate = (
+            alpha * registers_n**2 / sum(2.0**-register for register in self._registers)
+        )
+
+        # Small range correction
+        empty_registers = self._registers.count(0)
+        if estimate <= 2.5 * registers_n and empty_registers:
+            estimate = registers_n * math.log(registers_n / empty_registers)
+
+        return round(estimate)
+
+    def to_dict(self) -> dict:
+        return {"precision": self._precision, "registers": self._registers.hex()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        hyper_log_log = cls(precision=data["precision"])
+        hyper_log_log._registers = bytearray.fromhex(data["registers"])
+
+        return hyper_log_log
+
+
+class FeedSummary:
+    """Mergeable summary of the data received from a set of Feeds. It keeps
+    Min/Max/Sum/Count, approximate quantiles and the approximate number
+    of distinct Twins that shared the data.
+    """
+
+    def __init__(self):
+        self.stats: MinMaxSumCount = MinMaxSumCount()
+        self.quantiles: KLLSketch = KLLSketch()
+        self.twins: HyperLogLog = HyperLogLog()
+
+    def add(self, value: float, twin_did: str = None):
+        """Add a new value to the summary.
+
+        Args:
+            value (float): the value to add.
+            twin_did (str, optional): the Twin DID that shared the value.
+        """
+
+        self.stats.add(value)
+        self.quantiles.add(value)
+        if twin_did:
+            self.twins.add(twin_did)
+
+    def merge(self, other: "FeedSummary"):
+        """Merge another summary into this one.
+
+        Args:
+            other (FeedSummary): the summary to merge.
+        """
+
+        self.stats.merge(other.stats)
+        self.quantiles.merge(other.quantiles)
+        self.twins.merge(other.twins)
+
+    @property
+    def count(self) -> int:
+        return self.stats.count
+
+    def to_dict(self) -> dict:
+        return {
+            "stats": self.stats.to_dict(),
+            "quantiles": self.quantiles.to_dict(),
+            "twins": self.twins.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FeedSummary":
+        summary = cls()
+        summary.stats = MinMaxSumCount.from_dict(data["stats"])
+        summary.quantiles = KLLSketch.from_dict(data["quantiles"])
+        summary.twins = HyperLogLog.from_dict(data["twins"])
+
+        return summary
+
+
+def merge_summaries(summaries: Iterable[FeedSummary]) -> FeedSummary:
+    """Combine a set of partial summaries into a single one.
+
+    Args:
+        summaries (Iterable[FeedSummary]): the partial summaries to combine.
+
+    Returns:
+        FeedSummary: the merged summary.
+    """
+
+    merged_summary = FeedSummary()
+    for summary in summaries:
+        merged_summary.merge(summary)
+
+    log.debug("Merged summaries with a total of %d items", merged_summary.count)
+
+    return merged_summary
+
+
+def get_shard_index(key: str, shard_count: int) -> int:
+    """Return the shard a key belongs to. The hash is stable across processes
+    so independent replicas agree on the partitioning.
+
+    Args:
+        key (str): the key to partition (e.g.: the Twin DID).
+        shard_count (int): the number of shards.
+
+    Returns:
+        int: the index of the shard the key belongs to.
+    """
+
+    hashed_key = int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    return hashed_key % shard_count
@@ -0,0 +1,100 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+import constants as constant
+from metrics import registry
+
+log = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = registry.counter(
+    "iotics_cache_lookups_total", "Number of cache lookups", ["cache", "result"]
+)
+
+
+class TTLCache:
+    """Thread-safe cache whose entries expire 'ttl' seconds after being stored.
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float = constant.CACHE_TTL_SEC,
+        max_size: int = constant.CACHE_MAX_SIZE,
+    ):
+        """Constructor of a TTLCache object.
+
+        Args:
+            name (str): the name of the cache, used for the metrics.
+            ttl (float): how long (in seconds) an entry is valid. 0 disables the cache.
+            max_size (int): max number of entries.
+        """
+
+        self._name: str = name
+        self._ttl: float = ttl
+        self._max_size: int = max_size
+        # By key: the time the entry expires and its value
+        self._entries: OrderedDict = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value stored for a key if it is not expired.
+
+        Args:
+            key (Hashable): the key of the entry.
+            default (Any, optional): the value returned if there's no valid entry.
+
+        Returns:
+            Any: the value of the entry, or 'default'.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                CACHE_LOOKUPS.labels(self._name, "miss").inc()
+                return default
+
+            expires_at, value = entry
+            if expires_at <= monotonic():
+                del self._entries[key]
+                CACHE_LOOKUPS.labels(self._name, "expired").inc()
+                return default
+
+            self._entries.move_to_end(key)
+
+        CACHE_LOOKUPS.labels(self._name, "hit").inc()
+
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value for a key, replacing the previous one.
+
+        Args:
+            key (Hashable): the key of the entry.
+            value (Any): the value to store.
+        """
+
+        if not self._ttl:
+            return
+
+        with self._lock:
+            self._entries[key] = (monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Remove the entry of a key, if any.
+
+        Args:
+            key (Hashable): the key of the entry.
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
@@ -1,17 +1,46 @@
 import logging
 import sys
 from threading import Lock
-from time import sleep
+from time import monotonic, perf_counter, sleep, time
 from uuid import uuid4
 
 import constants as constant
 import grpc
 import requests
-from iotics.api import search_pb2
+from google.protobuf.timestamp_pb2 import Timestamp
+from iotics.api import common_pb2, feed_pb2, search_pb2
+from iotics.lib.grpc.helpers import create_headers
 from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import registry
+from retry_policy import (
+    CircuitOpenError,
+    RetryError,
+    get_retry_policy,
+    host_circuit_breaker,
+    retry_budget,
+)
 
 log = logging.getLogger(__name__)
 
+RPC_CALLS = registry.counter(
+    "iotics_rpc_calls_total",
+    "Number of IOTICS operations executed, by outcome",
+    ["operation", "status"],
+)
+RPC_DURATION = registry.histogram(
+    "iotics_rpc_duration_seconds", "Duration of the IOTICS operations", ["operation"]
+)
+RPC_RETRIES = registry.counter(
+    "iotics_rpc_retries_total",
+    "Number of IOTICS operations retried after a failure",
+    ["operation"],
+)
+RPC_GIVE_UPS = registry.counter(
+    "iotics_rpc_give_ups_total",
+    "Number of IOTICS operations failed without being retried any more, by reason",
+    ["operation", "reason"],
+)
+
 
 @staticmethod
 def check_global_var(var, var_name: str):
@@ -46,6 +75,48 @@ def get_host_endpoints(host_url: str) -> dict:
     return req_resp
 
 
+def get_feed_period(feed_properties) -> float:
+    """Return the update period of a Feed from its metadata, if any.
+
+    Args:
+        feed_properties: the properties of the Feed.
+
+    Returns:
+        float: the seconds between two data samples, None if unknown.
+    """
+
+    for feed_property in feed_properties:
+        if feed_property.key == constant.PROPERTY_KEY_UPDATE_PERIOD:
+            try:
+                return float(feed_property.literalValue.value)
+            except ValueError:
+                log.warning("Invalid Feed update period: %s", feed_property)
+
+    return None
+
+
+def get_feed_message_period(feed_properties) -> float:
+    """Return the number of seconds between two messages of a Feed from its
+    metadata. It is longer than the update period when the data samples
+    are shared in batches, otherwise the two are the same.
+
+    Args:
+        feed_properties: the properties of the Feed.
+
+    Returns:
+        float: the seconds between two Feed messages, None if unknown.
+    """
+
+    for feed_property in feed_properties:
+        if feed_property.key == constant.PROPERTY_KEY_MESSAGE_PERIOD:
+            try:
+                return float(feed_property.literalValue.value)
+            except ValueError:
+                log.warning("Invalid Feed message period: %s", feed_property)
+
+    return get_feed_period(feed_properties)
+
+
 def search_twins(
     search_criteria: search_pb2.SearchRequest.Payload,
     refresh_token_lock: Lock,
@@ -72,21 +143,22 @@ def search_twins(
 
     twins_found_list = []
 
+    def search_twins_once():
+        twins = []
+        for response in iotics_api.search_iter(
+            client_app_id=uuid4().hex, payload=search_criteria, scope=scope
+        ):
+            twins.extend(response.payload.twins)
+
+        return twins
+
     while True:
-        for attempt in range(constant.RETRYING_ATTEMPTS):
-            try:
-                with refresh_token_lock:
-                    for response in iotics_api.search_iter(
-                        client_app_id=uuid4().hex, payload=search_criteria, scope=scope
-                    ):
-                        twins = response.payload.twins
-                        twins_found_list.extend(twins)
-            except grpc.RpcError as ex:
-                if not expected_grpc_exception(exception=ex, operation="search_twins"):
-                    break
-                log.debug("Attempt #%d", attempt + 1)
-            else:
-                break
+        try:
+            twins_found_list = retry_on_exception(
+                search_twins_once, "search_twins", refresh_token_lock
+            )
+        except RetryError as ex:
+            log.warning("Search Twins failed: %s", ex)
 
         if not twins_found_list and keep_searching:
             log.info(
@@ -131,10 +203,30 @@ def expected_grpc_exception(exception, operation: str) -> bool:
     return expected_exception
 
 
+def wait_for_token_refresh(refresh_token_lock: Lock):
+    """Wait until the token refresh in progress, if any, has replaced
+    the gRPC channel. The lock is only held by the token refresh
+    (see 'Identity.auto_refresh_token') and not during the IOTICS operations,
+    so that they can run concurrently: the channel replaced isn't closed
+    and the previous token is still valid, so the operations in flight
+    complete on it.
+
+    Args:
+        refresh_token_lock (Lock): held while the token is refreshed.
+    """
+
+    with refresh_token_lock:
+        pass
+
+
 def retry_on_exception(
     grpc_operation, function_name: str, refresh_token_lock: Lock, *args, **kwargs
 ):
     """Wrapper to safely retry IOTICS operations in case of failure.
+    The operation is retried according to its RetryPolicy (see 'retry_policy.py'):
+    with exponential backoff and full jitter, within a deadline and as long as
+    the retry budget of the Connector allows it. While the Host is down
+    (i.e.: the circuit is open) the operations fail straight away.
 
     Args:
         grpc_operation: IOTICS operation to execute.
@@ -143,28 +235,106 @@ def retry_on_exception(
 
     Returns:
         operation_result: object returned by the function executed.
+
+    Raises:
+        RetryError: if the operation failed and won't be retried any more,
+            CircuitOpenError if it hasn't been tried because the Host is down.
     """
 
-    operation_result = None
-    operation_successful: bool = False
-    retry_sleep_time: int = 1
+    retry_policy = get_retry_policy(function_name)
+    deadline = monotonic() + retry_policy.deadline
+    attempts: int = 0
+    last_exception: Exception = None
+
+    retry_budget.record_operation()
+    while True:
+        if not host_circuit_breaker.allow_request():
+            RPC_GIVE_UPS.labels(function_name, "circuit_open").inc()
+            raise CircuitOpenError(
+                function_name, attempts, "circuit open", last_exception
+            )
 
-    for attempt in range(constant.RETRYING_ATTEMPTS):
+        attempts += 1
         try:
-            with refresh_token_lock:
-                operation_result = grpc_operation(*args, **kwargs)
+            wait_for_token_refresh(refresh_token_lock)
+            started_at = perf_counter()
+            operation_result = grpc_operation(*args, **kwargs)
         except grpc.RpcError as ex:
-            if not expected_grpc_exception(exception=ex, operation=function_name):
-                log.warning("Retry attempt #%d", attempt + 1)
+            RPC_CALLS.labels(function_name, ex.code().name).inc()
+            expected_grpc_exception(exception=ex, operation=function_name)
+            if ex.code().name in constant.CIRCUIT_BREAKER_FAILURE_GRPC_CODES:
+                host_circuit_breaker.record_failure()
+            else:
+                host_circuit_breaker.record_success()
+            last_exception = ex
         else:
-            operation_successful = True
-            break
+            RPC_DURATION.labels(function_name).observe(perf_counter() - started_at)
+            RPC_CALLS.labels(function_name, "OK").inc()
+            host_circuit_breaker.record_success()
+            return operation_result
+
+        backoff = retry_policy.get_backoff(attempts)
+        if not retry_policy.is_retryable(last_exception):
+            give_up_reason = "not retryable"
+        elif attempts >= retry_policy.max_attempts:
+            give_up_reason = "max attempts"
+        elif monotonic() + backoff > deadline:
+            give_up_reason = "deadline"
+        elif not retry_budget.try_retry():
+            give_up_reason = "retry budget exhausted"
+        else:
+            give_up_reason = None
 
-        sleep(retry_sleep_time)
-        retry_sleep_time += 2
+        if give_up_reason:
+            RPC_GIVE_UPS.labels(function_name, give_up_reason.replace(" ", "_")).inc()
+            raise RetryError(
+                function_name, attempts, give_up_reason, last_exception
+            ) from last_exception
 
-    if not operation_successful:
-        log.exception("Reached maximum number of retries. Exiting thread..")
-        sys.exit(1)
+        RPC_RETRIES.labels(function_name).inc()
+        log.warning(
+            "Retrying '%s' in %.2fs (attempt #%d)", function_name, backoff, attempts + 1
+        )
+        sleep(backoff)
+
+
+def share_encoded_feed_data(
+    iotics_api: IoticsApi,
+    twin_did: str,
+    feed_id: str,
+    data: bytes,
+    mime: str,
+    occurred_at: int = None,
+):
+    """Share a payload already encoded with a given MIME type. Unlike
+    'IoticsApi.share_feed_data', which always encodes the data as JSON,
+    this allows any of the codecs of 'payload_codec.py' to be used.
+
+    Args:
+        iotics_api (IoticsApi): the instance of IOTICS gRPC API.
+        twin_did (str): the Twin DID sharing the data.
+        feed_id (str): the Feed ID from which to share the data.
+        data (bytes): the payload already encoded.
+        mime (str): the MIME type of the payload.
+        occurred_at (int, optional): the time at which the data was captured
+            in seconds since the epoch. Defaults to now.
+
+    Returns:
+        ShareFeedDataResponse: the response of the Share Feed Data operation.
+    """
+
+    request = feed_pb2.ShareFeedDataRequest(
+        headers=create_headers(),
+        args=feed_pb2.ShareFeedDataRequest.Arguments(
+            feedId=feed_pb2.FeedID(id=feed_id, twinId=twin_did)
+        ),
+        payload=feed_pb2.ShareFeedDataRequest.Payload(
+            sample=common_pb2.FeedData(
+                occurredAt=Timestamp(seconds=occurred_at or int(time())),
+                mime=mime,
+                data=data,
+            )
+        ),
+    )
 
-    return operation_result
+    return iotics_api.feed_api.stub.ShareFeedData(request)
@@ -0,0 +1,173 @@
+import logging
+import math
+from typing import Dict, List, Optional
+
+import constants as constant
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class SignalModel:
+    """Parameters of the signal simulated for a type of reading:
+    a random walk around a mean value, plus a daily seasonality,
+    plus white noise, with a probability of each reading being dropped.
+    """
+
+    def __init__(
+        self,
+        mean: float,
+        min_value: float,
+        max_value: float,
+        walk_step: float,
+        seasonality_amplitude: float,
+        noise_std: float,
+        dropout_rate: float = constant.SIMULATION_DROPOUT_RATE,
+        seasonality_period: float = constant.SIMULATION_SEASONALITY_PERIOD_SEC,
+        decimals: int = 2,
+    ):
+        self.mean: float = mean
+        self.min_value: float = min_value
+        self.max_value: float = max_value
+        self.walk_step: float = walk_step
+        self.seasonality_amplitude: float = seasonality_amplitude
+        self.noise_std: float = noise_std
+        self.dropout_rate: float = dropout_rate
+        self.seasonality_period: float = seasonality_period
+        self.decimals: int = decimals
+
+
+DEFAULT_SIGNAL_MODELS = {
+    constant.TEMPERATURE_FEED_ID: SignalModel(
+        mean=(constant.MIN_TEMP_VALUE + constant.MAX_TEMP_VALUE) / 2,
+        min_value=constant.MIN_TEMP_VALUE,
+        max_value=constant.MAX_TEMP_VALUE,
+        walk_step=0.2,
+        seasonality_amplitude=5,
+        noise_std=0.3,
+    ),
+    constant.HUMIDITY_FEED_ID: SignalModel(
+        mean=(constant.MIN_HUM_VALUE + constant.MAX_HUM_VALUE) / 2,
+        min_value=constant.MIN_HUM_VALUE,
+        max_value=constant.MAX_HUM_VALUE,
+        walk_step=1,
+        seasonality_amplitude=15,
+        noise_std=2,
+        decimals=0,
+    ),
+}
+
+
+class VectorisedDataSource:
+    """Object simulating a set of N sensors. The readings of all the sensors
+    are generated in a single NumPy operation per tick, so thousands
+    of sensors can be simulated from a single process.
+    """
+
+    def __init__(
+        self,
+        sensors_n: int,
+        seed: int = None,
+        signal_models: Dict[str, SignalModel] = None,
+    ):
+        """Constructor of a VectorisedDataSource object.
+
+        Args:
+            sensors_n (int): the number of sensors to simulate.
+            seed (int, optional): seed of the random generator. The same seed
+                generates the same sequence of readings.
+            signal_models (Dict[str, SignalModel], optional): the signal model
+                of each Feed ID. Temperature and Humidity by default.
+        """
+
+        self._sensors_n: int = sensors_n
+        self._signal_models: Dict[str, SignalModel] = (
+            signal_models or DEFAULT_SIGNAL_MODELS
+        )
+        self._rng: np.random.Generator = np.random.default_rng(seed)
+
+        # The random walk offset and the seasonality phase of each sensor
+        self._walk_offsets: Dict[str, np.ndarray] = {}
+        self._seasonality_phases: Dict[str, np.ndarray] = {}
+        for feed_id in self._signal_models:
+            self._walk_offsets[feed_id] = np.zeros(sensors_n)
+            self._seasonality_phases[feed_id] = self._rng.uniform(
+                0, 2 * math.pi, sensors_n
+            )
+
+        log.debug(
+            "Vectorised data source initialised with %d sensors (seed %s)",
+            sensors_n,
+            seed,
+        )
+
+    @property
+    def sensors_n(self) -> int:
+        return self._sensors_n
+
+    def generate_readings(self, feed_id: str, timestamp: float) -> np.ndarray:
+        """Generate a new reading for each sensor.
+
+        Args:
+            feed_id (str): the Feed ID, used to select the signal model.
+            timestamp (float): the time of the readings in seconds since the epoch,
+                used to compute the seasonality.
+
+        Returns:
+            np.ndarray: one reading per sensor, NaN for the readings dropped.
+        """
+
+        signal_model = self._signal_models[feed_id]
+
+        walk_offsets = self._walk_offsets[feed_id]
+        walk_offsets += self._rng.normal(0, signal_model.walk_step, self._sensors_n)
+        # Keep the random walk within the range of the values
+        half_range = (signal_model.max_value - signal_model.min_value) / 2
+        np.clip(walk_offsets, -half_range, half_range, out=walk_offsets)
+
+        seasonality = signal_model.seasonality_amplitude * np.sin(
+            2 * math.pi * timestamp / signal_model.seasonality_period
+            + self._seasonality_phases[feed_id]
+        )
+        noise = self._rng.normal(0, signal_model.noise_std, self._sensors_n)
+
+        readings = signal_model.mean + walk_offsets + seasonality + noise
+        np.clip(readings, signal_model.min_value, signal_model.max_value, out=readings)
+        readings = np.round(readings, signal_model.decimals)
+
+        dropouts = self._rng.random(self._sensors_n) < signal_model.dropout_rate
+        readings[dropouts] = np.nan
+
+        return readings
+
+    def generate_data_samples(
+        self, feed_id: str, timestamp: float
+    ) -> List[Optional[dict]]:
+        """Generate a new data sample for each sensor.
+
+        Args:
+            feed_id (str): the Feed ID, used to select the signal model.
+            timestamp (float): the time of the readings in seconds since the epoch.
+
+        Returns:
+            List[Optional[dict]]: one data sample per sensor,
+                None for the readings dropped.
+        """
+
+        readings = self.generate_readings(feed_id, timestamp)
+        is_integer = self._signal_models[feed_id].decimals == 0
+
+        data_samples: List[Optional[dict]] = []
+        for reading in readings.tolist():
+            if math.isnan(reading):
+                data_samples.append(None)
+            else:
+                data_samples.append(
+                    {
+                        constant.SENSOR_FEED_VALUE: (
+                            int(reading) if is_integer else reading
+                        )
+                    }
+                )
+
+        return data_samples
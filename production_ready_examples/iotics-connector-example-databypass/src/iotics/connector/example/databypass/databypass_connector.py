@@ -1,18 +1,24 @@
 import logging
 import os
 from threading import Lock, Thread
-from typing import List
+from time import sleep
+from typing import List, Tuple
 
 import constants as constant
 import grpc
 from data_processor import DataProcessor
 from identity import Identity
+from input_rpc import add_correlation_id
 from iotics.lib.grpc.helpers import (
     create_input_with_meta,
     create_property,
     create_value,
 )
 from iotics.lib.grpc.iotics_api import IoticsApi
+from keyed_executor import KeyedExecutor
+from metrics import LISTENERS_ACTIVE, MESSAGES_RECEIVED, health
+from retry_policy import CircuitOpenError
+from ttl_cache import TTLCache
 from twin_structure import TwinStructure
 from utilities import expected_grpc_exception, get_host_endpoints, retry_on_exception
 
@@ -20,19 +26,34 @@ log = logging.getLogger(__name__)
 
 
 class DataBypassConnector:
-    def __init__(self, data_processor: DataProcessor):
+    def __init__(
+        self,
+        data_processor: DataProcessor,
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+        workers_n: int = constant.DATABYPASS_WORKERS,
+    ):
         """Constructor of a Follower Connector object.
 
         Args:
             data_processor (DataProcessor): object simulating a data processor engine.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
+            workers_n (int, optional): number of DB requests processed concurrently.
         """
 
         self._data_processor: DataProcessor = data_processor
-        self._iotics_identity: Identity = None
-        self._iotics_api: IoticsApi = None
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
+        self._workers_n: int = workers_n
         self._refresh_token_lock: Lock = None
         self._threads_list: List[Thread] = None
         self._data_bypass_twin_did: str = None
+        self._request_executor: KeyedExecutor = None
+        self._requester_info_cache: TTLCache = None
+        self._granted_credentials_cache: TTLCache = None
 
         self._initialise()
 
@@ -43,18 +64,20 @@ class DataBypassConnector:
         """
 
         log.debug("Initialising DataBypass Connector...")
-        endpoints = get_host_endpoints(host_url=os.getenv("DATABYPASS_HOST_URL"))
-        self._iotics_identity = Identity(
-            resolver_url=endpoints.get("resolver"),
-            grpc_endpoint=endpoints.get("grpc"),
-            user_key_name=os.getenv("USER_KEY_NAME"),
-            user_seed=os.getenv("USER_SEED"),
-            agent_key_name=os.getenv("DATABYPASS_CONNECTOR_AGENT_KEY_NAME"),
-            agent_seed=os.getenv("DATABYPASS_CONNECTOR_AGENT_SEED"),
-        )
-        log.debug("IOTICS Identity initialised")
-        self._iotics_api = IoticsApi(auth=self._iotics_identity)
-        log.debug("IOTICS gRPC API initialised")
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(host_url=os.getenv("DATABYPASS_HOST_URL"))
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("DATABYPASS_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("DATABYPASS_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
 
         self._data_processor.initialise_db_writer(
             db_name=os.getenv("DB_NAME"),
@@ -64,6 +87,16 @@ class DataBypassConnector:
 
         self._refresh_token_lock = Lock()
         self._threads_list = []
+        # Requests from the same Twin are processed in order by the same worker
+        self._request_executor = KeyedExecutor(
+            name="databypass_requests", workers_n=self._workers_n
+        )
+        self._requester_info_cache = TTLCache(
+            name="describe_twin", ttl=constant.DESCRIBE_TWIN_CACHE_TTL_SEC
+        )
+        self._granted_credentials_cache = TTLCache(
+            name="granted_credentials", ttl=constant.GRANTED_CREDENTIALS_CACHE_TTL_SEC
+        )
 
         # Start auto-refreshing token Thread in the background
         Thread(
@@ -122,6 +155,11 @@ class DataBypassConnector:
                 data_type="string",
                 comment="Twin ID that requested access the Data Archive",
             ),
+            create_value(
+                label=constant.CORRELATION_ID_VALUE,
+                data_type="string",
+                comment="ID of the request, included in the reply",
+            ),
         ]
 
         inputs_list = [
@@ -166,26 +204,19 @@ class DataBypassConnector:
 
         self._data_bypass_twin_did = twin_did
 
-    def _grant_db_access(self, twin_requester_id: str, full_name: str):
-        """Generate a 'username' and 'password' to send to the Twin requester
-        so they can be used to access the DB.
+    def _send_db_credentials(
+        self, twin_requester_id: str, message_to_send: dict, request_data: dict
+    ):
+        """Send the credentials to access the DB to the Twin requester,
+        with the correlation ID of its request.
 
         Args:
             twin_requester_id (str): the Twin DID asking for DB access.
-            full_name (str): the Twin requester's full name,
-                used to generate the credentials.
+            message_to_send (dict): the Input message with the credentials.
+            request_data (dict): the data of the DB request received.
         """
 
-        username, password = self._data_processor.generate_db_credentials(
-            full_name=full_name
-        )
-
-        # Compose Input message to send to the Twin requester
-        message_to_send = {
-            constant.DB_NAME_INPUT_VALUE: os.getenv("DB_NAME"),
-            constant.DB_USERNAME_INPUT_VALUE: username,
-            constant.DB_PASSWORD_INPUT_VALUE: password,
-        }
+        message_to_send = add_correlation_id(message_to_send, request_data)
 
         # Send Input message with the credentials to access the DB
         self._iotics_api.send_input_message(
@@ -197,34 +228,62 @@ class DataBypassConnector:
 
         log.info("DB credentials sent")
 
-    def _process_request(self, new_input_message):
-        """Process the input message, expected to be a DB request.
-        Retrieve the Sender Twin DID from the input message to perform a Describe Twin operation.
-        Obtain the necessary information to determine if the requester should be granted DB access.
-        If the 'organisation' is permitted, then grant DB access. If not, ignore the Input message.
+    def _grant_db_access(
+        self, twin_requester_id: str, full_name: str, request_data: dict
+    ):
+        """Generate a 'username' and 'password' to send to the Twin requester
+        so they can be used to access the DB. The credentials are cached
+        to answer the following requests of the same Twin. If the DB user
+        couldn't be created, nothing is sent: the requester will ask again.
 
         Args:
-            new_input_message: Input message received, expected to be a DB request.
+            twin_requester_id (str): the Twin DID asking for DB access.
+            full_name (str): the Twin requester's full name,
+                used to generate the credentials.
+            request_data (dict): the data of the DB request received.
         """
 
-        log.debug("Processing request...")
-        received_data, occurred_at_timestamp = self._data_processor.unpack_input_data(
-            new_input_message
+        db_credentials = self._data_processor.generate_db_credentials(
+            full_name=full_name
         )
+        if not db_credentials:
+            log.error("Can't grant DB access to Twin %s", twin_requester_id)
+            return
 
-        log.info("Received new DB request: %s", received_data)
+        username, password = db_credentials
 
-        # Get the Twin Requester DID from the Input message
-        twin_requester_id = received_data.get(constant.SENDER_TWIN_ID_VALUE)
+        # Compose Input message to send to the Twin requester
+        message_to_send = {
+            constant.DB_NAME_INPUT_VALUE: os.getenv("DB_NAME"),
+            constant.DB_USERNAME_INPUT_VALUE: username,
+            constant.DB_PASSWORD_INPUT_VALUE: password,
+        }
+        self._granted_credentials_cache.put(twin_requester_id, message_to_send)
 
-        if not twin_requester_id:
-            log.info(
-                "Twin Requester ID missing from Input message received. Ignoring message"
-            )
-            return
+        self._send_db_credentials(
+            twin_requester_id=twin_requester_id,
+            message_to_send=message_to_send,
+            request_data=request_data,
+        )
+
+    def _describe_requester(self, twin_requester_id: str) -> Tuple[str, str, str]:
+        """Describe the Twin requester to get the necessary info to determine
+        if the requester should be granted DB access. The info is cached for
+        'DESCRIBE_TWIN_CACHE_TTL_SEC', so repeat requests don't describe it again.
+
+        Args:
+            twin_requester_id (str): the Twin DID asking for DB access.
+
+        Returns:
+            Tuple[str, str, str]: the organisation, full name and email address
+                of the requester, None if not found.
+        """
+
+        requester_info = self._requester_info_cache.get(twin_requester_id)
+        if requester_info:
+            log.debug("Using cached description of Twin %s", twin_requester_id)
+            return requester_info
 
-        # Describe Twin Requester to get the necessary info
-        # to determine if the requester should be granted DB access
         log.info("Describing Twin %s...", twin_requester_id)
         twin_description = self._iotics_api.describe_twin(twin_did=twin_requester_id)
         twin_receiver_properties = twin_description.payload.result.properties
@@ -238,6 +297,38 @@ class DataBypassConnector:
             elif twin_property.key == constant.EMAIL_ADDRESS:
                 email_address = twin_property.stringLiteralValue.value
 
+        requester_info = (organisation, full_name, email_address)
+        self._requester_info_cache.put(twin_requester_id, requester_info)
+
+        return requester_info
+
+    def _process_request(self, twin_requester_id: str, request_data: dict):
+        """Process a DB request, in one of the workers.
+        Describe the Twin requester (or use its cached description)
+        to obtain the necessary information to determine if it should be granted DB access.
+        If the 'organisation' is permitted, then grant DB access. If not, ignore the request.
+        If the requester has already been granted DB access, the same credentials are sent.
+
+        Args:
+            twin_requester_id (str): the Twin DID asking for DB access.
+            request_data (dict): the data of the DB request received.
+        """
+
+        # The requester has already been granted DB access: send the same credentials
+        message_to_send = self._granted_credentials_cache.get(twin_requester_id)
+        if message_to_send:
+            log.info("DB access already granted to %s", twin_requester_id)
+            self._send_db_credentials(
+                twin_requester_id=twin_requester_id,
+                message_to_send=message_to_send,
+                request_data=request_data,
+            )
+            return
+
+        organisation, full_name, email_address = self._describe_requester(
+            twin_requester_id
+        )
+
         # For this example, only the 'organisation' field is checked
         if not organisation:
             log.info("Organisation unknown. Ignoring request")
@@ -252,7 +343,9 @@ class DataBypassConnector:
             log.debug("Organisation '%s' allowed to get DB access", organisation)
 
             self._grant_db_access(
-                twin_requester_id=twin_requester_id, full_name=full_name
+                twin_requester_id=twin_requester_id,
+                full_name=full_name,
+                request_data=request_data,
             )
         # The Twin requester's organisation is not allowed. Ignore message
         else:
@@ -261,6 +354,41 @@ class DataBypassConnector:
                 organisation,
             )
 
+    def _submit_request(self, new_input_message):
+        """Retrieve the Sender Twin DID from the input message, expected to be
+        a DB request, and queue the request to be processed by the workers.
+        The Input listener is therefore not blocked by the requests being processed.
+        A request is ignored if one from the same requester is still being processed,
+        e.g.: a request resent before being answered.
+
+        Args:
+            new_input_message: Input message received, expected to be a DB request.
+        """
+
+        log.debug("Processing request...")
+        received_data, occurred_at_timestamp = self._data_processor.unpack_input_data(
+            new_input_message
+        )
+
+        log.info("Received new DB request: %s", received_data)
+
+        # Get the Twin Requester DID from the Input message
+        twin_requester_id = received_data.get(constant.SENDER_TWIN_ID_VALUE)
+
+        if not twin_requester_id:
+            log.info(
+                "Twin Requester ID missing from Input message received. Ignoring message"
+            )
+            return
+
+        if not self._request_executor.submit_coalesced(
+            twin_requester_id, self._process_request, twin_requester_id, received_data
+        ):
+            log.info(
+                "DB request from %s already being processed. Ignoring message",
+                twin_requester_id,
+            )
+
     def _wait_for_input_messages(self):
         """Wait for Input messages sent to the data bypass Twin's Input.
         Upon receiving a message, process it accordingly.
@@ -270,22 +398,25 @@ class DataBypassConnector:
 
         unexpected_exception_counter: int = 0
 
+        LISTENERS_ACTIVE.labels("input").inc()
         while True:
             log.debug("Generating a new input_listener...")
 
             # Generate a new Input listener
-            input_listener = retry_on_exception(
-                grpc_operation=self._iotics_api.receive_input_messages,
-                function_name="receive_input_messages",
-                refresh_token_lock=self._refresh_token_lock,
-                twin_did=self._data_bypass_twin_did,
-                input_id=constant.VERIFICATION_INFO_INPUT_ID,
-            )
-
             try:
+                input_listener = retry_on_exception(
+                    grpc_operation=self._iotics_api.receive_input_messages,
+                    function_name="receive_input_messages",
+                    refresh_token_lock=self._refresh_token_lock,
+                    twin_did=self._data_bypass_twin_did,
+                    input_id=constant.VERIFICATION_INFO_INPUT_ID,
+                )
                 # Wait to receive Input messages
                 for new_input_message in input_listener:
-                    self._process_request(new_input_message)
+                    MESSAGES_RECEIVED.labels(
+                        "input", constant.VERIFICATION_INFO_INPUT_ID
+                    ).inc()
+                    self._submit_request(new_input_message)
             except grpc.RpcError as grpc_ex:
                 # Any time the token expires, an expected gRPC exception is raised
                 # and a new 'input_listener' object needs to be generated.
@@ -293,6 +424,10 @@ class DataBypassConnector:
                     exception=grpc_ex, operation="input_listener"
                 ):
                     unexpected_exception_counter += 1
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
             except Exception as gen_ex:
                 log.exception("General exception in 'input_listener': %s", gen_ex)
                 unexpected_exception_counter += 1
@@ -300,6 +435,7 @@ class DataBypassConnector:
             if unexpected_exception_counter > constant.RETRYING_ATTEMPTS:
                 break
 
+        LISTENERS_ACTIVE.labels("input").dec()
         log.debug("Exiting thread...")
 
     def start(self):
@@ -308,4 +444,6 @@ class DataBypassConnector:
 
         twin_structure = self._setup_twin_structure()
         self._create_twin(twin_structure)
+        self._request_executor.start()
+        health.set_ready("databypass")
         self._wait_for_input_messages()
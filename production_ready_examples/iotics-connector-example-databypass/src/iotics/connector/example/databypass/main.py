@@ -1,15 +1,26 @@
-from logging import config
+import os
 
-from constants import LOGGING_CONFIGURATION
+from async_logging import setup_logging
+from constants import DATABYPASS_WORKERS, LOG_MESSAGES_SUMMARY, METRICS_PORT
 from data_processor import DataProcessor
 from databypass_connector import DataBypassConnector
+from diagnostics import install_diagnostics
+from metrics import start_metrics_server
 
-config.dictConfig(LOGGING_CONFIGURATION)
+setup_logging()
 
 
 def main():
-    data_processor = DataProcessor()
-    databypass_connector = DataBypassConnector(data_processor)
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    data_processor = DataProcessor(
+        log_each_message=os.getenv("LOG_MESSAGES") != LOG_MESSAGES_SUMMARY
+    )
+    databypass_connector = DataBypassConnector(
+        data_processor,
+        workers_n=int(os.getenv("DATABYPASS_WORKERS", DATABYPASS_WORKERS)),
+    )
     databypass_connector.start()
 
 
@@ -1,19 +1,22 @@
 import logging
 import os
-from datetime import datetime
-from threading import Event, Lock, Thread
+from concurrent.futures import as_completed
+from threading import Lock, Thread
 from time import sleep
 
 import constants as constant
 import grpc
 from data_processor import DataProcessor
 from identity import Identity
+from input_rpc import InputRpcClient
 from iotics.lib.grpc.helpers import (
     create_input_with_meta,
     create_property,
     create_value,
 )
 from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import LISTENERS_ACTIVE, MESSAGES_RECEIVED, health
+from retry_policy import CircuitOpenError
 from twin_structure import TwinStructure
 from utilities import (
     expected_grpc_exception,
@@ -26,20 +29,32 @@ log = logging.getLogger(__name__)
 
 
 class HistorianReaderConnector:
-    def __init__(self, data_processor: DataProcessor):
+    def __init__(
+        self,
+        data_processor: DataProcessor,
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+        access_db_mode: str = constant.ACCESS_DB_MODE_PUSH,
+    ):
         """Constructor of a Historian Reader Connector object.
 
         Args:
             data_processor (DataProcessor): object simulating a data processor engine.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
+            access_db_mode (str, optional): either 'push' (default) to access the DB
+                as soon as new data is notified, or 'poll' to access it periodically.
         """
 
         self._data_processor: DataProcessor = data_processor
-        self._iotics_identity: Identity = None
-        self._iotics_api: IoticsApi = None
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
         self._refresh_token_lock: Lock = None
         self._historian_reader_twin_did: str = None
-        self._last_db_access_datetime: datetime = None
-        self._db_initialised_event: Event = None
+        self._access_db_mode: str = access_db_mode
+        self._input_rpc_client: InputRpcClient = None
 
         self._initialise()
 
@@ -50,20 +65,23 @@ class HistorianReaderConnector:
         """
 
         log.debug("Initialising Historian Reader Connector...")
-        endpoints = get_host_endpoints(host_url=os.getenv("HISTORIAN_READER_HOST_URL"))
-        self._iotics_identity = Identity(
-            resolver_url=endpoints.get("resolver"),
-            grpc_endpoint=endpoints.get("grpc"),
-            user_key_name=os.getenv("USER_KEY_NAME"),
-            user_seed=os.getenv("USER_SEED"),
-            agent_key_name=os.getenv("HISTORIAN_READER_CONNECTOR_AGENT_KEY_NAME"),
-            agent_seed=os.getenv("HISTORIAN_READER_CONNECTOR_AGENT_SEED"),
-        )
-        log.debug("IOTICS Identity initialised")
-        self._iotics_api = IoticsApi(auth=self._iotics_identity)
-        log.debug("IOTICS gRPC API initialised")
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(
+                host_url=os.getenv("HISTORIAN_READER_HOST_URL")
+            )
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("HISTORIAN_READER_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("HISTORIAN_READER_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
 
-        self._db_initialised_event = Event()
         self._refresh_token_lock = Lock()
 
         # Start auto-refreshing token Thread in the background
@@ -142,6 +160,11 @@ class HistorianReaderConnector:
                 data_type="string",
                 comment="Password used to access the DB",
             ),
+            create_value(
+                label=constant.CORRELATION_ID_VALUE,
+                data_type="string",
+                comment="ID of the DB request this message replies to",
+            ),
         ]
 
         inputs_list = [
@@ -186,19 +209,17 @@ class HistorianReaderConnector:
 
         self._historian_reader_twin_did = twin_did
 
-    def _process_message(self, new_input_message):
-        """Retrieve credentials to access the DB from the Input message received.
-        Use the credentials to extract all data from the DB and print it on screen.
+    def _initialise_db(self, received_data: dict) -> bool:
+        """Retrieve credentials to access the DB from the Input message received
+        and use them to initialise the DB reader.
 
         Args:
-            new_input_message: input message received that includes the credentials
-                to access the DB.
-        """
+            received_data (dict): data of the Input message received that includes
+                the credentials to access the DB.
 
-        log.debug("Processing Input message...")
-        received_data, occurred_at_timestamp = self._data_processor.unpack_input_data(
-            new_input_message
-        )
+        Returns:
+            bool: whether the DB reader has been initialised.
+        """
 
         # Get the DB credentials from the Input message
         db_name = received_data.get(constant.DB_NAME_INPUT_VALUE)
@@ -208,34 +229,35 @@ class HistorianReaderConnector:
         log.info("Accessing DB with credentials received...")
 
         # Now the DB can be initialised
-        is_db_initialised = self._data_processor.initialise_db_reader(
+        return self._data_processor.initialise_db_reader(
             db_name=db_name, db_username=db_username, db_password=db_password
         )
-        if is_db_initialised:
-            self._db_initialised_event.set()
 
     def _receive_input_messages(self):
         """Wait for Input messages sent to the historian reader Twin's Input.
-        Upon receiving a message, process it accordingly.
+        Upon receiving a message, complete the DB request it replies to.
         """
 
         log.info("Waiting for DB Credentials...")
 
         unexpected_exception_counter: int = 0
 
+        LISTENERS_ACTIVE.labels("input").inc()
         while True:
             log.debug("Generating a new input_listener...")
 
-            input_listener = retry_on_exception(
-                grpc_operation=self._iotics_api.receive_input_messages,
-                function_name="receive_input_messages",
-                refresh_token_lock=self._refresh_token_lock,
-                twin_did=self._historian_reader_twin_did,
-                input_id=constant.DB_ACCESS_INFO_INPUT_ID,
-            )
-
             try:
+                input_listener = retry_on_exception(
+                    grpc_operation=self._iotics_api.receive_input_messages,
+                    function_name="receive_input_messages",
+                    refresh_token_lock=self._refresh_token_lock,
+                    twin_did=self._historian_reader_twin_did,
+                    input_id=constant.DB_ACCESS_INFO_INPUT_ID,
+                )
                 for new_input_message in input_listener:
+                    MESSAGES_RECEIVED.labels(
+                        "input", constant.DB_ACCESS_INFO_INPUT_ID
+                    ).inc()
                     # Print Input Message received on screen
                     self._data_processor.print_input_message_on_screen(
                         receiver_twin_did=self._historian_reader_twin_did,
@@ -243,7 +265,10 @@ class HistorianReaderConnector:
                         input_message=new_input_message,
                     )
 
-                    self._process_message(new_input_message)
+                    received_data, _ = self._data_processor.unpack_input_data(
+                        new_input_message
+                    )
+                    self._input_rpc_client.resolve(received_data)
             except grpc.RpcError as grpc_ex:
                 # Any time the token expires, an expected gRPC exception is raised
                 # and a new 'input_listener' object needs to be generated.
@@ -251,6 +276,10 @@ class HistorianReaderConnector:
                     exception=grpc_ex, operation="input_listener"
                 ):
                     unexpected_exception_counter += 1
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
             except Exception as gen_ex:
                 log.exception("General exception in 'input_listener': %s", gen_ex)
                 unexpected_exception_counter += 1
@@ -258,6 +287,7 @@ class HistorianReaderConnector:
             if unexpected_exception_counter > constant.RETRYING_ATTEMPTS:
                 break
 
+        LISTENERS_ACTIVE.labels("input").dec()
         log.debug("Exiting thread...")
 
     def _search_data_bypass_twins(self):
@@ -293,48 +323,50 @@ class HistorianReaderConnector:
 
         return twins_found_list
 
-    def _send_db_access_request(self, data_bypass_twins_list):
-        """Sends a DB access request (i.e.: Input message) to
-        the Data Bypass Twin(s) found by the search twin operation.
-        Repeats the operation if the DB creds are not received within a timeout.
-
-        Args:
-            data_bypass_twins_list: list of data bypass Twins found
-                by the search twin operation.
+    def _request_db_access(self):
+        """Send a DB access request (i.e.: Input message) to the Data Bypass Twin(s)
+        found by the search twin operation and wait for the first reply
+        with the DB credentials. Each request is resent with exponential backoff
+        until a reply is received; if none is received within 'INPUT_RPC_TIMEOUT_SEC',
+        the Data Bypass Twins are searched and the requests sent again.
         """
 
-        while not self._db_initialised_event.is_set():
-            for data_bypass_twin in data_bypass_twins_list:
-                data_bypass_twin_id = data_bypass_twin.twinId.id
-
-                # Prepare Input message to send by including
-                # the historian reader Twin ID.
-                message_to_send = {
-                    constant.SENDER_TWIN_ID_VALUE: self._historian_reader_twin_did
-                }
-
-                retry_on_exception(
-                    grpc_operation=self._iotics_api.send_input_message,
-                    function_name="send_input_message",
-                    refresh_token_lock=self._refresh_token_lock,
-                    sender_twin_did=self._historian_reader_twin_did,
-                    receiver_twin_did=data_bypass_twin_id,
+        while True:
+            data_bypass_twins_list = self._search_data_bypass_twins()
+            if not data_bypass_twins_list:
+                log.info(
+                    "No Data Bypass Twins found. Searching again in %ds...",
+                    constant.ACCESS_DB_PERIOD,
+                )
+                sleep(constant.ACCESS_DB_PERIOD)
+                continue
+
+            # Prepare Input message to send by including
+            # the historian reader Twin ID.
+            message_to_send = {
+                constant.SENDER_TWIN_ID_VALUE: self._historian_reader_twin_did
+            }
+            requests_list = [
+                self._input_rpc_client.request(
+                    receiver_twin_did=data_bypass_twin.twinId.id,
                     input_id=constant.VERIFICATION_INFO_INPUT_ID,
                     message=message_to_send,
                 )
-
-                log.debug(
-                    "Sent Input Message %s to %s", message_to_send, data_bypass_twin_id
-                )
-                log.info("DB access request sent")
-
-            sleep(constant.ACCESS_DB_PERIOD)
-
-            if self._db_initialised_event.is_set():
-                log.info("DB initialised")
-                break
-            else:
-                log.info("Sending a new DB request...")
+                for data_bypass_twin in data_bypass_twins_list
+            ]
+            log.info("DB access request sent")
+
+            for request in as_completed(requests_list):
+                if request.exception():
+                    log.info("DB request failed: %s", request.exception())
+                elif self._initialise_db(request.result()):
+                    log.info("DB initialised")
+                    # No need to wait for the other Data Bypass Twins
+                    for other_request in requests_list:
+                        other_request.cancel()
+                    return
+
+            log.info("Sending a new DB request...")
 
     def _wait_for_db_credentials(self):
         """Starts a thread to asynchronously wait for input messages."""
@@ -343,35 +375,52 @@ class HistorianReaderConnector:
         input_thread.start()
 
     def _periodically_access_db(self):
-        """Creates an infinite loop to periodically access the DB and print the data."""
+        """Creates an infinite loop to access the DB and print the new data.
+        In push mode the DB is accessed as soon as the Historian Writer notifies
+        that new data has been stored, and at least every 'ACCESS_DB_PERIOD'
+        in case a notification is missed. In poll mode, or if the notifications
+        can't be received, it is accessed every 'ACCESS_DB_PERIOD'.
+        """
 
-        while True:
-            datetime_now = datetime.now()
+        # Listen before the first access so that no new data is missed
+        is_push_mode = (
+            self._access_db_mode == constant.ACCESS_DB_MODE_PUSH
+            and self._data_processor.listen_for_new_db_data()
+        )
+        log.info(
+            "Accessing the DB in %s mode",
+            (
+                constant.ACCESS_DB_MODE_PUSH
+                if is_push_mode
+                else constant.ACCESS_DB_MODE_POLL
+            ),
+        )
+
+        last_reading_id: int = None
 
-            # Get all data from the DB if this is the first access
-            if not self._last_db_access_datetime:
+        while True:
+            # Get all data from the DB if nothing has been printed yet
+            if last_reading_id is None:
                 log.info("Printing ALL data from DB...")
-                self._data_processor.print_all_data_from_db()
+            # Otherwise only the data stored since the previous access
+            else:
+                log.info("Printing data stored after reading %d...", last_reading_id)
+
+            last_reading_id = self._data_processor.print_new_data_from_db(
+                last_reading_id
+            )
 
-            # Get the new data from the DB if this is not the first access
+            if is_push_mode:
+                log.debug("Waiting for new data to be stored in the DB...")
+                self._data_processor.wait_for_new_db_data(
+                    timeout=constant.ACCESS_DB_PERIOD
+                )
             else:
                 log.info(
-                    "Printing data from %s to %s...",
-                    self._last_db_access_datetime.strftime(constant.DATETIME_FORMAT),
-                    datetime_now.strftime(constant.DATETIME_FORMAT),
-                )
-                self._data_processor.print_datetime_range_data_from_db(
-                    start_datetime=self._last_db_access_datetime,
-                    end_datetime=datetime_now,
+                    "Waiting for %ds before accessing the DB again...",
+                    constant.ACCESS_DB_PERIOD,
                 )
-
-            self._last_db_access_datetime = datetime_now
-
-            log.info(
-                "Waiting for %ds before accessing the DB again...",
-                constant.ACCESS_DB_PERIOD,
-            )
-            sleep(constant.ACCESS_DB_PERIOD)
+                sleep(constant.ACCESS_DB_PERIOD)
 
     def start(self):
         """Create a Historian Reader Twin. Then, search for the Data Bypass Twin and
@@ -381,7 +430,12 @@ class HistorianReaderConnector:
 
         twin_structure = self._setup_twin_structure()
         self._create_twin(twin_structure)
+        self._input_rpc_client = InputRpcClient(
+            iotics_api=self._iotics_api,
+            refresh_token_lock=self._refresh_token_lock,
+            sender_twin_did=self._historian_reader_twin_did,
+        )
         self._wait_for_db_credentials()
-        data_bypass_twins_list = self._search_data_bypass_twins()
-        self._send_db_access_request(data_bypass_twins_list)
+        self._request_db_access()
+        health.set_ready("historian_reader")
         self._periodically_access_db()
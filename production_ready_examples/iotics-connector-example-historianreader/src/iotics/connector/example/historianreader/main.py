@@ -1,15 +1,28 @@
-from logging import config
+import os
 
-from constants import LOGGING_CONFIGURATION
+from async_logging import setup_logging
+from constants import ACCESS_DB_MODE_PUSH, LOG_MESSAGES_SUMMARY, METRICS_PORT
 from data_processor import DataProcessor
+from diagnostics import install_diagnostics
 from historian_reader_connector import HistorianReaderConnector
+from metrics import start_metrics_server
 
-config.dictConfig(LOGGING_CONFIGURATION)
+setup_logging()
 
 
 def main():
-    data_processor = DataProcessor()
-    historian_reader_connector = HistorianReaderConnector(data_processor)
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    data_processor = DataProcessor(
+        log_each_message=os.getenv("LOG_MESSAGES") != LOG_MESSAGES_SUMMARY
+    )
+    historian_reader_connector = HistorianReaderConnector(
+        data_processor,
+        access_db_mode=os.getenv(
+            "HISTORIAN_READER_ACCESS_DB_MODE", ACCESS_DB_MODE_PUSH
+        ),
+    )
     historian_reader_connector.start()
 
 
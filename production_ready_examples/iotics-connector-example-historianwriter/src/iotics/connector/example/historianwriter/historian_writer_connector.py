@@ -1,17 +1,23 @@
 import logging
 import os
 from threading import Lock, Thread
-from typing import List
+from time import monotonic, sleep, time
 
 import constants as constant
 import grpc
 from data_processor import DataProcessor
+from feed_stream import FeedStreamManager, FeedStreamRenewer
 from identity import Identity
 from iotics.lib.grpc.helpers import create_property
 from iotics.lib.grpc.iotics_api import IoticsApi
+from listener_supervisor import ListenerSupervisor
+from metrics import LISTENERS_ACTIVE, MESSAGES_RECEIVED, health
+from retry_policy import CircuitOpenError
 from twin_structure import TwinStructure
 from utilities import (
     expected_grpc_exception,
+    get_feed_message_period,
+    get_feed_period,
     get_host_endpoints,
     retry_on_exception,
     search_twins,
@@ -21,19 +27,29 @@ log = logging.getLogger(__name__)
 
 
 class HistorianWriterConnector:
-    def __init__(self, data_processor: DataProcessor):
+    def __init__(
+        self,
+        data_processor: DataProcessor,
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+    ):
         """Constructor of a Historian Writer Connector object.
 
         Args:
             data_processor (DataProcessor): object simulating a data processor engine.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
         """
 
         self._data_processor: DataProcessor = data_processor
-        self._iotics_identity: Identity = None
-        self._iotics_api: IoticsApi = None
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
         self._refresh_token_lock: Lock = None
         self._historian_writer_twin_did: str = None
-        self._threads_list: List[Thread] = None
+        self._feed_stream_renewer: FeedStreamRenewer = None
+        self._listener_supervisor: ListenerSupervisor = None
 
         self._initialise()
 
@@ -44,18 +60,22 @@ class HistorianWriterConnector:
         """
 
         log.debug("Initialising Historian Writer Connector...")
-        endpoints = get_host_endpoints(host_url=os.getenv("HISTORIAN_WRITER_HOST_URL"))
-        self._iotics_identity = Identity(
-            resolver_url=endpoints.get("resolver"),
-            grpc_endpoint=endpoints.get("grpc"),
-            user_key_name=os.getenv("USER_KEY_NAME"),
-            user_seed=os.getenv("USER_SEED"),
-            agent_key_name=os.getenv("HISTORIAN_WRITER_CONNECTOR_AGENT_KEY_NAME"),
-            agent_seed=os.getenv("HISTORIAN_WRITER_CONNECTOR_AGENT_SEED"),
-        )
-        log.debug("IOTICS Identity initialised")
-        self._iotics_api = IoticsApi(auth=self._iotics_identity)
-        log.debug("IOTICS gRPC API initialised")
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(
+                host_url=os.getenv("HISTORIAN_WRITER_HOST_URL")
+            )
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("HISTORIAN_WRITER_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("HISTORIAN_WRITER_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
 
         self._data_processor.initialise_db_writer(
             db_name=os.getenv("DB_NAME"),
@@ -64,12 +84,19 @@ class HistorianWriterConnector:
         )
 
         self._refresh_token_lock = Lock()
-        self._threads_list = []
+        self._feed_stream_renewer = FeedStreamRenewer(
+            iotics_identity=self._iotics_identity
+        )
+        self._listener_supervisor = ListenerSupervisor(name="feed_listeners")
 
         # Start auto-refreshing token Thread in the background
         Thread(
             target=self._iotics_identity.auto_refresh_token,
             args=[self._refresh_token_lock, self._iotics_api],
+            # Early, to spread the renewal of the Feed streams (see 'FeedStreamRenewer')
+            kwargs={
+                "token_refresh_period_percent": constant.FEED_STREAM_TOKEN_REFRESH_PERIOD_PERCENT
+            },
             name="auto_refresh_token",
             daemon=True,
         ).start()
@@ -163,18 +190,33 @@ class HistorianWriterConnector:
 
         return twins_found_list
 
-    def _get_feed_data(self, publisher_twin_did: str, publisher_feed_id: str):
+    def _get_feed_data(
+        self,
+        feed_stream: FeedStreamManager,
+        feed_period: float,
+        message_period: float,
+    ):
         """Entry point for each Thread. Within an infinite loop
-        get a new feed listener given the info about the Twin and Feed to follow
+        follow the Feed given the info about the Twin and Feed to follow
         alongside the Historian Writer Twin's DID. Wait for new data samples, then process it.
-        In case of an expected exception (i.e.: token expired), generate a new
-        feed listener and wait again for new data samples.
+        The Feed stream is renewed before its token expires without losing data
+        (see 'FeedStreamManager'). In case of an expected exception
+        (i.e.: token expired before the renewal), open a new stream
+        and wait again for new data samples. Any time a stream is opened,
+        the data samples missed meanwhile are backfilled if still available.
+        After too many unexpected exceptions the Thread exits
+        and it is restarted by the Listener Supervisor.
 
         Args:
-            publisher_twin_did (str): Twin Publisher DID
-            publisher_feed_id (str): Twin Publisher's Feed ID
+            feed_stream (FeedStreamManager): the stream of the Feed to follow.
+            feed_period (float): the seconds between two data samples, if known.
+            message_period (float): the seconds between two Feed messages, if known.
         """
 
+        publisher_twin_did = feed_stream.followed_twin_did
+        publisher_feed_id = feed_stream.followed_feed_id
+        listener_key = f"{publisher_twin_did}_{publisher_feed_id}"
+
         log.info(
             "Waiting for Feed data from Twin %s, Feed %s...",
             publisher_twin_did,
@@ -183,24 +225,25 @@ class HistorianWriterConnector:
 
         unexpected_exception_counter: int = 0
 
+        LISTENERS_ACTIVE.labels("feed").inc()
         while True:
-            log.debug("Generating a new feed_listener...")
-            feed_listener = retry_on_exception(
-                grpc_operation=self._iotics_api.fetch_interests,
-                function_name="fetch_interests",
-                refresh_token_lock=self._refresh_token_lock,
-                follower_twin_did=self._historian_writer_twin_did,
-                followed_twin_did=publisher_twin_did,
-                followed_feed_id=publisher_feed_id,
-                # 'fetch_last_stored' is set to False
-                # otherwise at any new 'feed_listener' generated
-                # (i.e.: any time the token expires)
-                # we will get the last shared value.
-                fetch_last_stored=False,
-            )
-
+            log.debug("Waiting for new data samples...")
             try:
-                for latest_feed_data in feed_listener:
+                # Open the stream first so the new samples are kept meanwhile,
+                # then store the samples missed since the last one stored
+                feed_stream.open()
+                self._data_processor.backfill_to_db(
+                    publisher_twin_did,
+                    publisher_feed_id,
+                    last_stored_feed_data=feed_stream.fetch_last_stored(),
+                    feed_period=feed_period,
+                    message_period=message_period,
+                )
+                for latest_feed_data in feed_stream:
+                    MESSAGES_RECEIVED.labels("feed", publisher_feed_id).inc()
+                    self._listener_supervisor.record_message(listener_key)
+                    received_at = time()
+                    processing_started_at = monotonic()
                     log.debug(
                         "Received a new data sample from Twin %s via Feed %s",
                         publisher_twin_did,
@@ -214,15 +257,28 @@ class HistorianWriterConnector:
 
                     # Export data receved to DB
                     self._data_processor.export_to_db(
-                        publisher_twin_did, publisher_feed_id, latest_feed_data
+                        publisher_twin_did,
+                        publisher_feed_id,
+                        latest_feed_data,
+                        received_at=received_at,
+                    )
+
+                    self._data_processor.latency_recorder.record(
+                        metric=constant.LATENCY_PROCESSING,
+                        key=f"{publisher_twin_did}/{publisher_feed_id}",
+                        value=monotonic() - processing_started_at,
                     )
             except grpc.RpcError as grpc_ex:
-                # Any time the token expires, an expected gRPC exception is raised
-                # and a new 'feed_listener' object needs to be generated.
+                # If the stream couldn't be renewed before its token expired,
+                # an expected gRPC exception is raised and a new stream is opened.
                 if not expected_grpc_exception(
                     exception=grpc_ex, operation="feed_listener"
                 ):
                     unexpected_exception_counter += 1
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
             except Exception as gen_ex:
                 log.exception("General exception in 'feed_listener': %s", gen_ex)
                 unexpected_exception_counter += 1
@@ -230,11 +286,12 @@ class HistorianWriterConnector:
             if unexpected_exception_counter > constant.RETRYING_ATTEMPTS:
                 break
 
+        LISTENERS_ACTIVE.labels("feed").dec()
         log.debug("Exiting thread...")
 
     def _follow_sensor_twins(self, sensor_twins_list):
         """Create and start a new Thread for each Feed of each Twin included
-        in the Sensor Twins List. Then add the thread to the Thread list.
+        in the Sensor Twins List, supervised by the Listener Supervisor.
 
         Args:
             sensor_twins_list: list of Twins found by the Search operation.
@@ -246,26 +303,41 @@ class HistorianWriterConnector:
 
             for twin_feed in sensor_twin_feeds:
                 feed_id = twin_feed.feedId.id
+                feed_period = get_feed_period(twin_feed.properties)
+                # Longer than the Feed period if the Publisher shares batches
+                message_period = get_feed_message_period(twin_feed.properties)
+
+                # Created once so that a restarted Thread keeps the same stream
+                feed_stream = FeedStreamManager(
+                    iotics_api=self._iotics_api,
+                    refresh_token_lock=self._refresh_token_lock,
+                    follower_twin_did=self._historian_writer_twin_did,
+                    followed_twin_did=sensor_twin_id,
+                    followed_feed_id=feed_id,
+                )
+                # Open a new stream with each new token before the current one expires
+                self._feed_stream_renewer.add_feed_stream(feed_stream)
 
-                thread_name = f"{sensor_twin_id}_{feed_id}"
-
-                feed_thread = Thread(
+                self._listener_supervisor.add_listener(
+                    key=f"{sensor_twin_id}_{feed_id}",
                     target=self._get_feed_data,
-                    args=[sensor_twin_id, feed_id],
-                    name=thread_name,
+                    args=[feed_stream, feed_period, message_period],
+                    expected_period=message_period,
+                    # A new stream is opened and the missed samples backfilled
+                    on_stall=feed_stream.reset,
                 )
-                log.debug("Starting new Thread %s...", thread_name)
-                feed_thread.start()
-                self._threads_list.append(feed_thread)
 
     def start(self):
         """Create the Historian Writer Twin,
         search for Sensor Twins and follow their Feeds."""
 
+        self._data_processor.latency_recorder.start()
+        self._feed_stream_renewer.start()
+        self._listener_supervisor.start()
         twin_structure = self._setup_twin_structure()
         self._create_twin(twin_structure)
         sensor_twins_list = self._search_sensor_twins()
         self._follow_sensor_twins(sensor_twins_list)
+        health.set_ready("historian_writer")
 
-        for thread in self._threads_list:
-            thread.join()
+        self._listener_supervisor.join()
@@ -1,14 +1,22 @@
-from logging import config
+import os
 
-from constants import LOGGING_CONFIGURATION
+from async_logging import setup_logging
+from constants import LOG_MESSAGES_SUMMARY, METRICS_PORT
 from data_processor import DataProcessor
+from diagnostics import install_diagnostics
 from historian_writer_connector import HistorianWriterConnector
+from metrics import start_metrics_server
 
-config.dictConfig(LOGGING_CONFIGURATION)
+setup_logging()
 
 
 def main():
-    data_processor = DataProcessor()
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    data_processor = DataProcessor(
+        log_each_message=os.getenv("LOG_MESSAGES") != LOG_MESSAGES_SUMMARY
+    )
     historian_writer_connector = HistorianWriterConnector(data_processor)
     historian_writer_connector.start()
 
@@ -0,0 +1,545 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import BoundedSemaphore, Event, Lock, Thread
+from time import monotonic, sleep, time
+from typing import List, Tuple
+
+import constants as constant
+import grpc
+from data_processor import DataProcessor
+from feed_stream import FeedStreamManager, FeedStreamRenewer
+from identity import Identity
+from iotics.lib.grpc.helpers import (
+    create_feed_with_meta,
+    create_property,
+    create_value,
+)
+from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import LISTENERS_ACTIVE, MESSAGES_RECEIVED, health
+from retry_policy import CircuitOpenError
+from sketches import KLLSketch, MinMaxSumCount
+from twin_structure import TwinStructure
+from utilities import expected_grpc_exception, get_host_endpoints, retry_on_exception
+
+log = logging.getLogger(__name__)
+
+
+class LoadStats:
+    """Thread-safe counters of the data samples sent and received
+    and of their end-to-end latency."""
+
+    def __init__(self):
+        self._lock: Lock = Lock()
+        self.sent: int = 0
+        self.send_errors: int = 0
+        self.received: int = 0
+        self.duplicated: int = 0
+        self.latency: MinMaxSumCount = MinMaxSumCount()
+        self.latency_quantiles: KLLSketch = KLLSketch()
+        self._received_sequence_numbers: set = set()
+
+    def add_sent(self):
+        with self._lock:
+            self.sent += 1
+
+    def add_send_error(self):
+        with self._lock:
+            self.send_errors += 1
+
+    def add_received(self, sequence_n: int, latency: float):
+        with self._lock:
+            if sequence_n in self._received_sequence_numbers:
+                self.duplicated += 1
+                return
+
+            self._received_sequence_numbers.add(sequence_n)
+            self.received += 1
+            self.latency.add(latency)
+            self.latency_quantiles.add(latency)
+
+
+class LoadGeneratorConnector:
+    """Connector measuring the throughput a deployment can sustain. It provisions
+    N Twins x M Feeds like the Publisher Connector, follows them like
+    the Historian Writer Connector and shares data at a target aggregate rate
+    reached with a linear ramp. At the end of the run it reports the achieved
+    send/receive rate, the loss and the end-to-end latency.
+    """
+
+    def __init__(
+        self,
+        data_processor: DataProcessor,
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+    ):
+        """Constructor of a Load Generator Connector object.
+
+        Args:
+            data_processor (DataProcessor): object used to unpack the Feed data received.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
+        """
+
+        self._data_processor: DataProcessor = data_processor
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
+        self._refresh_token_lock: Lock = None
+        self._follower_twin_did: str = None
+        self._feeds_list: List[Tuple[str, str]] = None
+        self._twins_n: int = None
+        self._feeds_per_twin_n: int = None
+        self._target_rate: float = None
+        self._ramp_sec: float = None
+        self._duration_sec: float = None
+        self._drain_sec: float = None
+        self._results_path: str = None
+        self._sender_workers_n: int = None
+        self._stats: LoadStats = None
+        self._stopped: Event = None
+        self._feed_stream_renewer: FeedStreamRenewer = None
+        self._started_at: str = None
+
+        self._initialise()
+
+    def _initialise(self):
+        """Initialise all the variables of this class. It also starts
+        an auto refresh token Thread so the IOTICS token is automatically
+        regenerated when it expires.
+        """
+
+        log.debug("Initialising Load Generator Connector...")
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(
+                host_url=os.getenv("LOAD_GENERATOR_HOST_URL")
+            )
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("LOAD_GENERATOR_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("LOAD_GENERATOR_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
+
+        self._refresh_token_lock = Lock()
+        self._feed_stream_renewer = FeedStreamRenewer(
+            iotics_identity=self._iotics_identity
+        )
+        self._feeds_list = []
+        self._twins_n = int(os.getenv("LOAD_TWINS_N", constant.LOAD_TWINS_N))
+        self._feeds_per_twin_n = int(
+            os.getenv("LOAD_FEEDS_PER_TWIN_N", constant.LOAD_FEEDS_PER_TWIN_N)
+        )
+        self._target_rate = float(
+            os.getenv("LOAD_TARGET_RATE", constant.LOAD_TARGET_RATE)
+        )
+        self._ramp_sec = float(os.getenv("LOAD_RAMP_SEC", constant.LOAD_RAMP_SEC))
+        self._duration_sec = float(
+            os.getenv("LOAD_DURATION_SEC", constant.LOAD_DURATION_SEC)
+        )
+        self._drain_sec = float(os.getenv("LOAD_DRAIN_SEC", constant.LOAD_DRAIN_SEC))
+        self._results_path = os.getenv("LOAD_RESULTS_PATH", constant.LOAD_RESULTS_PATH)
+        self._sender_workers_n = int(
+            os.getenv("LOAD_SENDER_WORKERS", constant.LOAD_SENDER_WORKERS)
+        )
+        self._stats = LoadStats()
+        self._stopped = Event()
+
+        # Start auto-refreshing token Thread in the background
+        Thread(
+            target=self._iotics_identity.auto_refresh_token,
+            args=[self._refresh_token_lock, self._iotics_api],
+            # Early, to spread the renewal of the Feed streams (see 'FeedStreamRenewer')
+            kwargs={
+                "token_refresh_period_percent": constant.FEED_STREAM_TOKEN_REFRESH_PERIOD_PERCENT
+            },
+            name="auto_refresh_token",
+            daemon=True,
+        ).start()
+
+    def _setup_twin_structure(self) -> TwinStructure:
+        """Define the structure of the Twins sharing data, with M Feeds each.
+        The 'createdBy' Property differs from the one of the Sensor Twins
+        so the load Twins are not followed by the other Connectors.
+
+        Returns:
+            TwinStructure: an object representing the structure of the load Twins.
+        """
+
+        twin_properties = [
+            create_property(
+                key=constant.PROPERTY_KEY_TYPE, value=constant.SENSOR, is_uri=True
+            ),
+            create_property(
+                key=constant.PROPERTY_KEY_COMMENT,
+                value="Twin used to generate load",
+                language="en",
+            ),
+            create_property(
+                key=constant.PROPERTY_KEY_CREATED_BY,
+                value=constant.LOAD_GENERATOR_CREATED_BY_NAME,
+            ),
+        ]
+
+        feed_values = [
+            create_value(label=constant.LOAD_SEQUENCE_N_VALUE, data_type="integer"),
+            create_value(label=constant.LOAD_SENT_AT_VALUE, data_type="double"),
+        ]
+
+        feeds_list = [
+            create_feed_with_meta(
+                feed_id=f"{constant.LOAD_FEED_ID_PREFIX}{feed_n}",
+                properties=[
+                    create_property(
+                        key=constant.PROPERTY_KEY_LABEL,
+                        value=f"Load Feed {feed_n+1}",
+                        language="en",
+                    )
+                ],
+                values=feed_values,
+            )
+            for feed_n in range(self._feeds_per_twin_n)
+        ]
+
+        twin_structure = TwinStructure(
+            properties=twin_properties, feeds_list=feeds_list
+        )
+
+        return twin_structure
+
+    def _create_twin(
+        self,
+        twin_key_name: str,
+        twin_label: str,
+        properties: list,
+        feeds_list: list = None,
+    ) -> str:
+        """Create a Twin with control delegation and upsert its metadata.
+
+        Args:
+            twin_key_name (str): the key name of the Twin Identity.
+            twin_label (str): the Twin's Label.
+            properties (list): the Twin's Properties (Label excluded).
+            feeds_list (list, optional): the Twin's Feeds.
+
+        Returns:
+            str: the Twin DID just created.
+        """
+
+        twin_registered_identity = (
+            self._iotics_identity.create_twin_with_control_delegation(
+                twin_key_name=twin_key_name
+            )
+        )
+        twin_did: str = twin_registered_identity.did
+
+        retry_on_exception(
+            grpc_operation=self._iotics_api.upsert_twin,
+            function_name="upsert_twin",
+            refresh_token_lock=self._refresh_token_lock,
+            twin_did=twin_did,
+            properties=properties
+            + [
+                create_property(
+                    key=constant.PROPERTY_KEY_LABEL, value=twin_label, language="en"
+                )
+            ],
+            feeds=feeds_list,
+        )
+
+        log.debug("%s created with DID: %s", twin_label, twin_did)
+
+        return twin_did
+
+    def _provision_twins(self):
+        """Create the follower Twin and the N load Twins with M Feeds each."""
+
+        log.info(
+            "Creating %d Twins x %d Feeds...", self._twins_n, self._feeds_per_twin_n
+        )
+
+        self._follower_twin_did = self._create_twin(
+            twin_key_name="LoadGeneratorFollowerTwin",
+            twin_label="Load Generator Follower",
+            properties=[
+                create_property(
+                    key=constant.PROPERTY_KEY_CREATED_BY,
+                    value=constant.LOAD_GENERATOR_CREATED_BY_NAME,
+                )
+            ],
+        )
+
+        twin_structure = self._setup_twin_structure()
+        for twin_n in range(self._twins_n):
+            twin_did = self._create_twin(
+                twin_key_name=f"load_twin_{twin_n+1}",
+                twin_label=f"Load Twin {twin_n+1}",
+                properties=twin_structure.properties,
+                feeds_list=twin_structure.feeds_list,
+            )
+            for feed in twin_structure.feeds_list:
+                self._feeds_list.append((twin_did, feed.id))
+
+        log.info("Created %d Feeds", len(self._feeds_list))
+
+    def _get_feed_data(self, twin_did: str, feed_id: str):
+        """Entry point of each follower Thread. Wait for new data samples
+        and record their end-to-end latency until the run is over.
+        The Feed stream is renewed before its token expires without losing data
+        (see 'FeedStreamManager'). In case of an expected exception
+        (i.e.: token expired before the renewal), open a new stream
+        and wait again for new data samples.
+
+        Args:
+            twin_did (str): the load Twin DID.
+            feed_id (str): the load Twin's Feed ID.
+        """
+
+        feed_stream = FeedStreamManager(
+            iotics_api=self._iotics_api,
+            refresh_token_lock=self._refresh_token_lock,
+            follower_twin_did=self._follower_twin_did,
+            followed_twin_did=twin_did,
+            followed_feed_id=feed_id,
+        )
+        self._feed_stream_renewer.add_feed_stream(feed_stream)
+
+        LISTENERS_ACTIVE.labels("feed").inc()
+        while not self._stopped.is_set():
+            try:
+                for latest_feed_data in feed_stream:
+                    MESSAGES_RECEIVED.labels("feed", feed_id).inc()
+                    received_at = time()
+                    for data_sample, _ in self._data_processor.unpack_feed_samples(
+                        latest_feed_data
+                    ):
+                        self._stats.add_received(
+                            sequence_n=data_sample[constant.LOAD_SEQUENCE_N_VALUE],
+                            latency=received_at
+                            - data_sample[constant.LOAD_SENT_AT_VALUE],
+                        )
+
+                    if self._stopped.is_set():
+                        break
+            except grpc.RpcError as grpc_ex:
+                expected_grpc_exception(exception=grpc_ex, operation="feed_listener")
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
+            except Exception as gen_ex:
+                log.exception("General exception in 'feed_listener': %s", gen_ex)
+
+        LISTENERS_ACTIVE.labels("feed").dec()
+
+    def _follow_feeds(self):
+        """Start a follower Thread for each load Feed."""
+
+        for twin_did, feed_id in self._feeds_list:
+            Thread(
+                target=self._get_feed_data,
+                args=[twin_did, feed_id],
+                name=f"{twin_did}_{feed_id}",
+                daemon=True,
+            ).start()
+
+    def _share_data_sample(
+        self, twin_did: str, feed_id: str, sequence_n: int, in_flight: BoundedSemaphore
+    ):
+        """Share a data sample with its sequence number and the time it was sent.
+        Unlike the Publisher Connector, a failure is counted rather than retried
+        so it shows up in the results.
+
+        Args:
+            twin_did (str): the load Twin DID.
+            feed_id (str): the load Twin's Feed ID.
+            sequence_n (int): the unique sequence number of the data sample.
+            in_flight (BoundedSemaphore): released once the data sample is shared.
+        """
+
+        try:
+            self._iotics_api.share_feed_data(
+                twin_did=twin_did,
+                feed_id=feed_id,
+                data={
+                    constant.LOAD_SEQUENCE_N_VALUE: sequence_n,
+                    constant.LOAD_SENT_AT_VALUE: time(),
+                },
+            )
+            self._stats.add_sent()
+        except grpc.RpcError as grpc_ex:
+            expected_grpc_exception(exception=grpc_ex, operation="share_feed_data")
+            self._stats.add_send_error()
+        finally:
+            in_flight.release()
+
+    def _get_messages_due(self, elapsed_sec: float) -> int:
+        """Return the number of data samples that should have been sent
+        after a given time, i.e.: the integral of the target rate, which grows
+        linearly during the ramp and then stays constant.
+
+        Args:
+            elapsed_sec (float): the number of seconds since the start of the run.
+
+        Returns:
+            int: the number of data samples due.
+        """
+
+        if self._ramp_sec and elapsed_sec < self._ramp_sec:
+            return int(self._target_rate * elapsed_sec**2 / (2 * self._ramp_sec))
+
+        return int(
+            self._target_rate * self._ramp_sec / 2
+            + self._target_rate * (elapsed_sec - self._ramp_sec)
+        )
+
+    def _send_load(self) -> float:
+        """Share data samples round-robin across the load Feeds
+        at the target rate, until the end of the run.
+
+        Returns:
+            float: the duration of the send phase in seconds.
+        """
+
+        log.info(
+            "Sharing data at %.0f msg/s (ramp %ds) for %ds...",
+            self._target_rate,
+            self._ramp_sec,
+            self._duration_sec,
+        )
+
+        # Bound the number of shares waiting for a worker so that
+        # a saturated deployment lowers the achieved rate
+        # rather than growing an unbounded backlog
+        in_flight = BoundedSemaphore(self._sender_workers_n * 2)
+        sequence_n = 0
+        start_time = monotonic()
+
+        with ThreadPoolExecutor(
+            max_workers=self._sender_workers_n, thread_name_prefix="load_sender"
+        ) as executor:
+            while True:
+                elapsed_sec = monotonic() - start_time
+                if elapsed_sec >= self._duration_sec:
+                    break
+
+                messages_due = self._get_messages_due(elapsed_sec)
+                while sequence_n < messages_due:
+                    in_flight.acquire()
+                    twin_did, feed_id = self._feeds_list[
+                        sequence_n % len(self._feeds_list)
+                    ]
+                    executor.submit(
+                        self._share_data_sample,
+                        twin_did,
+                        feed_id,
+                        sequence_n,
+                        in_flight,
+                    )
+                    sequence_n += 1
+
+                sleep(constant.LOAD_PACING_PERIOD_SEC)
+
+        return monotonic() - start_time
+
+    def _get_results(self, send_duration_sec: float) -> dict:
+        """Summarise the run.
+
+        Args:
+            send_duration_sec (float): the duration of the send phase in seconds.
+
+        Returns:
+            dict: the configuration and the results of the run.
+        """
+
+        stats = self._stats
+        loss = 1 - stats.received / stats.sent if stats.sent else None
+        latency_ms = {
+            "mean": stats.latency.mean * 1000 if stats.latency.count else None,
+            "p50": None,
+            "p99": None,
+            "max": stats.latency.max_value * 1000 if stats.latency.count else None,
+        }
+        if stats.latency.count:
+            latency_ms["p50"] = stats.latency_quantiles.quantile(0.5) * 1000
+            latency_ms["p99"] = stats.latency_quantiles.quantile(0.99) * 1000
+
+        return {
+            "started_at": self._started_at,
+            "config": {
+                "twins_n": self._twins_n,
+                "feeds_per_twin_n": self._feeds_per_twin_n,
+                "target_rate": self._target_rate,
+                "ramp_sec": self._ramp_sec,
+                "duration_sec": self._duration_sec,
+                "drain_sec": self._drain_sec,
+                "sender_workers_n": self._sender_workers_n,
+            },
+            "results": {
+                "sent": stats.sent,
+                "send_errors": stats.send_errors,
+                "received": stats.received,
+                "duplicated": stats.duplicated,
+                "send_rate": stats.sent / send_duration_sec,
+                "receive_rate": stats.received / send_duration_sec,
+                "loss": loss,
+                "latency_ms": latency_ms,
+            },
+        }
+
+    def _report_results(self, results: dict):
+        """Log the results of the run and write them as JSON.
+
+        Args:
+            results (dict): the configuration and the results of the run.
+        """
+
+        run_results = results["results"]
+        log.info(
+            "Sent %d (%.1f msg/s, %d errors), received %d (%.1f msg/s), loss %.2f%%",
+            run_results["sent"],
+            run_results["send_rate"],
+            run_results["send_errors"],
+            run_results["received"],
+            run_results["receive_rate"],
+            (run_results["loss"] or 0) * 100,
+        )
+        if run_results["received"]:
+            log.info(
+                "End-to-end latency p50 %.1f ms, p99 %.1f ms",
+                run_results["latency_ms"]["p50"],
+                run_results["latency_ms"]["p99"],
+            )
+
+        with open(self._results_path, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+
+        log.info("Results written to %s", self._results_path)
+
+    def start(self):
+        """Provision the load Twins, follow their Feeds, share data
+        at the target rate and report the results."""
+
+        self._started_at = datetime.now().isoformat()
+        self._feed_stream_renewer.start()
+        self._provision_twins()
+        self._follow_feeds()
+        health.set_ready("load_generator")
+
+        send_duration_sec = self._send_load()
+
+        # Wait for the data samples still in transit
+        log.info("Waiting %ds for the last data samples...", self._drain_sec)
+        sleep(self._drain_sec)
+        self._stopped.set()
+
+        self._report_results(self._get_results(send_duration_sec))
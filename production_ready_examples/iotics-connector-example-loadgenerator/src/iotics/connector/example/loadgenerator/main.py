@@ -0,0 +1,42 @@
+import os
+
+from async_logging import setup_logging
+from constants import LOG_MESSAGES_SUMMARY, METRICS_PORT
+from data_processor import DataProcessor
+from diagnostics import install_diagnostics
+from load_generator_connector import LoadGeneratorConnector
+from metrics import start_metrics_server
+
+setup_logging()
+
+
+def main():
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    data_processor = DataProcessor(
+        log_each_message=os.getenv("LOG_MESSAGES") != LOG_MESSAGES_SUMMARY
+    )
+
+    # Run against an in-process fake IOTICS host to measure the Connector alone
+    if os.getenv("LOAD_GENERATOR_FAKE_HOST") == "1":
+        from fake_iotics_api import FakeIdentity, FakeIoticsApi, FakeIoticsHost
+
+        fake_host = FakeIoticsHost(
+            latency=float(os.getenv("FAKE_HOST_LATENCY_SEC", 0)),
+            error_rate=float(os.getenv("FAKE_HOST_ERROR_RATE", 0)),
+        )
+        fake_identity = FakeIdentity()
+        load_generator_connector = LoadGeneratorConnector(
+            data_processor,
+            iotics_identity=fake_identity,
+            iotics_api=FakeIoticsApi(auth=fake_identity, host=fake_host),
+        )
+    else:
+        load_generator_connector = LoadGeneratorConnector(data_processor)
+
+    load_generator_connector.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,33 @@
-from logging import config
+import os
+import signal
 
-from constants import LOGGING_CONFIGURATION
+from async_logging import setup_logging
+from constants import METRICS_PORT, NUMBER_OF_SENSORS
 from data_source import DataSource
+from diagnostics import install_diagnostics
+from metrics import start_metrics_server
 from publisher_connector import PublisherConnector
+from vectorised_data_source import VectorisedDataSource
 
-config.dictConfig(LOGGING_CONFIGURATION)
+setup_logging()
 
 
 def main():
-    data_source = DataSource()
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    # A vectorised data source simulates a large number of sensors for load runs
+    if os.getenv("PUBLISHER_DATA_SOURCE") == "vectorised":
+        seed = os.getenv("PUBLISHER_SIMULATION_SEED")
+        data_source = VectorisedDataSource(
+            sensors_n=int(os.getenv("PUBLISHER_NUMBER_OF_SENSORS", NUMBER_OF_SENSORS)),
+            seed=int(seed) if seed else None,
+        )
+    else:
+        data_source = DataSource()
     publisher_connector = PublisherConnector(data_source)
+    # Share the pending batches before the container is stopped
+    signal.signal(signal.SIGTERM, lambda *_: publisher_connector.stop())
     publisher_connector.start()
 
 
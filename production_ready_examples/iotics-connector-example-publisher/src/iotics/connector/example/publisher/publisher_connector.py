@@ -1,9 +1,12 @@
 import logging
 import os
 from threading import Lock, Thread
-from typing import List
+from time import time
+from typing import Dict, List, Tuple, Union
 
 import constants as constant
+from async_logging import ActivitySummary
+from batching import SampleBatcher
 from data_source import DataSource
 from identity import Identity
 from iotics.lib.grpc.helpers import (
@@ -13,25 +16,49 @@ from iotics.lib.grpc.helpers import (
     create_value,
 )
 from iotics.lib.grpc.iotics_api import IoticsApi
+from metrics import health
+from payload_codec import PayloadCodec, StructCodec, get_codec
+from scheduler import PeriodicScheduler
 from twin_structure import TwinStructure
-from utilities import get_host_endpoints, retry_on_exception
+from utilities import get_host_endpoints, retry_on_exception, share_encoded_feed_data
+from vectorised_data_source import VectorisedDataSource
 
 log = logging.getLogger(__name__)
 
 
 class PublisherConnector:
-    def __init__(self, data_source: DataSource):
+    def __init__(
+        self,
+        data_source: Union[DataSource, VectorisedDataSource],
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+    ):
         """Constructor of a Publisher Connector object.
 
         Args:
-            data_source (DataSource): object simulating a data source.
+            data_source (Union[DataSource, VectorisedDataSource]): object simulating
+                a data source. A VectorisedDataSource simulates a large number
+                of sensors from a single process.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
         """
 
-        self._data_source: DataSource = data_source
-        self._iotics_identity: Identity = None
-        self._iotics_api: IoticsApi = None
+        self._data_source: Union[DataSource, VectorisedDataSource] = data_source
+        self._vectorised: bool = None
+        self._twin_dids: List[str] = None
+        self._share_log_level: int = None
+        self._shares_summary: ActivitySummary = None
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
         self._refresh_token_lock: Lock = None
-        self._threads_list: List[Thread] = None
+        self._scheduler: PeriodicScheduler = None
+        self._sample_batchers: Dict[Tuple[str, str], SampleBatcher] = None
+        self._payload_mime: str = None
+        self._feed_codecs: Dict[str, PayloadCodec] = None
+        self._batch_max_samples: int = None
+        self._batch_max_delay: float = None
 
         self._initialise()
 
@@ -42,21 +69,47 @@ class PublisherConnector:
         """
 
         log.debug("Initialising Publisher Connector...")
-        endpoints = get_host_endpoints(host_url=os.getenv("PUBLISHER_HOST_URL"))
-        self._iotics_identity = Identity(
-            resolver_url=endpoints.get("resolver"),
-            grpc_endpoint=endpoints.get("grpc"),
-            user_key_name=os.getenv("USER_KEY_NAME"),
-            user_seed=os.getenv("USER_SEED"),
-            agent_key_name=os.getenv("PUBLISHER_CONNECTOR_AGENT_KEY_NAME"),
-            agent_seed=os.getenv("PUBLISHER_CONNECTOR_AGENT_SEED"),
-        )
-        log.debug("IOTICS Identity initialised")
-        self._iotics_api = IoticsApi(auth=self._iotics_identity)
-        log.debug("IOTICS gRPC API initialised")
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(host_url=os.getenv("PUBLISHER_HOST_URL"))
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("PUBLISHER_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("PUBLISHER_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
 
         self._refresh_token_lock = Lock()
-        self._threads_list = []
+        self._vectorised = isinstance(self._data_source, VectorisedDataSource)
+        self._twin_dids = []
+        # Logging each data sample shared is too verbose in large-scale runs
+        self._share_log_level = logging.DEBUG if self._vectorised else logging.INFO
+        # Alternatively, only log a periodic summary of the data samples shared
+        if os.getenv("LOG_MESSAGES") == constant.LOG_MESSAGES_SUMMARY:
+            self._shares_summary = ActivitySummary(
+                description="Shared", item_name="data samples", key_name="Feeds"
+            )
+            self._shares_summary.start()
+        self._scheduler = PeriodicScheduler(
+            workers_n=int(
+                os.getenv("PUBLISHER_SCHEDULER_WORKERS", constant.SCHEDULER_WORKERS)
+            )
+        )
+        self._sample_batchers = {}
+        self._payload_mime = os.getenv("PUBLISHER_PAYLOAD_MIME", constant.MIME_JSON)
+        self._feed_codecs = {}
+        # A batch max number of samples of 1 (default) disables batched shares
+        self._batch_max_samples = int(
+            os.getenv("PUBLISHER_BATCH_MAX_SAMPLES", constant.BATCH_MAX_SAMPLES)
+        )
+        self._batch_max_delay = float(
+            os.getenv("PUBLISHER_BATCH_MAX_DELAY_SEC", constant.BATCH_MAX_DELAY_SEC)
+        )
 
         # Start auto-refreshing token Thread in the background
         Thread(
@@ -105,6 +158,11 @@ class PublisherConnector:
                 value=f"Temperature reading that updates every {constant.TEMPERATURE_READING_PERIOD} seconds",
                 language="en",
             ),
+            create_property(
+                key=constant.PROPERTY_KEY_UPDATE_PERIOD,
+                value=str(constant.TEMPERATURE_READING_PERIOD),
+                datatype="decimal",
+            ),
         ]
         # Set-up Temperature Feed's Value
         temperature_feed_values = [
@@ -128,6 +186,11 @@ class PublisherConnector:
                 value=f"Humidity reading that updates every {constant.HUMIDITY_READING_PERIOD} seconds",
                 language="en",
             ),
+            create_property(
+                key=constant.PROPERTY_KEY_UPDATE_PERIOD,
+                value=str(constant.HUMIDITY_READING_PERIOD),
+                datatype="decimal",
+            ),
         ]
         # Set-up Humidity Feed's Value
         humidity_feed_values = [
@@ -138,6 +201,20 @@ class PublisherConnector:
             ),
         ]
 
+        if self._batch_max_samples > 1:
+            # Followers expect a Feed message per batch rather than per data sample
+            for feed_id, feed_properties in (
+                (constant.TEMPERATURE_FEED_ID, temperature_feed_properties),
+                (constant.HUMIDITY_FEED_ID, humidity_feed_properties),
+            ):
+                feed_properties.append(
+                    create_property(
+                        key=constant.PROPERTY_KEY_MESSAGE_PERIOD,
+                        value=str(self._get_message_period(feed_id)),
+                        datatype="decimal",
+                    )
+                )
+
         feeds_list = [
             create_feed_with_meta(
                 feed_id=constant.TEMPERATURE_FEED_ID,
@@ -157,6 +234,31 @@ class PublisherConnector:
 
         return twin_structure
 
+    def _setup_feed_codecs(self, twin_structure: TwinStructure):
+        """Select the codec used to encode the data shared by each Feed
+        according to the 'PUBLISHER_PAYLOAD_MIME' env variable. JSON is used by default
+        so existing consumers keep working. The fixed-layout struct codec is generated
+        from the Feed's Values definition.
+
+        Args:
+            twin_structure (TwinStructure): Structure of the Sensor Twins
+                used to get info about their Feeds.
+        """
+
+        payload_mime = self._payload_mime
+        if payload_mime == constant.MIME_STRUCT and self._batch_max_samples > 1:
+            log.warning("Batched shares can't use a fixed layout. Using JSON instead")
+            payload_mime = constant.MIME_JSON
+
+        for feed in twin_structure.feeds_list:
+            if payload_mime == constant.MIME_STRUCT:
+                feed_codec = StructCodec.from_feed_values(feed.values)
+            else:
+                feed_codec = get_codec(payload_mime)
+
+            self._feed_codecs[feed.id] = feed_codec
+            log.debug("Feed %s data encoded as %s", feed.id, feed_codec.mime)
+
     def _create_twin(self, twin_structure: TwinStructure, sensor_n: int) -> str:
         """Create a Sensor Twin given a Twin Structure.
 
@@ -170,13 +272,14 @@ class PublisherConnector:
 
         # The Sensor Twin's Label will be dynamically
         # generated according to the Sensor number
-        # and added to the list of Twin's Properties
+        # and added to a copy of the list of Twin's Properties,
+        # so that the Labels of the previous Sensor Twins are not included
         twin_label = f"Sensor {sensor_n+1}"
-        twin_structure.properties.append(
+        twin_properties = twin_structure.properties + [
             create_property(
                 key=constant.PROPERTY_KEY_LABEL, value=twin_label, language="en"
-            ),
-        )
+            )
+        ]
 
         twin_registered_identity = (
             self._iotics_identity.create_twin_with_control_delegation(
@@ -192,7 +295,7 @@ class PublisherConnector:
             refresh_token_lock=self._refresh_token_lock,
             twin_did=twin_did,
             location=twin_structure.location,
-            properties=twin_structure.properties,
+            properties=twin_properties,
             feeds=twin_structure.feeds_list,
         )
 
@@ -200,43 +303,210 @@ class PublisherConnector:
 
         return twin_did
 
-    def _share_data(self, twin_did: str, feed_id: str):
-        """This is the entry point of each Thread (i.e.: Feed).
-        According to the type of data to generate, either temperature or humidity,
-        a new data sample is generated and shared via the specified Twin and Feed.
+    def _share_feed_data(self, twin_did: str, feed_id: str, data_to_share: dict):
+        """Share data via the specified Twin and Feed, encoded with the Feed's codec.
 
         Args:
             twin_did (str): the Sensor Twin DID that shares data.
             feed_id (str): the Feed ID from which to share data.
+            data_to_share (dict): either a single data sample or a batch of them.
         """
 
-        while True:
-            # The following dictionary represents the data generator function to be called
-            # based on its key.
-            data_type_selection = {
-                constant.TEMPERATURE_FEED_ID: self._data_source.make_temperature_reading,
-                constant.HUMIDITY_FEED_ID: self._data_source.make_humidity_reading,
-            }
-            # A specific data generator function will be called according to the Feed ID
-            data_generator_function = data_type_selection.get(feed_id)
-            data_sample = data_generator_function()
-
+        feed_codec = self._feed_codecs[feed_id]
+        if feed_codec.mime == constant.MIME_JSON:
             retry_on_exception(
                 grpc_operation=self._iotics_api.share_feed_data,
                 function_name="share_feed_data",
                 refresh_token_lock=self._refresh_token_lock,
                 twin_did=twin_did,
                 feed_id=feed_id,
-                data=data_sample,
+                data=data_to_share,
+            )
+        else:
+            retry_on_exception(
+                grpc_operation=share_encoded_feed_data,
+                function_name="share_feed_data",
+                refresh_token_lock=self._refresh_token_lock,
+                iotics_api=self._iotics_api,
+                twin_did=twin_did,
+                feed_id=feed_id,
+                data=feed_codec.encode(data_to_share),
+                mime=feed_codec.mime,
             )
 
-            log.info(
-                "Shared %s from Twin DID %s via Feed %s", data_sample, twin_did, feed_id
+    def _get_feed_period(self, feed_id: str) -> float:
+        """Return the number of seconds between two data samples of a Feed."""
+
+        # The following dictionary represents the period of each Feed's data
+        feed_period_selection = {
+            constant.TEMPERATURE_FEED_ID: constant.TEMPERATURE_READING_PERIOD,
+            constant.HUMIDITY_FEED_ID: constant.HUMIDITY_READING_PERIOD,
+        }
+
+        return feed_period_selection.get(feed_id)
+
+    def _get_message_period(self, feed_id: str) -> float:
+        """Return the longest number of seconds between two batches shared
+        by a Feed: a batch is shared once full or, at the latest, at the first
+        check (see 'start') after its oldest data sample waited the max delay."""
+
+        feed_period = self._get_feed_period(feed_id)
+        batch_max_wait = self._batch_max_delay * 1.5
+
+        return max(
+            feed_period, min(self._batch_max_samples * feed_period, batch_max_wait)
+        )
+
+    def _publish_data_sample(
+        self, twin_did: str, feed_id: str, data_sample: dict, occurred_at: int
+    ):
+        """Share a data sample via the specified Twin and Feed.
+        When batched shares are enabled, the data samples are accumulated
+        (each with its own timestamp) and shared once the batch is ready.
+
+        Args:
+            twin_did (str): the Sensor Twin DID that shares data.
+            feed_id (str): the Feed ID from which to share data.
+            data_sample (dict): the data sample to share.
+            occurred_at (int): the time at which the data sample was generated
+                in seconds since the epoch.
+        """
+
+        sample_batcher = self._sample_batchers.get((twin_did, feed_id))
+        # An empty batcher is falsy (see 'SampleBatcher.__len__')
+        if sample_batcher is None:
+            self._share_feed_data(twin_did, feed_id, data_sample)
+            if self._shares_summary:
+                self._shares_summary.add(f"{twin_did}/{feed_id}")
+                return
+
+            log.log(
+                self._share_log_level,
+                "Shared %s from Twin DID %s via Feed %s",
+                data_sample,
+                twin_did,
+                feed_id,
+            )
+            return
+
+        batch_to_share = sample_batcher.add(data_sample, occurred_at=occurred_at)
+        if batch_to_share:
+            self._share_batch(twin_did, feed_id, batch_to_share)
+
+    def _share_batch(self, twin_did: str, feed_id: str, batch_to_share: dict):
+        """Share a batch of data samples via the specified Twin and Feed.
+
+        Args:
+            twin_did (str): the Sensor Twin DID that shares data.
+            feed_id (str): the Feed ID from which to share data.
+            batch_to_share (dict): the batch payload to share.
+        """
+
+        self._share_feed_data(twin_did, feed_id, batch_to_share)
+        if self._shares_summary:
+            self._shares_summary.add(
+                f"{twin_did}/{feed_id}",
+                len(batch_to_share[constant.BATCH_SAMPLES_KEY]),
             )
+            return
+
+        log.log(
+            self._share_log_level,
+            "Shared a batch of %d samples from Twin DID %s via Feed %s",
+            len(batch_to_share[constant.BATCH_SAMPLES_KEY]),
+            twin_did,
+            feed_id,
+        )
+
+    def _flush_batches(self, due_only: bool = True):
+        """This is the job run by the scheduler to share the batches whose oldest
+        data sample has waited for longer than the max delay, e.g.: when a Feed
+        slows down and no other data sample is added to its batch.
+
+        Args:
+            due_only (bool): whether to share only the batches that are due
+                or all the data samples still batched (e.g.: before exiting).
+        """
+
+        for (twin_did, feed_id), sample_batcher in self._sample_batchers.items():
+            if due_only:
+                batch_to_share = sample_batcher.flush_if_due()
+            else:
+                batch_to_share = sample_batcher.flush()
+            if not batch_to_share:
+                continue
+
+            try:
+                self._share_batch(twin_did, feed_id, batch_to_share)
+            except Exception as ex:
+                log.exception(
+                    "Exception sharing a batch from Twin DID %s via Feed %s: %s",
+                    twin_did,
+                    feed_id,
+                    ex,
+                )
+
+    def _share_data(self, twin_did: str, feed_id: str):
+        """This is the job run by the scheduler every period of each Feed.
+        According to the type of data to generate, either temperature or humidity,
+        a new data sample is generated and shared via the specified Twin and Feed.
+
+        Args:
+            twin_did (str): the Sensor Twin DID that shares data.
+            feed_id (str): the Feed ID from which to share data.
+        """
+
+        # The following dictionary represents the data generator function to be called
+        # based on its key.
+        data_type_selection = {
+            constant.TEMPERATURE_FEED_ID: self._data_source.generate_temperature_reading,
+            constant.HUMIDITY_FEED_ID: self._data_source.generate_humidity_reading,
+        }
+        # A specific data generator function will be called according to the Feed ID
+        data_generator_function = data_type_selection.get(feed_id)
+        data_sample = data_generator_function()
+
+        self._publish_data_sample(twin_did, feed_id, data_sample, int(time()))
+
+    def _share_vectorised_data(self, feed_id: str):
+        """This is the job run by the scheduler every period of each Feed
+        when a VectorisedDataSource is used. The data samples of all the Sensor Twins
+        are generated at once and then shared by the pool of workers.
+        The data samples of this period still waiting to be shared
+        when the next period starts are dropped (see 'PeriodicScheduler.fan_out').
+
+        Args:
+            feed_id (str): the Feed ID from which to share data.
+        """
+
+        occurred_at = int(time())
+        data_samples = self._data_source.generate_data_samples(feed_id, occurred_at)
+
+        dropped_samples_n = 0
+        shares_list = []
+        for twin_did, data_sample in zip(self._twin_dids, data_samples):
+            # A missing data sample simulates a sensor that didn't report
+            if data_sample is None:
+                dropped_samples_n += 1
+                continue
+
+            shares_list.append((twin_did, feed_id, data_sample, occurred_at))
+
+        self._scheduler.fan_out(
+            f"vectorised_{feed_id}", self._publish_data_sample, shares_list
+        )
+
+        log.info(
+            "Generated %d %s data samples (%d dropped)",
+            len(data_samples) - dropped_samples_n,
+            feed_id,
+            dropped_samples_n,
+        )
 
     def _start_sharing_data(self, twin_structure: TwinStructure, twin_did: str):
-        """Each Sensor Twin's Feed will share data asynchronously, so a Thread
-        is started for each of them.
+        """Each Sensor Twin's Feed will share data periodically. Rather than
+        a Thread sleeping for each Feed, a job is added to the scheduler
+        which spreads the Feeds across their period.
 
         Args:
             twin_structure (TwinStructure): Structure of the Sensor Twin
@@ -245,24 +515,67 @@ class PublisherConnector:
         """
 
         for feed in twin_structure.feeds_list:
-            feed_thread = Thread(
-                target=self._share_data,
-                args=[twin_did, feed.id],
-                name=f"{twin_did}_{feed.id}",
+            if self._batch_max_samples > 1:
+                self._sample_batchers[(twin_did, feed.id)] = SampleBatcher(
+                    max_samples=self._batch_max_samples,
+                    max_delay=self._batch_max_delay,
+                )
+
+            # With a vectorised data source a single job per Feed ID
+            # generates the data of all the Sensor Twins
+            if self._vectorised:
+                continue
+
+            self._scheduler.add_job(
+                job_id=f"{twin_did}_{feed.id}",
+                function=self._share_data,
+                period=self._get_feed_period(feed.id),
+                args=(twin_did, feed.id),
             )
-            feed_thread.start()
-            self._threads_list.append(feed_thread)
 
     def start(self):
         """Create the Sensor Twins and share Temperature and Humidity data
         via their Feeds."""
 
         twin_structure = self._setup_twin_structure()
+        self._setup_feed_codecs(twin_structure)
 
-        log.info("Creating Sensor Twins...")
-        for sensor_n in range(constant.NUMBER_OF_SENSORS):
+        sensors_n = constant.NUMBER_OF_SENSORS
+        if self._vectorised:
+            sensors_n = self._data_source.sensors_n
+
+        log.info("Creating %d Sensor Twins...", sensors_n)
+        for sensor_n in range(sensors_n):
             twin_did = self._create_twin(twin_structure, sensor_n)
+            self._twin_dids.append(twin_did)
             self._start_sharing_data(twin_structure, twin_did)
 
-        for thread in self._threads_list:
-            thread.join()
+        if self._vectorised:
+            for feed in twin_structure.feeds_list:
+                self._scheduler.add_job(
+                    job_id=f"vectorised_{feed.id}",
+                    function=self._share_vectorised_data,
+                    period=self._get_feed_period(feed.id),
+                    args=(feed.id,),
+                )
+
+        if self._sample_batchers:
+            # Checked twice per max delay, so that no batch waits much longer
+            self._scheduler.add_job(
+                job_id="flush_batches",
+                function=self._flush_batches,
+                period=self._batch_max_delay / 2,
+            )
+
+        self._scheduler.start()
+        health.set_ready("publisher")
+        self._scheduler.join()
+        # The scheduler has been stopped (see 'stop'): the data samples
+        # still batched would be lost otherwise
+        self._flush_batches(due_only=False)
+
+    def stop(self):
+        """Stop sharing data. 'start' returns once the data samples
+        still batched have been shared."""
+
+        self._scheduler.stop()
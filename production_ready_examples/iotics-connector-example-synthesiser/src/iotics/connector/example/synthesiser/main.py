@@ -1,14 +1,22 @@
-from logging import config
+import os
 
-from constants import LOGGING_CONFIGURATION
+from async_logging import setup_logging
+from constants import LOG_MESSAGES_SUMMARY, METRICS_PORT
 from data_processor import DataProcessor
+from diagnostics import install_diagnostics
+from metrics import start_metrics_server
 from synthesiser_connector import SynthesiserConnector
 
-config.dictConfig(LOGGING_CONFIGURATION)
+setup_logging()
 
 
 def main():
-    data_processor = DataProcessor()
+    install_diagnostics()
+    start_metrics_server(port=int(os.getenv("METRICS_PORT", METRICS_PORT)))
+
+    data_processor = DataProcessor(
+        log_each_message=os.getenv("LOG_MESSAGES") != LOG_MESSAGES_SUMMARY
+    )
     synthesiser_connector = SynthesiserConnector(data_processor)
     synthesiser_connector.start()
 
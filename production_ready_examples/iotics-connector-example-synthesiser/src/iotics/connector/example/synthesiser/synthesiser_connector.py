@@ -1,19 +1,26 @@
 import logging
 import os
+import sys
 from queue import Queue
 from threading import Lock, Thread
-from time import sleep
-from typing import List
+from time import sleep, time
+from typing import Tuple
 
 import constants as constant
 import grpc
 from data_processor import DataProcessor
+from feed_stream import FeedStreamManager, FeedStreamRenewer
 from identity import Identity
 from iotics.lib.grpc.helpers import create_feed_with_meta, create_property, create_value
 from iotics.lib.grpc.iotics_api import IoticsApi
+from listener_supervisor import ListenerSupervisor
+from metrics import LISTENERS_ACTIVE, MESSAGES_RECEIVED, health, registry
+from retry_policy import CircuitOpenError, RetryError
+from sketches import FeedSummary, get_shard_index
 from twin_structure import TwinStructure
 from utilities import (
     expected_grpc_exception,
+    get_feed_message_period,
     get_host_endpoints,
     retry_on_exception,
     search_twins,
@@ -23,21 +30,35 @@ log = logging.getLogger(__name__)
 
 
 class SynthesiserConnector:
-    def __init__(self, data_processor: DataProcessor):
+    def __init__(
+        self,
+        data_processor: DataProcessor,
+        iotics_identity: Identity = None,
+        iotics_api: IoticsApi = None,
+    ):
         """Constructor of a Synthesiser Connector object.
 
         Args:
             data_processor (DataProcessor): object simulating a data processor engine.
+            iotics_identity (Identity, optional): the IOTICS Identity to use instead
+                of the one generated from the env variables (e.g.: a FakeIdentity).
+            iotics_api (IoticsApi, optional): the IOTICS gRPC API to use instead
+                of the one connected to the Host (e.g.: a FakeIoticsApi).
         """
 
         self._data_processor: DataProcessor = data_processor
-        self._iotics_identity: Identity = None
-        self._iotics_api: IoticsApi = None
+        self._iotics_identity: Identity = iotics_identity
+        self._iotics_api: IoticsApi = iotics_api
         self._refresh_token_lock: Lock = None
         self._twin_synthesiser_did: str = None
-        self._threads_list: List[Thread] = None
+        self._feed_stream_renewer: FeedStreamRenewer = None
+        self._listener_supervisor: ListenerSupervisor = None
         self._temperature_data_received_queue: Queue = None
         self._humidity_data_received_queue: Queue = None
+        self._partial_summary_received_queue: Queue = None
+        self._role: str = None
+        self._shard_index: int = None
+        self._shard_count: int = None
 
         self._initialise()
 
@@ -48,34 +69,112 @@ class SynthesiserConnector:
         """
 
         log.debug("Initialising Synthesiser Connector...")
-        endpoints = get_host_endpoints(host_url=os.getenv("SYNTHESISER_HOST_URL"))
-        self._iotics_identity = Identity(
-            resolver_url=endpoints.get("resolver"),
-            grpc_endpoint=endpoints.get("grpc"),
-            user_key_name=os.getenv("USER_KEY_NAME"),
-            user_seed=os.getenv("USER_SEED"),
-            agent_key_name=os.getenv("SYNTHESISER_CONNECTOR_AGENT_KEY_NAME"),
-            agent_seed=os.getenv("SYNTHESISER_CONNECTOR_AGENT_SEED"),
+        # A Synthesiser can either run on its own ('standalone'), aggregate a subset
+        # of the Sensor Twins and share its partial summaries ('shard'), or combine
+        # the partial summaries shared by the shards ('merger').
+        self._role = os.getenv("SYNTHESISER_ROLE", constant.SYNTHESISER_ROLE_STANDALONE)
+        self._shard_index, self._shard_count = self._get_shard_settings()
+        log.debug(
+            "Synthesiser role: %s (shard %d of %d)",
+            self._role,
+            self._shard_index,
+            self._shard_count,
         )
-        log.debug("IOTICS Identity initialised")
-        self._iotics_api = IoticsApi(auth=self._iotics_identity)
-        log.debug("IOTICS gRPC API initialised")
+
+        if not self._iotics_identity:
+            endpoints = get_host_endpoints(host_url=os.getenv("SYNTHESISER_HOST_URL"))
+            self._iotics_identity = Identity(
+                resolver_url=endpoints.get("resolver"),
+                grpc_endpoint=endpoints.get("grpc"),
+                user_key_name=os.getenv("USER_KEY_NAME"),
+                user_seed=os.getenv("USER_SEED"),
+                agent_key_name=os.getenv("SYNTHESISER_CONNECTOR_AGENT_KEY_NAME"),
+                agent_seed=os.getenv("SYNTHESISER_CONNECTOR_AGENT_SEED"),
+            )
+            log.debug("IOTICS Identity initialised")
+        if not self._iotics_api:
+            self._iotics_api = IoticsApi(auth=self._iotics_identity)
+            log.debug("IOTICS gRPC API initialised")
 
         self._refresh_token_lock = Lock()
-        self._threads_list = []
+        self._feed_stream_renewer = FeedStreamRenewer(
+            iotics_identity=self._iotics_identity
+        )
+        self._listener_supervisor = ListenerSupervisor(name="feed_listeners")
 
         # Initialise the queues that will be used to store Feed data received
         self._temperature_data_received_queue = Queue()
         self._humidity_data_received_queue = Queue()
+        self._partial_summary_received_queue = Queue()
+        registry.gauge(
+            "iotics_synthesiser_queue_size",
+            "Number of Feed messages waiting to be aggregated",
+            ["feed_id"],
+            function=lambda: {
+                (constant.TEMPERATURE_FEED_ID,): (
+                    self._temperature_data_received_queue.qsize()
+                ),
+                (
+                    constant.HUMIDITY_FEED_ID,
+                ): self._humidity_data_received_queue.qsize(),
+                (constant.PARTIAL_SUMMARY_FEED_ID,): (
+                    self._partial_summary_received_queue.qsize()
+                ),
+            },
+        )
 
         # Start auto-refreshing token Thread in the background
         Thread(
             target=self._iotics_identity.auto_refresh_token,
             args=[self._refresh_token_lock, self._iotics_api],
+            # Early, to spread the renewal of the Feed streams (see 'FeedStreamRenewer')
+            kwargs={
+                "token_refresh_period_percent": constant.FEED_STREAM_TOKEN_REFRESH_PERIOD_PERCENT
+            },
             name="auto_refresh_token",
             daemon=True,
         ).start()
 
+    def _get_shard_settings(self) -> Tuple[int, int]:
+        """Validate the Synthesiser role and return its shard settings, so that
+        a misconfigured Synthesiser exits rather than following no Twins.
+
+        Returns:
+            Tuple[int, int]: the shard index and the number of shards.
+        """
+
+        roles = (
+            constant.SYNTHESISER_ROLE_STANDALONE,
+            constant.SYNTHESISER_ROLE_SHARD,
+            constant.SYNTHESISER_ROLE_MERGER,
+        )
+        if self._role not in roles:
+            log.error(
+                "Parameter SYNTHESISER_ROLE must be one of %s, not '%s'",
+                ", ".join(roles),
+                self._role,
+            )
+            sys.exit(1)
+
+        try:
+            shard_index = int(os.getenv("SYNTHESISER_SHARD_INDEX", "0"))
+            shard_count = int(os.getenv("SYNTHESISER_SHARD_COUNT", "1"))
+        except ValueError as ex:
+            log.error("Parameters SYNTHESISER_SHARD_* must be integers: %s", ex)
+            sys.exit(1)
+
+        if shard_count < 1:
+            log.error("Parameter SYNTHESISER_SHARD_COUNT must be at least 1")
+            sys.exit(1)
+        if not 0 <= shard_index < shard_count:
+            log.error(
+                "Parameter SYNTHESISER_SHARD_INDEX must be between 0 and %d",
+                shard_count - 1,
+            )
+            sys.exit(1)
+
+        return shard_index, shard_count
+
     def _setup_twin_structure(self) -> TwinStructure:
         """Define the Twin structure in terms of Twin's metadata.
 
@@ -189,6 +288,76 @@ class SynthesiserConnector:
 
         return twin_structure
 
+    def _setup_shard_twin_structure(self) -> TwinStructure:
+        """Define the structure of a Synthesiser shard's Twin, which shares
+        the partial summaries of the data received via a single Feed.
+
+        Returns:
+            TwinStructure: an object representing the structure of the Twin
+        """
+
+        twin_properties = [
+            create_property(
+                key=constant.PROPERTY_KEY_LABEL,
+                value=f"Twin Synthesiser Shard {self._shard_index}",
+                language="en",
+            ),
+            create_property(
+                key=constant.PROPERTY_KEY_COMMENT,
+                value="Twin Synthesiser shard that shares partial summaries of "
+                "a subset of Twin Sensors' data about Temperature and Humidity",
+                language="en",
+            ),
+            create_property(
+                key=constant.PROPERTY_KEY_CREATED_BY,
+                value=constant.PROPERTY_VALUE_CREATED_BY_NAME,
+            ),
+        ]
+
+        # Set-up Partial Summary Feed's Metadata
+        partial_summary_feed_properties = [
+            create_property(
+                key=constant.PROPERTY_KEY_LABEL, value="Partial Summary", language="en"
+            ),
+            create_property(
+                key=constant.PROPERTY_KEY_COMMENT,
+                value="Mergeable summary of Temperature and Humidity computed every "
+                f"{constant.CALCULATION_PERIOD_SEC} seconds",
+                language="en",
+            ),
+        ]
+        # Set-up Partial Summary Feed's Values
+        partial_summary_feed_values = [
+            create_value(
+                label=constant.TEMPERATURE_FEED_ID,
+                comment="Summary of the Temperature data received",
+                data_type="string",
+            ),
+            create_value(
+                label=constant.HUMIDITY_FEED_ID,
+                comment="Summary of the Humidity data received",
+                data_type="string",
+            ),
+        ]
+
+        feeds_list = [
+            create_feed_with_meta(
+                feed_id=constant.PARTIAL_SUMMARY_FEED_ID,
+                properties=partial_summary_feed_properties,
+                values=partial_summary_feed_values,
+            ),
+        ]
+
+        twin_structure = TwinStructure(
+            properties=twin_properties, feeds_list=feeds_list
+        )
+
+        return twin_structure
+
+    @staticmethod
+    def _get_shard_twin_key_name(shard_index: int) -> str:
+        return f"TwinSynthesiserShard{shard_index}"
+
     def _create_twin(self, twin_structure: TwinStructure):
         """Create the Twin Synthesiser given a Twin Structure.
 
@@ -198,9 +367,13 @@ class SynthesiserConnector:
 
         log.info("Creating Twin Synthesiser...")
 
+        twin_key_name = "TwinSynthesiser"
+        if self._role == constant.SYNTHESISER_ROLE_SHARD:
+            twin_key_name = self._get_shard_twin_key_name(self._shard_index)
+
         twin_synthesiser_identity = (
             self._iotics_identity.create_twin_with_control_delegation(
-                twin_key_name="TwinSynthesiser"
+                twin_key_name=twin_key_name
             )
         )
         self._twin_synthesiser_did = twin_synthesiser_identity.did
@@ -218,20 +391,18 @@ class SynthesiserConnector:
         log.info("Created Twin Synthesiser with DID: %s", self._twin_synthesiser_did)
 
     def _share_average_data(
-        self, temperature_data_list: List[float], humidity_data_list: List[float]
+        self, temperature_summary: FeedSummary, humidity_summary: FeedSummary
     ):
-        """Compute the average value and share data via the related Feed.
+        """Get the average value from the summaries and share data via the related Feed.
 
         Args:
-            temperature_data_list (List[float]): list of temperature values received.
-            humidity_data_list (List[float]): list of humidity values received.
+            temperature_summary (FeedSummary): summary of temperature values received.
+            humidity_summary (FeedSummary): summary of humidity values received.
         """
 
-        # Compute the average value of Temperature and Humidity data
-        average_temperature_data = self._data_processor.compute_average(
-            temperature_data_list
-        )
-        average_humidity_data = self._data_processor.compute_average(humidity_data_list)
+        # Get the average value of Temperature and Humidity data
+        average_temperature_data = round(temperature_summary.stats.mean, 2)
+        average_humidity_data = round(humidity_summary.stats.mean, 2)
 
         # Prepare the dictionary to share via the related Feed
         average_feed_data_to_share = {
@@ -255,22 +426,20 @@ class SynthesiserConnector:
         )
 
     def _share_min_max_data(
-        self, temperature_data_list: List[float], humidity_data_list: List[float]
+        self, temperature_summary: FeedSummary, humidity_summary: FeedSummary
     ):
-        """Compute Min and Max values and share data via the related Feed.
+        """Get Min and Max values from the summaries and share data via the related Feed.
 
         Args:
-            temperature_data_list (List[float]): list of temperature values received.
-            humidity_data_list (List[float]): list of humidity values received.
+            temperature_summary (FeedSummary): summary of temperature values received.
+            humidity_summary (FeedSummary): summary of humidity values received.
         """
 
-        # Compute Min and Max values of Temperature and Humidity data
-        min_temperature, max_temperature = self._data_processor.get_min_max(
-            temperature_data_list
-        )
-        min_humidity, max_humidity = self._data_processor.get_min_max(
-            humidity_data_list
-        )
+        # Get Min and Max values of Temperature and Humidity data
+        min_temperature = temperature_summary.stats.min_value
+        max_temperature = temperature_summary.stats.max_value
+        min_humidity = humidity_summary.stats.min_value
+        max_humidity = humidity_summary.stats.max_value
 
         # Prepare the dictionary to share via the related Feed
         min_max_data_to_share = {
@@ -293,32 +462,107 @@ class SynthesiserConnector:
             "Shared %s via Feed %s", min_max_data_to_share, constant.MIN_MAX_FEED_ID
         )
 
+    def _share_partial_summary_data(
+        self, temperature_summary: FeedSummary, humidity_summary: FeedSummary
+    ):
+        """Share the partial summaries computed by this shard so a merger
+        can combine them with the ones of the other shards.
+
+        Args:
+            temperature_summary (FeedSummary): summary of temperature values received.
+            humidity_summary (FeedSummary): summary of humidity values received.
+        """
+
+        partial_summary_to_share = {
+            constant.TEMPERATURE_FEED_ID: temperature_summary.to_dict(),
+            constant.HUMIDITY_FEED_ID: humidity_summary.to_dict(),
+        }
+
+        retry_on_exception(
+            grpc_operation=self._iotics_api.share_feed_data,
+            function_name="share_feed_data",
+            refresh_token_lock=self._refresh_token_lock,
+            twin_did=self._twin_synthesiser_did,
+            feed_id=constant.PARTIAL_SUMMARY_FEED_ID,
+            data=partial_summary_to_share,
+        )
+
+        log.info(
+            "Shared partial summary of %d temperature and %d humidity values via Feed %s",
+            temperature_summary.count,
+            humidity_summary.count,
+            constant.PARTIAL_SUMMARY_FEED_ID,
+        )
+
+    def _get_summaries(self) -> Tuple[FeedSummary, FeedSummary]:
+        """Get the summaries of the Temperature and Humidity data received
+        over the last period. A merger combines the partial summaries received
+        from the shards, otherwise the data received from the Sensor Twins is used.
+
+        Returns:
+            Tuple[FeedSummary, FeedSummary]: the Temperature and Humidity summaries.
+        """
+
+        if self._role == constant.SYNTHESISER_ROLE_MERGER:
+            merged_summaries = self._data_processor.merge_partial_summaries(
+                self._partial_summary_received_queue
+            )
+            temperature_summary = merged_summaries.get(
+                constant.TEMPERATURE_FEED_ID, FeedSummary()
+            )
+            humidity_summary = merged_summaries.get(
+                constant.HUMIDITY_FEED_ID, FeedSummary()
+            )
+        else:
+            temperature_summary = self._data_processor.get_summary_of_items(
+                self._temperature_data_received_queue
+            )
+            humidity_summary = self._data_processor.get_summary_of_items(
+                self._humidity_data_received_queue
+            )
+
+        return temperature_summary, humidity_summary
+
     def _share_synthesised_data(self):
-        """Periodically empties the temperature and humidity queues, converts them into lists,
-        and performs calculations to compute the average, minimum, and maximum values.
+        """Periodically empties the queues, aggregates them into mergeable summaries
+        and gets the average, minimum, and maximum values from them.
         The results are then shared through the appropriate methods.
+        A shard shares its partial summaries instead.
+        If the data can't be shared, the results of the period are skipped.
         """
 
         while True:
             sleep(constant.CALCULATION_PERIOD_SEC)
             log.debug("Making computation...")
 
-            # Convert Temperature queue into a List
-            temperature_data_list = self._data_processor.get_list_of_items(
-                self._temperature_data_received_queue
-            )
-            # Convert Humidity queue into a List
-            humidity_data_list = self._data_processor.get_list_of_items(
-                self._humidity_data_received_queue
-            )
+            temperature_summary, humidity_summary = self._get_summaries()
 
-            if temperature_data_list and humidity_data_list:
-                self._share_average_data(temperature_data_list, humidity_data_list)
-                self._share_min_max_data(temperature_data_list, humidity_data_list)
-            else:
-                log.info(
-                    "No data was received over the last %s seconds",
-                    constant.CALCULATION_PERIOD_SEC,
+            try:
+                if self._role == constant.SYNTHESISER_ROLE_SHARD:
+                    if temperature_summary.count or humidity_summary.count:
+                        self._share_partial_summary_data(
+                            temperature_summary, humidity_summary
+                        )
+                    else:
+                        log.info(
+                            "No data was received over the last %s seconds",
+                            constant.CALCULATION_PERIOD_SEC,
+                        )
+                elif temperature_summary.count and humidity_summary.count:
+                    self._share_average_data(temperature_summary, humidity_summary)
+                    self._share_min_max_data(temperature_summary, humidity_summary)
+                else:
+                    log.info(
+                        "No data was received over the last %s seconds",
+                        constant.CALCULATION_PERIOD_SEC,
+                    )
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
+            except RetryError as retry_ex:
+                log.warning(
+                    "Skipping the synthesised data of this period: %s", retry_ex
                 )
 
     def _search_sensor_twins(self):
@@ -353,19 +597,25 @@ class SynthesiserConnector:
 
         return twins_found_list
 
-    def _get_feed_data(self, publisher_twin_did: str, publisher_feed_id: str):
+    def _get_feed_data(self, feed_stream: FeedStreamManager):
         """Entry point for each Follower Thread. Within an infinite loop
-        get a new feed listener given the info about the Twin and Feed to follow
+        follow the Feed given the info about the Twin and Feed to follow
         alongside the Twin Synthesiser's DID. Wait for new data samples, then add it
         to the related queue (either Temperature or Humidity according to the Feed ID).
-        In case of an expected exception (i.e.: token expired), generate a new
-        feed listener and wait again for new data samples.
+        The Feed stream is renewed before its token expires without losing data
+        (see 'FeedStreamManager'). In case of an expected exception
+        (i.e.: token expired before the renewal), open a new stream
+        and wait again for new data samples. After too many unexpected exceptions
+        the Thread exits and it is restarted by the Listener Supervisor.
 
         Args:
-            publisher_twin_did (str): Twin Publisher DID
-            publisher_feed_id (str): Twin Publisher's Feed ID
+            feed_stream (FeedStreamManager): the stream of the Feed to follow.
         """
 
+        publisher_twin_did = feed_stream.followed_twin_did
+        publisher_feed_id = feed_stream.followed_feed_id
+        listener_key = f"{publisher_twin_did}_{publisher_feed_id}"
+
         log.info(
             "Getting Feed data from Twin %s, Feed %s...",
             publisher_twin_did,
@@ -378,30 +628,26 @@ class SynthesiserConnector:
         data_received_queue_selection = {
             constant.TEMPERATURE_FEED_ID: self._temperature_data_received_queue,
             constant.HUMIDITY_FEED_ID: self._humidity_data_received_queue,
+            constant.PARTIAL_SUMMARY_FEED_ID: self._partial_summary_received_queue,
         }
         # Select the specific queue according to the Feed ID
         data_received_queue: Queue = data_received_queue_selection.get(
             publisher_feed_id
         )
 
+        LISTENERS_ACTIVE.labels("feed").inc()
         while True:
-            log.debug("Generating a new feed_listener...")
-            feed_listener = retry_on_exception(
-                grpc_operation=self._iotics_api.fetch_interests,
-                function_name="fetch_interests",
-                refresh_token_lock=self._refresh_token_lock,
-                follower_twin_did=self._twin_synthesiser_did,
-                followed_twin_did=publisher_twin_did,
-                followed_feed_id=publisher_feed_id,
-                # 'fetch_last_stored' is set to False
-                # otherwise at any new 'feed_listener' generated
-                # (i.e.: any time the token expires)
-                # we will get the last shared value.
-                fetch_last_stored=False,
-            )
-
+            log.debug("Waiting for new data samples...")
             try:
-                for latest_feed_data in feed_listener:
+                for latest_feed_data in feed_stream:
+                    MESSAGES_RECEIVED.labels("feed", publisher_feed_id).inc()
+                    self._listener_supervisor.record_message(listener_key)
+                    self._data_processor.record_feed_latency(
+                        publisher_twin_did,
+                        publisher_feed_id,
+                        latest_feed_data,
+                        received_at=time(),
+                    )
                     log.debug(
                         "Received a new data sample from Twin %s via Feed %s",
                         publisher_twin_did,
@@ -411,12 +657,16 @@ class SynthesiserConnector:
                     # Add item to the queue
                     data_received_queue.put(latest_feed_data)
             except grpc.RpcError as grpc_ex:
-                # Any time the token expires, an expected gRPC exception is raised
-                # and a new 'feed_listener' object needs to be generated.
+                # If the stream couldn't be renewed before its token expired,
+                # an expected gRPC exception is raised and a new stream is opened.
                 if not expected_grpc_exception(
                     exception=grpc_ex, operation="feed_listener"
                 ):
                     unexpected_exception_counter += 1
+            except CircuitOpenError as circuit_ex:
+                # The Host is down: wait for the circuit to let a new attempt through
+                log.warning("%s. Waiting for the Host to be back...", circuit_ex)
+                sleep(constant.CIRCUIT_BREAKER_RESET_TIMEOUT_SEC)
             except Exception as gen_ex:
                 log.exception("General exception in 'feed_listener': %s", gen_ex)
                 unexpected_exception_counter += 1
@@ -424,12 +674,12 @@ class SynthesiserConnector:
             if unexpected_exception_counter > constant.RETRYING_ATTEMPTS:
                 break
 
+        LISTENERS_ACTIVE.labels("feed").dec()
         log.debug("Exiting thread...")
 
     def _follow_sensor_twins(self, sensor_twins_list):
         """Create and start a new Thread for each Feed of each Twin included
         in the Sensor Twins List to wait and process Feed data.
-        Then add the thread to the Thread list.
 
         Args:
             sensor_twins_list: list of Twins found by the Search operation.
@@ -439,29 +689,90 @@ class SynthesiserConnector:
             sensor_twin_id = sensor_twin.twinId.id
             sensor_twin_feeds = sensor_twin.feeds
 
+            # A shard only follows the Sensor Twins of its own partition
+            if (
+                self._role == constant.SYNTHESISER_ROLE_SHARD
+                and get_shard_index(sensor_twin_id, self._shard_count)
+                != self._shard_index
+            ):
+                log.debug("Twin %s belongs to another shard", sensor_twin_id)
+                continue
+
             for twin_feed in sensor_twin_feeds:
-                feed_id = twin_feed.feedId.id
+                self._start_feed_thread(
+                    sensor_twin_id,
+                    twin_feed.feedId.id,
+                    message_period=get_feed_message_period(twin_feed.properties),
+                )
 
-                thread_name = f"{sensor_twin_id}_{feed_id}"
+    def _follow_synthesiser_shards(self):
+        """Create and start a new Thread for the Partial Summary Feed of
+        each Synthesiser shard. The shards' Twin DIDs are retrieved from their
+        key names, as they are created by the same Agent.
+        """
 
-                feed_thread = Thread(
-                    target=self._get_feed_data,
-                    args=[sensor_twin_id, feed_id],
-                    name=thread_name,
+        for shard_index in range(self._shard_count):
+            shard_twin_identity = (
+                self._iotics_identity.create_twin_with_control_delegation(
+                    twin_key_name=self._get_shard_twin_key_name(shard_index)
                 )
-                log.debug("Starting new Thread %s...", thread_name)
-                feed_thread.start()
-                self._threads_list.append(feed_thread)
+            )
+            self._start_feed_thread(
+                shard_twin_identity.did, constant.PARTIAL_SUMMARY_FEED_ID
+            )
+
+    def _start_feed_thread(
+        self, twin_did: str, feed_id: str, message_period: float = None
+    ):
+        """Start a new Thread waiting for the Feed data of a Twin,
+        supervised by the Listener Supervisor.
+
+        Args:
+            twin_did (str): the Twin DID to follow.
+            feed_id (str): the Feed ID to follow.
+            message_period (float, optional): the seconds between two Feed messages.
+                If not given, the Thread is only restarted when it exits.
+        """
+
+        # Created once so that a restarted Thread keeps the same stream
+        feed_stream = FeedStreamManager(
+            iotics_api=self._iotics_api,
+            refresh_token_lock=self._refresh_token_lock,
+            follower_twin_did=self._twin_synthesiser_did,
+            followed_twin_did=twin_did,
+            followed_feed_id=feed_id,
+        )
+        # Open a new stream with each new token before the current one expires
+        self._feed_stream_renewer.add_feed_stream(feed_stream)
+
+        self._listener_supervisor.add_listener(
+            key=f"{twin_did}_{feed_id}",
+            target=self._get_feed_data,
+            args=[feed_stream],
+            expected_period=message_period,
+            on_stall=feed_stream.reset,
+        )
 
     def start(self):
         """Create the Twin Synthesiser, search for Sensor Twins and follow their Feeds.
-        When a new data sample is received, make some computation and share the data."""
-
-        twin_structure = self._setup_twin_structure()
+        When a new data sample is received, make some computation and share the data.
+        A merger follows the Synthesiser shards' Feeds instead of the Sensor Twins'."""
+
+        self._data_processor.latency_recorder.start()
+        self._feed_stream_renewer.start()
+        self._listener_supervisor.start()
+        if self._role == constant.SYNTHESISER_ROLE_SHARD:
+            twin_structure = self._setup_shard_twin_structure()
+        else:
+            twin_structure = self._setup_twin_structure()
         self._create_twin(twin_structure)
-        sensor_twins_list = self._search_sensor_twins()
-        self._follow_sensor_twins(sensor_twins_list)
-        self._share_synthesised_data()
 
-        for thread in self._threads_list:
-            thread.join()
+        if self._role == constant.SYNTHESISER_ROLE_MERGER:
+            self._follow_synthesiser_shards()
+        else:
+            sensor_twins_list = self._search_sensor_twins()
+            self._follow_sensor_twins(sensor_twins_list)
+        health.set_ready("synthesiser")
+
+        # The Feed listener Threads keep running alongside the (endless) share loop
+        self._share_synthesised_data()